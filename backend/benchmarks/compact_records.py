@@ -0,0 +1,67 @@
+"""
+Benchmark: modelos pydantic vs registros compactos con `__slots__`.
+
+Construye N mensajes con cada representación y reporta tiempo de
+construcción, throughput y memoria retenida (medida con tracemalloc).
+
+Uso (desde backend/):
+    python benchmarks/compact_records.py --messages 1000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Message, MessageRecord  # noqa: E402
+
+
+def build(factory, count: int, rooms, names):
+    """Construir `count` mensajes y retornar (lista, segundos, bytes retenidos)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = [
+        factory(
+            id=f"msg-{i}",
+            user_id=f"user-{i % len(names)}",
+            user_name=names[i % len(names)],
+            content="hola mundo",
+            room_id=rooms[i % len(rooms)],
+            timestamp=datetime.now(),
+            seq=i
+        )
+        for i in range(count)
+    ]
+    elapsed = time.perf_counter() - start
+    retained, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, elapsed, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Strings construidos dinámicamente para que el interning tenga efecto
+    rooms = ["".join(["room-", str(i)]) for i in range(10)]
+    names = ["".join(["user-", str(i)]) for i in range(1000)]
+
+    print(f"{'representation':<16} {'seconds':>9} {'msg/s':>12} {'MB':>9} {'bytes/msg':>10}")
+    for label, factory in (("pydantic", Message), ("slots", MessageRecord)):
+        items, elapsed, retained = build(factory, args.messages, rooms, names)
+        print(
+            f"{label:<16} {elapsed:>9.2f} {args.messages / elapsed:>12,.0f} "
+            f"{retained / (1024 * 1024):>9.1f} {retained / args.messages:>10.0f}"
+        )
+        del items
+
+
+if __name__ == "__main__":
+    main()
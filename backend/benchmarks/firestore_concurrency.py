@@ -0,0 +1,103 @@
+"""
+Benchmark: techo de throughput de Firestore desde el event loop.
+
+Compara el esquema anterior (servicio síncrono en un ThreadPoolExecutor de 4
+threads) con el `AsyncFirebaseService` nativo, usando un Firestore falso en
+memoria que simula la latencia de red de cada escritura.
+
+Uso (desde backend/):
+    python benchmarks/firestore_concurrency.py --writes 2000 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import MessageRecord  # noqa: E402
+from services.firebase_async_wrapper import AsyncFirebaseService  # noqa: E402
+from services.firebase_client import firebase_registry  # noqa: E402
+from services.firebase_service import FirebaseService  # noqa: E402
+
+
+class FakeDocument:
+    def __init__(self, latency: float, is_async: bool):
+        self._latency = latency
+        self._is_async = is_async
+
+    def set(self, data, merge=False):
+        if self._is_async:
+            return asyncio.sleep(self._latency)
+        time.sleep(self._latency)
+
+
+class FakeClient:
+    """Cliente Firestore falso: cada escritura tarda `latency` segundos."""
+
+    def __init__(self, latency: float, is_async: bool):
+        self._latency = latency
+        self._is_async = is_async
+
+    def collection(self, name):
+        return SimpleNamespace(document=lambda doc_id: FakeDocument(self._latency, self._is_async))
+
+
+def install_fake_firestore(latency: float) -> None:
+    firebase_registry._attempted = True
+    firebase_registry._initialized = True
+    firebase_registry.db = FakeClient(latency, is_async=False)
+    firebase_registry._async_db = FakeClient(latency, is_async=True)
+    firebase_registry.firestore = SimpleNamespace(SERVER_TIMESTAMP=object())
+
+
+async def run_executor(messages, workers: int) -> float:
+    service = FirebaseService()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    await asyncio.gather(*(loop.run_in_executor(executor, service.save_message, m) for m in messages))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    return elapsed
+
+
+async def run_async(messages, concurrency: int) -> float:
+    service = AsyncFirebaseService(max_concurrency=concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(service.save_message(m) for m in messages))
+    return time.perf_counter() - start
+
+
+async def main_async(args):
+    install_fake_firestore(args.latency_ms / 1000)
+    messages = [
+        MessageRecord(id=f"msg-{i}", user_id="bench", user_name="bench", content="hola", seq=i)
+        for i in range(args.writes)
+    ]
+
+    print(f"writes={args.writes} latency={args.latency_ms}ms")
+    print(f"{'mode':<28} {'seconds':>9} {'writes/s':>10}")
+    elapsed = await run_executor(messages, 4)
+    print(f"{'executor (4 threads)':<28} {elapsed:>9.2f} {args.writes / elapsed:>10.0f}")
+    for concurrency in args.concurrency:
+        elapsed = await run_async(messages, concurrency)
+        label = f"async (limit {concurrency})"
+        print(f"{label:<28} {elapsed:>9.2f} {args.writes / elapsed:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
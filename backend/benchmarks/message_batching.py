@@ -0,0 +1,173 @@
+"""
+Benchmark: latencia y throughput de los broadcasts de mensajes con y sin
+micro-batching (`MessageBatcher`).
+
+Arma el mismo pipeline que `main.py` (`ChatService` -> `AsyncEventBus` ->
+`SocketIOObserver` -> `SocketGateway`) sobre un `AsyncServer` real de
+python-socketio con N clientes en la sala. Solo se reemplaza el envío
+Engine.IO: cada paquete se codifica y se cuenta en lugar de escribirse en un
+socket, así que el costo medido es el del manager (una tarea por
+destinatario y paquete) más la codificación.
+
+Regímenes:
+
+- `low`: tráfico escaso a ritmo fijo; el batcher debe emitir todo directo.
+- `steady`: ritmo fijo alto (ráfagas continuas).
+- `saturation`: los emisores envían lo más rápido posible; mide el
+  throughput máximo.
+
+La latencia va desde que `create_message` retorna hasta que el paquete se
+entregó a todos los clientes de la sala.
+
+Uso (desde backend/):
+    python benchmarks/message_batching.py --clients 200 --window-ms 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from models import MessageCreateRequest, UserCreateRequest  # noqa: E402
+from observers import AsyncEventBus, SocketIOObserver  # noqa: E402
+from services.chat_service import create_chat_service  # noqa: E402
+from services.message_batcher import MessageBatcher  # noqa: E402
+from services.presence_broadcaster import PresenceBroadcaster  # noqa: E402
+from services.socket_gateway import SocketGateway  # noqa: E402
+
+
+class CountingServer(socketio.AsyncServer):
+    """`AsyncServer` que codifica los paquetes Engine.IO sin enviarlos."""
+
+    packets = 0
+    bytes = 0
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        self.packets += 1
+        self.bytes += len(eio_pkt.encode())
+
+
+class LatencyGateway(SocketGateway):
+    """Registra cuándo termina la emisión de cada mensaje."""
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.sent_at = {}
+        self.latencies = []
+        self.delivered = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, ignore_queue=False, compact=None):
+        await super().emit(event, data, room=room, skip_sid=skip_sid, ignore_queue=ignore_queue, compact=compact)
+        if event not in ("new_message", "new_messages"):
+            return
+        now = time.perf_counter()
+        messages = data["messages"] if event == "new_messages" else [data]
+        for message in messages:
+            self.latencies.append(now - self.sent_at.pop(message["id"]))
+        self.delivered += len(messages)
+        if self.delivered >= self.expected:
+            self.done.set()
+
+
+async def run(regime: str, window: float, args) -> dict:
+    server = CountingServer(async_mode="asgi")
+    gateway = LatencyGateway(server)
+    bus = AsyncEventBus(max_queue_size=1_000_000)
+    chat_service = create_chat_service(event_subject=bus)
+    batcher = MessageBatcher(gateway, window=window, max_batch=args.max_batch)
+    bus.attach(SocketIOObserver(gateway, PresenceBroadcaster(gateway, window=0), batcher), concurrency=1)
+    await bus.start()
+
+    async def on_connect(sid, environ):
+        await server.enter_room(sid, "general")
+
+    gateway.on("connect", on_connect)
+    for i in range(args.clients):
+        sid = await server.manager.connect(f"eio-{i}", "/")
+        # Pasa por el handler del gateway, que registra el formato del cliente
+        await server._trigger_event("connect", "/", sid, {})
+    senders = [chat_service.create_user(UserCreateRequest(name=f"emisor {i}"), f"sender-{i}") for i in range(args.senders)]
+    request = MessageCreateRequest(content="Hola a todos, ¿cómo va el despliegue de esta tarde?", room_id="general")
+    # Descartar los paquetes del roster generados al crear los emisores
+    await asyncio.sleep(0.1)
+    server.packets = server.bytes = 0
+
+    def send(i: int) -> None:
+        message = chat_service.create_message(senders[i % len(senders)].id, request)
+        gateway.sent_at[message.id] = time.perf_counter()
+
+    if regime == "saturation":
+        total = args.saturation_messages
+        gateway.expected = total
+        start = time.perf_counter()
+        for i in range(total):
+            send(i)
+            if i % args.senders == args.senders - 1:
+                # Cada emisor envía un mensaje por vuelta del event loop
+                await asyncio.sleep(0)
+    else:
+        rate = args.low_rate if regime == "low" else args.steady_rate
+        total = int(rate * args.duration)
+        gateway.expected = total
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            send(i)
+
+    await asyncio.wait_for(gateway.done.wait(), args.timeout)
+    elapsed = time.perf_counter() - start
+    await batcher.close()
+    await bus.stop()
+
+    latencies = sorted(gateway.latencies)
+    return {
+        "messages": total,
+        "throughput": total / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+        "packets": server.packets / total,
+        "bytes": server.bytes / total,
+        "per_emission": batcher.stats()["messages_per_emission"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="clientes conectados a la sala")
+    parser.add_argument("--senders", type=int, default=20, help="usuarios que envían mensajes")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=50)
+    parser.add_argument("--low-rate", type=float, default=50.0, help="mensajes/s en el régimen low")
+    parser.add_argument("--steady-rate", type=float, default=1000.0, help="mensajes/s en el régimen steady")
+    parser.add_argument("--duration", type=float, default=3.0, help="segundos de los regímenes low y steady")
+    parser.add_argument("--saturation-messages", type=int, default=5000)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"Clientes en la sala: {args.clients}, emisores: {args.senders}, "
+          f"ventana: {args.window_ms} ms, lote máximo: {args.max_batch}")
+    print(f"{'régimen':<11} {'batching':<9} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'media ms':>9} "
+          f"{'paq/msg':>8} {'bytes/msg':>10} {'msg/emisión':>12}")
+    for regime in ("low", "steady", "saturation"):
+        for label, window in (("no", 0.0), ("sí", args.window_ms / 1000)):
+            result = asyncio.run(run(regime, window, args))
+            print(
+                f"{regime:<11} {label:<9} {result['throughput']:>9,.0f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+                f"{result['mean']:>9.2f} {result['packets']:>8.1f} {result['bytes']:>10,.0f} {result['per_emission']:>12.2f}"
+            )
+    print("msg/s en low/steady = ritmo ofrecido alcanzado; paq/msg y bytes/msg = paquetes y bytes por mensaje sumando todos los clientes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: throughput de mensajes con varios workers conectados al broker IPC.
+
+Lanza N procesos; cada uno arma su `ChatService` en memoria con un
+`AsyncEventBus` y un `ClusterReplicator` (como `main.py` con
+`CLUSTER_ENABLED=true`), crea un usuario y envía M mensajes a la sala
+general. Cada worker cuenta los `message_sent` que ve (propios y replicados)
+hasta llegar a N*M, y al final verifica que su historial tenga los N*M
+mensajes con secuencias únicas y ordenadas.
+
+Uso (desde backend/):
+    python benchmarks/multi_worker_throughput.py --workers 4 --messages 5000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def run_worker(index: int, args, path: str, barrier, results) -> None:
+    from models import MessageCreateRequest, UserCreateRequest
+    from observers import AsyncEventBus, IAsyncObserver
+    from services.chat_service import create_chat_service
+    from services.cluster import ClusterReplicator
+    from services.ipc_broker import IPCBrokerClient
+
+    expected = args.workers * args.messages
+    done = asyncio.Event()
+
+    class Counter(IAsyncObserver):
+        seen = 0
+
+        def update(self, event_type, data):
+            pass
+
+        async def async_update(self, event_type, data):
+            if event_type == "message_sent":
+                self.seen += 1
+                if self.seen >= expected:
+                    done.set()
+
+    bus = AsyncEventBus(max_queue_size=expected * 2)
+    chat_service = create_chat_service(event_subject=bus)
+    counter = Counter()
+    replicator = ClusterReplicator(IPCBrokerClient(path), chat_service, bus)
+    bus.attach(counter)
+    bus.attach(replicator)
+    await bus.start()
+    node_id = await replicator.start()
+
+    user = chat_service.create_user(UserCreateRequest(name=f"worker-{index}"), f"sid-{index}")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, barrier.wait)
+
+    start = time.perf_counter()
+    request = MessageCreateRequest(content=f"hola desde el worker {index}", room_id="general")
+    for i in range(args.messages):
+        chat_service.create_message(user.id, request)
+        if i % 100 == 99:
+            await asyncio.sleep(0)
+    sent = time.perf_counter() - start
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+
+    history = chat_service.get_messages_by_room("general", expected + 1)
+    seqs = [message.seq for message in history]
+    ordered = len(seqs) == len(set(seqs)) and seqs == sorted(seqs)
+    results.put((index, node_id, counter.seen, sent, elapsed, len(history), ordered))
+
+    # Esperar a que todos terminen antes de cerrar (el broker puede vivir en este worker)
+    await loop.run_in_executor(None, barrier.wait)
+    await replicator.close()
+    await bus.stop()
+
+
+def worker_main(index: int, args, path: str, barrier, results) -> None:
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run_worker(index, args, path, barrier, results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=5000, help="mensajes enviados por cada worker")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench-ipc.sock")
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_main, args=(index, args, path, barrier, results))
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    rows = sorted(results.get(timeout=args.timeout + 30) for _ in processes)
+    for process in processes:
+        process.join()
+
+    expected = args.workers * args.messages
+    slowest = max(row[4] for row in rows)
+    print(f"Workers:               {args.workers}")
+    print(f"Mensajes enviados:     {expected} ({args.messages} por worker)")
+    for index, node_id, seen, sent, elapsed, history, ordered in rows:
+        status = "ok" if seen == expected and history == expected and ordered else "INCOMPLETO"
+        print(
+            f"  worker {index} (nodo {node_id}): vio {seen}/{expected} en {elapsed:.2f}s "
+            f"(envío {sent:.2f}s), historial {history}, secuencias {'ordenadas' if ordered else 'DESORDENADAS'} [{status}]"
+        )
+    print(f"Throughput de envío:   {expected / slowest:,.0f} mensajes/s")
+    print(f"Entregas entre workers: {expected * args.workers / slowest:,.0f} eventos/s")
+
+
+if __name__ == "__main__":
+    main()
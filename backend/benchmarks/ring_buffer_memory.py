@@ -0,0 +1,55 @@
+"""
+Benchmark: memoria del repositorio de mensajes con y sin buffer circular.
+
+Inserta N mensajes repartidos en varias salas y reporta el RSS del proceso
+en puntos de control. Con `--capacity` el RSS debe estabilizarse una vez que
+cada sala llena su buffer.
+
+Uso (desde backend/):
+    python benchmarks/ring_buffer_memory.py --messages 10000000 --capacity 1000
+"""
+
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories import InMemoryMessageRepository  # noqa: E402
+
+
+def current_rss_mb() -> float:
+    """RSS actual en MB (usa /proc si está disponible, si no el pico)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--capacity", type=int, default=1000, help="0 = sin límite")
+    parser.add_argument("--checkpoints", type=int, default=10)
+    args = parser.parse_args()
+
+    repo = InMemoryMessageRepository(room_capacity=args.capacity or None)
+    rooms = [f"room-{i}" for i in range(args.rooms)]
+    step = max(args.messages // args.checkpoints, 1)
+
+    print(f"messages={args.messages} rooms={args.rooms} capacity={args.capacity or 'unbounded'}")
+    print(f"{'inserted':>12} {'rss_mb':>10} {'stored':>10} {'elapsed_s':>10}")
+    start = time.perf_counter()
+    for i in range(1, args.messages + 1):
+        repo.create_message("bench-user", "bench", "hola mundo", rooms[i % args.rooms])
+        if i % step == 0:
+            print(f"{i:>12} {current_rss_mb():>10.1f} {len(repo._messages):>10} {time.perf_counter() - start:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
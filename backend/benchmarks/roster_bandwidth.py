@@ -0,0 +1,83 @@
+"""
+Benchmark: bytes de roster enviados cuando N usuarios se unen uno tras otro.
+
+Esquema anterior, por cada ingreso con k usuarios conectados:
+- `users_list` completo al nuevo socket (join_chat),
+- `users_list` completo a toda la sala (join_chat),
+- `users_list` completo a toda la sala otra vez (SocketIOObserver).
+
+Esquema nuevo: `roster_snapshot` al nuevo socket y `roster_delta` (un
+cambio) al resto de la sala. Los eventos `user_joined` son iguales en ambos y
+no se cuentan. Se mide el tamaño JSON de cada payload multiplicado por la
+cantidad de destinatarios.
+
+Uso (desde backend/):
+    python benchmarks/roster_bandwidth.py --users 5000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import UserRecord  # noqa: E402
+from services.roster import Roster  # noqa: E402
+
+
+def json_size(payload) -> int:
+    return len(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def list_size(wrapper: dict, entries_bytes: int, count: int) -> int:
+    """Tamaño de `wrapper` con una lista `users` de `count` entradas que suman `entries_bytes`."""
+    commas = max(count - 1, 0)
+    return json_size(wrapper) + entries_bytes + commas
+
+
+def human(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    roster = Roster()
+    entries_bytes = 0
+    old_bytes = 0
+    new_bytes = 0
+
+    start = time.perf_counter()
+    for i in range(args.users):
+        user = UserRecord(id=f"user-{i:06d}", name=f"Usuario {i}", socket_id=f"sid-{i}")
+        entries_bytes += json_size(Roster.entry(user))
+        k = i + 1
+
+        # Anterior: lista completa al nuevo socket + dos veces a toda la sala
+        old_list = list_size({"users": []}, entries_bytes, k)
+        old_bytes += old_list * (1 + 2 * k)
+
+        # Nuevo: delta para los demás, snapshot para el que entra
+        roster.upsert(user)
+        delta = roster.commit()
+        new_bytes += json_size(delta) * (k - 1)
+        new_bytes += list_size({"version": roster.version, "users": [], "count": k}, entries_bytes, k)
+    elapsed = time.perf_counter() - start
+
+    print(f"Usuarios que se unen:  {args.users}")
+    print(f"users_list completos:  {human(old_bytes)}")
+    print(f"snapshot + deltas:     {human(new_bytes)}")
+    print(f"Reducción:             {old_bytes / max(new_bytes, 1):.0f}x")
+    print(f"Versión final:         {roster.version} ({elapsed:.2f}s de simulación)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: latencia de arranque en frío del backend.
+
+Mide en procesos nuevos el tiempo de `import main` (lo que paga uvicorn antes
+de aceptar conexiones) y, por separado, el de inicializar Firebase, que ahora
+ocurre una sola vez en el `lifespan`. Para comparar con la versión anterior,
+ejecutar el script sobre ambos commits.
+
+Uso (desde backend/):
+    python benchmarks/startup_time.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+INIT_SNIPPET = """
+import time
+import main
+start = time.perf_counter()
+main.firebase_registry.initialize()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(snippet: str, runs: int):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", snippet],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip().splitlines()
+        samples.append(float(output[-1]) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'phase':<22} {'median_ms':>10} {'min_ms':>10} {'max_ms':>10}")
+    for label, snippet in (("import main", IMPORT_SNIPPET), ("firebase initialize", INIT_SNIPPET)):
+        samples = measure(snippet, args.runs)
+        print(f"{label:<22} {statistics.median(samples):>10.1f} {min(samples):>10.1f} {max(samples):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
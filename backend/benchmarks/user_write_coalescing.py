@@ -0,0 +1,86 @@
+"""
+Benchmark: escrituras a Firestore de usuarios con y sin coalescing.
+
+Simula clientes móviles inestables que se conectan y desconectan varias
+veces en poco tiempo. Compara cuántas escrituras de documentos haría el
+esquema anterior (una por operación) contra el `CoalescingWriteBuffer`,
+usando un Firestore falso que solo cuenta. Dos patrones:
+
+- `app`: lo que produce `join_chat` hoy; cada reconexión crea un usuario con
+  un id nuevo y la desconexión lo marca offline. Solo se fusionan el alta y
+  la baja de un mismo id que caen en la misma ventana.
+- `same-id` (mejor caso): el mismo usuario alterna su estado; todas las
+  operaciones de una ventana se fusionan en una escritura.
+
+Uso (desde backend/):
+    python benchmarks/user_write_coalescing.py --users 2000 --flaps 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories.write_behind import CoalescingWriteBuffer  # noqa: E402
+
+
+class CountingFirestore:
+    """Firestore falso que cuenta documentos escritos y commits."""
+
+    def __init__(self):
+        self.documents = 0
+        self.commits = 0
+
+    def write_users_batch(self, operations):
+        self.documents += len(operations)
+        self.commits += 1
+        return True
+
+
+def run(pattern: str, args):
+    """Retorna (operaciones, documentos escritos, commits) para un patrón."""
+    firestore = CountingFirestore()
+    buffer = CoalescingWriteBuffer(firestore.write_users_batch, window=args.window_ms / 1000)
+    pause = (args.duration_ms / 1000) / max(args.flaps, 1)
+    operations = 0
+
+    ids = [f"user-{i}" for i in range(args.users)]
+    for user_id in ids:
+        buffer.put(user_id, {"name": user_id, "is_online": True, "is_active": True}, create=True)
+        operations += 1
+    for flap in range(args.flaps):
+        online = flap % 2 == 1
+        for i in range(args.users):
+            if pattern == "app" and online:
+                # Reconexión: join_chat crea un usuario nuevo
+                ids[i] = f"user-{i}-{flap}"
+                buffer.put(ids[i], {"name": f"user-{i}", "is_online": True, "is_active": True}, create=True)
+            else:
+                buffer.put(ids[i], {"is_online": online})
+            operations += 1
+        time.sleep(pause)
+    buffer.close()
+    return operations, firestore.documents, firestore.commits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--flaps", type=int, default=10, help="Cambios de estado por usuario")
+    parser.add_argument("--window-ms", type=int, default=500)
+    parser.add_argument("--duration-ms", type=int, default=2000, help="Duración de la tormenta de reconexiones")
+    args = parser.parse_args()
+
+    print(f"users={args.users} flaps={args.flaps} window={args.window_ms}ms duration={args.duration_ms}ms")
+    print(f"{'pattern':<22} {'ops':>8} {'doc_writes':>12} {'round_trips':>12} {'reduction':>10}")
+    for pattern in ("app", "same-id"):
+        total_ops, documents, commits = run(pattern, args)
+        label = pattern + (" (mejor caso)" if pattern == "same-id" else "")
+        print(f"{label:<22} {total_ops:>8} {documents:>12} {commits:>12} {total_ops / max(documents, 1):>9.1f}x")
+    print("ops = escrituras del esquema anterior (una por operación y una ida y vuelta cada una)")
+
+
+if __name__ == "__main__":
+    main()
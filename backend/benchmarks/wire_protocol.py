@@ -0,0 +1,109 @@
+"""
+Benchmark: bytes en el cable y CPU del servidor por broadcast, JSON vs msgpack.
+
+Para cada evento se arma el payload tal como lo emite el servidor (JSON con
+timestamps ISO-8601; msgpack con la forma compacta de `services.wire`) y se
+codifica el paquete Socket.IO con el serializer correspondiente de
+python-socketio. El `AsyncManager` codifica una vez por emisión, así que la
+CPU medida es por broadcast; los bytes se multiplican por cada destinatario.
+Los mensajes se crean nuevos en cada iteración (sin payload cacheado).
+
+Uso (desde backend/):
+    python benchmarks/wire_protocol.py --users 500 --iterations 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio.msgpack_packet import MsgPackPacket  # noqa: E402
+from socketio.packet import EVENT, Packet  # noqa: E402
+
+from models import MessageRecord, UserRecord  # noqa: E402
+from services.roster import Roster  # noqa: E402
+from services.wire import compact_roster_delta, compact_roster_snapshot  # noqa: E402
+
+
+def new_message(i: int) -> MessageRecord:
+    return MessageRecord(
+        id=f"6f1c2a3e-9b7d-4c21-8e0f-{i:012d}",
+        user_id="0b6f0c8e-2f4b-4d7a-9a51-3c2d1e0f9a87",
+        user_name="Usuario de prueba",
+        content="Hola a todos, ¿alguien revisó el despliegue de esta tarde? Parece que quedó bien.",
+        timestamp=datetime.now(),
+        seq=i + 1
+    )
+
+
+def encode_json(event: str, payload) -> bytes:
+    # "4" = paquete message de Engine.IO en un frame de texto
+    return ("4" + Packet(EVENT, data=[event, payload]).encode()).encode("utf-8")
+
+
+def encode_msgpack(event: str, payload) -> bytes:
+    # En Engine.IO v4 los frames binarios van sin prefijo
+    return MsgPackPacket(EVENT, data=[event, payload]).encode()
+
+
+def measure(build, encode, event: str, iterations: int):
+    size = len(encode(event, build(0)))
+    start = time.perf_counter()
+    for i in range(iterations):
+        encode(event, build(i))
+    elapsed = time.perf_counter() - start
+    return size, elapsed / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500, help="usuarios en la sala (destinatarios y tamaño del roster)")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    roster = Roster()
+    for i in range(args.users):
+        roster.upsert(UserRecord(id=f"user-{i:06d}", name=f"Usuario {i}", socket_id=f"sid-{i}"))
+    roster.commit()
+    roster.upsert(UserRecord(id="user-new", name="Usuario nuevo", socket_id="sid-new"))
+    delta = roster.commit()
+    snapshot = roster.snapshot()
+    recent = [new_message(i) for i in range(20)]
+
+    # (evento, destinatarios, payload JSON, payload msgpack)
+    scenarios = [
+        ("new_message", args.users,
+         lambda i: new_message(i).payload,
+         lambda i: new_message(i).payload_compact),
+        ("roster_delta", args.users,
+         lambda i: delta,
+         lambda i: compact_roster_delta(delta)),
+        ("roster_snapshot", 1,
+         lambda i: snapshot,
+         lambda i: compact_roster_snapshot(snapshot)),
+        ("recent_messages", 1,
+         lambda i: {"messages": [message.to_dict() for message in recent]},
+         lambda i: {"messages": [message.to_compact() for message in recent]}),
+    ]
+    iterations = {"roster_snapshot": max(args.iterations // 20, 10)}
+
+    print(f"Usuarios en la sala: {args.users}")
+    print(f"{'evento':<16} {'bytes json':>10} {'bytes msgpack':>13} {'ahorro':>7} "
+          f"{'µs json':>8} {'µs msgpack':>10} {'total json':>11} {'total msgpack':>13}")
+    for event, recipients, build_json, build_msgpack in scenarios:
+        n = iterations.get(event, args.iterations)
+        json_size, json_us = measure(build_json, encode_json, event, n)
+        msgpack_size, msgpack_us = measure(build_msgpack, encode_msgpack, event, n)
+        print(
+            f"{event:<16} {json_size:>10} {msgpack_size:>13} {1 - msgpack_size / json_size:>7.0%} "
+            f"{json_us:>8.1f} {msgpack_us:>10.1f} "
+            f"{json_size * recipients:>11} {msgpack_size * recipients:>13}"
+        )
+    print("µs = CPU por broadcast (payload + codificación); total = bytes por broadcast a todos los destinatarios")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
+import tempfile
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 
 # Cargar variables de entorno
 load_dotenv()
@@ -44,6 +45,98 @@ class Settings:
         # Configuración de Socket.IO
         self.SOCKETIO_CORS_ORIGINS = self.CORS_ORIGINS
         
+        # Protocolo binario opcional (msgpack) en un path de Socket.IO aparte
+        self.WIRE_MSGPACK_ENABLED = os.getenv("WIRE_MSGPACK_ENABLED", "false").lower() == "true"
+        self.WIRE_MSGPACK_PATH = os.getenv("WIRE_MSGPACK_PATH", "socket.io-msgpack")
+        
+        # Configuración del historial en memoria (0 = sin límite)
+        history_capacity = int(os.getenv("MESSAGE_HISTORY_CAPACITY", "0"))
+        self.MESSAGE_HISTORY_CAPACITY: Optional[int] = history_capacity if history_capacity > 0 else None
+        
+        # Mensajes enviados al unirse y tope de mensajes reenviados en un `resume`
+        # (si el cliente perdió más, se le pide resincronizar)
+        self.RECENT_MESSAGES_LIMIT = int(os.getenv("RECENT_MESSAGES_LIMIT", "20"))
+        self.RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", "500"))
+        # Tope de mensajes por evento `send_messages` (con límite de envío, como mucho SEND_MESSAGE_BURST)
+        self.MESSAGE_BATCH_MAX_SIZE = int(os.getenv("MESSAGE_BATCH_MAX_SIZE", "100"))
+        
+        # Limpieza de usuarios desconectados
+        self.USER_REAP_TTL_SECONDS = float(os.getenv("USER_REAP_TTL_SECONDS", "300"))
+        self.USER_REAP_INTERVAL_SECONDS = float(os.getenv("USER_REAP_INTERVAL_SECONDS", "60"))
+        
+        # Persistencia write-behind a Firestore
+        self.PERSIST_QUEUE_MAX_SIZE = int(os.getenv("PERSIST_QUEUE_MAX_SIZE", "10000"))
+        self.PERSIST_WORKERS = int(os.getenv("PERSIST_WORKERS", "2"))
+        self.PERSIST_BATCH_SIZE = min(int(os.getenv("PERSIST_BATCH_SIZE", "500")), 500)
+        self.PERSIST_FLUSH_INTERVAL_SECONDS = int(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "200")) / 1000
+        # Política cuando la cola está llena: drop | drop_oldest (lo descartado se
+        # guarda en el spill). `block` no se admite: se encola desde el event loop
+        self.PERSIST_OVERFLOW_POLICY = os.getenv("PERSIST_OVERFLOW_POLICY", "drop")
+        if self.PERSIST_OVERFLOW_POLICY not in ("drop", "drop_oldest"):
+            raise ValueError(
+                f"PERSIST_OVERFLOW_POLICY must be 'drop' or 'drop_oldest', got {self.PERSIST_OVERFLOW_POLICY!r}"
+            )
+        # Reintentos y spill a disco de escrituras fallidas
+        self.PERSIST_RETRY_MAX_ATTEMPTS = int(os.getenv("PERSIST_RETRY_MAX_ATTEMPTS", "5"))
+        self.PERSIST_RETRY_BASE_SECONDS = int(os.getenv("PERSIST_RETRY_BASE_MS", "200")) / 1000
+        self.PERSIST_RETRY_MAX_SECONDS = int(os.getenv("PERSIST_RETRY_MAX_MS", "10000")) / 1000
+        self.PERSIST_SPILL_DIR = os.getenv("PERSIST_SPILL_DIR", "./spill")
+        self.PERSIST_REPLAY_INTERVAL_SECONDS = float(os.getenv("PERSIST_REPLAY_INTERVAL_SECONDS", "30"))
+        # Ventana para fusionar escrituras sobre el mismo usuario
+        self.USER_WRITE_COALESCE_SECONDS = int(os.getenv("USER_WRITE_COALESCE_MS", "500")) / 1000
+        
+        # Concurrencia del cliente asíncrono de Firestore y threads para FCM
+        self.FIRESTORE_MAX_CONCURRENCY = int(os.getenv("FIRESTORE_MAX_CONCURRENCY", "64"))
+        self.FCM_EXECUTOR_WORKERS = int(os.getenv("FCM_EXECUTOR_WORKERS", "4"))
+        
+        # Bus de eventos: cola acotada por observador
+        self.EVENT_BUS_QUEUE_MAX_SIZE = int(os.getenv("EVENT_BUS_QUEUE_MAX_SIZE", "10000"))
+        # Política cuando la cola de un observador está llena: buffer | drop | drop_oldest.
+        # `buffer` no frena al productor: espera en un buffer de otro EVENT_BUS_QUEUE_MAX_SIZE
+        # y, si también se llena, descarta los eventos más antiguos
+        self.EVENT_BUS_OVERFLOW_POLICY = os.getenv("EVENT_BUS_OVERFLOW_POLICY", "buffer")
+        self.EVENT_BUS_NOTIFICATION_OVERFLOW_POLICY = os.getenv("EVENT_BUS_NOTIFICATION_OVERFLOW_POLICY", "drop")
+        self.EVENT_BUS_NOTIFICATION_CONCURRENCY = int(os.getenv("EVENT_BUS_NOTIFICATION_CONCURRENCY", "2"))
+        # Threads para observadores síncronos
+        self.EVENT_BUS_SYNC_WORKERS = int(os.getenv("EVENT_BUS_SYNC_WORKERS", "4"))
+        
+        # Ventana para agrupar entradas/salidas en un solo roster_delta (0 = sin agrupar)
+        self.PRESENCE_BROADCAST_WINDOW_SECONDS = int(os.getenv("PRESENCE_BROADCAST_WINDOW_MS", "100")) / 1000
+        # Micro-batching de mensajes: en salas con ráfagas, los mensajes de esta
+        # ventana salen en un solo `new_messages` (0 = un `new_message` por mensaje)
+        self.MESSAGE_BROADCAST_WINDOW_SECONDS = int(os.getenv("MESSAGE_BROADCAST_WINDOW_MS", "5")) / 1000
+        self.MESSAGE_BROADCAST_MAX_BATCH = int(os.getenv("MESSAGE_BROADCAST_MAX_BATCH", "50"))
+        
+        # Control de admisión: lag del event loop (media móvil) a partir del cual
+        # el trabajo de baja prioridad se difiere (degraded) o se rechaza (overloaded)
+        self.EVENT_LOOP_LAG_INTERVAL_SECONDS = int(os.getenv("EVENT_LOOP_LAG_INTERVAL_MS", "100")) / 1000
+        self.LOAD_DEGRADED_LAG_SECONDS = int(os.getenv("LOAD_DEGRADED_LAG_MS", "50")) / 1000
+        self.LOAD_OVERLOADED_LAG_SECONDS = int(os.getenv("LOAD_OVERLOADED_LAG_MS", "250")) / 1000
+        self.LOAD_MAX_DEFER_SECONDS = int(os.getenv("LOAD_MAX_DEFER_MS", "1000")) / 1000
+        # Token bucket por socket para send_message/send_messages (0 = sin límite)
+        self.SEND_MESSAGE_RATE_PER_SECOND = float(os.getenv("SEND_MESSAGE_RATE_PER_SECOND", "10"))
+        self.SEND_MESSAGE_BURST = int(os.getenv("SEND_MESSAGE_BURST", "20"))
+        
+        # Notificaciones push: si un destinatario se desconecta antes de que
+        # salga su push (p. ej. durante la ventana del resumen), durante esta
+        # ventana se asume una reconexión breve y no se le notifica. Los
+        # usuarios ya desconectados no están en las salas y nunca reciben push.
+        self.PUSH_PRESENCE_GRACE_SECONDS = float(os.getenv("PUSH_PRESENCE_GRACE_SECONDS", "30"))
+        # Ventana para agrupar los eventos de cada destinatario en un resumen (0 = sin agrupar)
+        self.PUSH_DIGEST_WINDOW_SECONDS = float(os.getenv("PUSH_DIGEST_WINDOW_SECONDS", "10"))
+        
+        # Modo cluster: varios workers comparten emisiones y estado por un broker IPC local
+        self.CLUSTER_ENABLED = os.getenv("CLUSTER_ENABLED", "false").lower() == "true"
+        # El directorio del socket debe ser privado (el broker lo crea con 0700)
+        runtime_dir = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        self.CLUSTER_IPC_PATH = os.getenv(
+            "CLUSTER_IPC_PATH", os.path.join(runtime_dir, f"chat-con-{os.getuid()}", "ipc.sock")
+        )
+        # Cantidad máxima de workers; cada uno numera los mensajes en su partición
+        self.CLUSTER_SEQ_STRIDE = int(os.getenv("CLUSTER_SEQ_STRIDE", "1024"))
+        # Espera al arrancar por el snapshot de los workers ya en marcha
+        self.CLUSTER_SNAPSHOT_TIMEOUT_SECONDS = int(os.getenv("CLUSTER_SNAPSHOT_TIMEOUT_MS", "1000")) / 1000
+        
         self._initialized = True
 
 
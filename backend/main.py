@@ -1,14 +1,27 @@
+import asyncio
 import socketio
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
 from config import settings
 from routers import users_router, messages_router
-from services import create_chat_service
+from services import FirebaseService, create_chat_service
 from services.firebase_async_wrapper import AsyncFirebaseService
-from observers import ChatEventSubject, NotificationObserver, SocketIOObserver
+from services.firebase_client import firebase_registry
+from services.notification_dispatcher import NotificationDispatcher
+from services.presence_service import PresenceService
+from services.notification_digest import NotificationDigest
+from services.admission import AdmissionController, EventLoopLagMonitor, RateLimiter
+from services.message_batcher import MessageBatcher
+from services.presence_broadcaster import PresenceBroadcaster
+from services.ipc_broker import IPCBrokerClient
+from services.cluster import ClusterReplicator, IPCClientManager
+from services.socket_gateway import SocketGateway
+from services.wire import WIRE_JSON, WIRE_MSGPACK, MSGPACK_WIRE_VERSIONS, compact_messages, compact_user
+from observers import AsyncEventBus, NotificationObserver, SocketIOObserver
 from models import UserCreateRequest, MessageCreateRequest
 
 # Configurar logging
@@ -16,31 +29,129 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Instancias globales
-sio = socketio.AsyncServer(
-    async_mode="asgi",
-    cors_allowed_origins=settings.SOCKETIO_CORS_ORIGINS,
-    logger=True,
-    engineio_logger=True
-)
+# En modo cluster las emisiones se reparten entre workers por el broker IPC
+ipc_client = None
+if settings.CLUSTER_ENABLED:
+    ipc_client = IPCBrokerClient(settings.CLUSTER_IPC_PATH, max_nodes=settings.CLUSTER_SEQ_STRIDE)
 
-# Patrón Observer - Subject para eventos del chat
-event_subject = ChatEventSubject()
 
-# Initialize Firebase service (async wrapper) - solo para observadores
-firebase_service = AsyncFirebaseService()
+def create_socket_server(**kwargs) -> socketio.AsyncServer:
+    return socketio.AsyncServer(
+        async_mode="asgi",
+        cors_allowed_origins=settings.SOCKETIO_CORS_ORIGINS,
+        logger=True,
+        engineio_logger=True,
+        **kwargs
+    )
 
-# Create service layer - los repositorios manejan Firebase internamente
-chat_service = create_chat_service(event_subject=event_subject, firebase_service=True)
+
+sio = create_socket_server(client_manager=IPCClientManager(ipc_client) if ipc_client else None)
+# Protocolo binario opcional: servidor aparte con el serializer msgpack
+sio_msgpack = None
+if settings.WIRE_MSGPACK_ENABLED:
+    sio_msgpack = create_socket_server(
+        serializer="msgpack",
+        client_manager=IPCClientManager(ipc_client, channel="socketio-msgpack") if ipc_client else None
+    )
+# Los handlers y las emisiones pasan por el gateway, que atiende ambos formatos
+gateway = SocketGateway(sio, sio_msgpack)
+
+# Patrón Observer - bus de eventos: los observadores procesan los eventos fuera del handler que los produce
+event_subject = AsyncEventBus(
+    max_queue_size=settings.EVENT_BUS_QUEUE_MAX_SIZE,
+    overflow_policy=settings.EVENT_BUS_OVERFLOW_POLICY,
+    sync_workers=settings.EVENT_BUS_SYNC_WORKERS
+)
+
+# Servicio Firebase compartido: el cliente se inicializa en el lifespan, no al importar
+sync_firebase_service = FirebaseService()
+firebase_service = AsyncFirebaseService(sync_firebase_service)
+
+# Create service layer - los repositorios comparten el mismo servicio Firebase
+chat_service = create_chat_service(event_subject=event_subject, firebase_service=sync_firebase_service)
 
 # Observadores
-from services.firebase_service import FirebaseService as SyncFirebaseService
-sync_firebase_service = SyncFirebaseService()  # Para notificaciones
-notification_observer = NotificationObserver(sync_firebase_service)
-socketio_observer = SocketIOObserver(sio)
+notification_dispatcher = NotificationDispatcher(
+    sync_firebase_service,
+    token_resolver=chat_service.get_device_tokens,
+    token_pruner=chat_service.prune_device_tokens
+)
+# Presencia: los usuarios con socket vivo no reciben push. En modo cluster el
+# socket puede estar en otro worker: vale el estado replicado del usuario
+presence_service = PresenceService(
+    chat_service.user_repository,
+    grace_seconds=settings.PUSH_PRESENCE_GRACE_SECONDS,
+    is_socket_connected=None if settings.CLUSTER_ENABLED else gateway.is_connected
+)
+# Resumen por destinatario: varios eventos dentro de la ventana se envían como un solo push
+notification_digest = None
+if settings.PUSH_DIGEST_WINDOW_SECONDS > 0:
+    notification_digest = NotificationDigest(
+        notification_dispatcher,
+        window=settings.PUSH_DIGEST_WINDOW_SECONDS,
+        recipient_filter=presence_service.needs_push
+    )
+
+# Admisión bajo carga: con el event loop saturado se difiere o descarta el trabajo de baja prioridad
+lag_monitor = EventLoopLagMonitor(interval=settings.EVENT_LOOP_LAG_INTERVAL_SECONDS)
+admission = AdmissionController(
+    lag_monitor,
+    degraded_lag=settings.LOAD_DEGRADED_LAG_SECONDS,
+    overloaded_lag=settings.LOAD_OVERLOADED_LAG_SECONDS,
+    max_defer=settings.LOAD_MAX_DEFER_SECONDS
+)
+send_rate_limiter = RateLimiter(settings.SEND_MESSAGE_RATE_PER_SECOND, settings.SEND_MESSAGE_BURST)
+# Un lote cuesta un token por mensaje: no puede superar lo que acumula el bucket
+send_messages_max_batch = settings.MESSAGE_BATCH_MAX_SIZE
+if send_rate_limiter.rate > 0:
+    send_messages_max_batch = min(send_messages_max_batch, send_rate_limiter.burst)
+
+notification_observer = NotificationObserver(
+    notification_digest or notification_dispatcher,
+    presence=presence_service,
+    admission=admission
+)
+presence_broadcaster = PresenceBroadcaster(
+    gateway, window=settings.PRESENCE_BROADCAST_WINDOW_SECONDS, admission=admission
+)
+message_batcher = MessageBatcher(
+    gateway,
+    window=settings.MESSAGE_BROADCAST_WINDOW_SECONDS,
+    max_batch=settings.MESSAGE_BROADCAST_MAX_BATCH
+)
+socketio_observer = SocketIOObserver(gateway, presence_broadcaster, message_batcher)
 
 # Registrar observadores
-event_subject.attach(notification_observer)
-event_subject.attach(socketio_observer)
+event_subject.attach(
+    notification_observer,
+    concurrency=settings.EVENT_BUS_NOTIFICATION_CONCURRENCY,
+    overflow_policy=settings.EVENT_BUS_NOTIFICATION_OVERFLOW_POLICY
+)
+# Un solo consumidor para conservar el orden de los broadcasts
+event_subject.attach(socketio_observer, concurrency=1)
+
+cluster_replicator = None
+if settings.CLUSTER_ENABLED:
+    cluster_replicator = ClusterReplicator(
+        ipc_client,
+        chat_service,
+        event_subject,
+        seq_stride=settings.CLUSTER_SEQ_STRIDE,
+        snapshot_timeout=settings.CLUSTER_SNAPSHOT_TIMEOUT_SECONDS,
+        # Lo que un `resume` puede llegar a pedir
+        snapshot_messages=settings.RESUME_MAX_MESSAGES
+    )
+    event_subject.attach(cluster_replicator, concurrency=1)
+
+
+async def reap_inactive_users_loop():
+    """Tarea periódica que libera de memoria a los usuarios desconectados."""
+    while True:
+        await asyncio.sleep(settings.USER_REAP_INTERVAL_SECONDS)
+        try:
+            chat_service.reap_inactive_users(settings.USER_REAP_TTL_SECONDS)
+        except Exception as e:
+            logger.error(f"Error reaping inactive users: {e}")
 
 
 @asynccontextmanager
@@ -49,10 +160,26 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Chat Application...")
     
     # Startup
+    firebase_registry.initialize()
+    await event_subject.start()
+    lag_monitor.start()
+    if cluster_replicator:
+        node_id = await cluster_replicator.start()
+        logger.info(f"Cluster mode enabled, node {node_id}")
+    reaper_task = asyncio.create_task(reap_inactive_users_loop())
     yield
     
     # Shutdown
     logger.info("Shutting down Chat Application...")
+    reaper_task.cancel()
+    await lag_monitor.stop()
+    await event_subject.stop()
+    await message_batcher.close()
+    if cluster_replicator:
+        await cluster_replicator.close()
+    if notification_digest:
+        notification_digest.close()
+    chat_service.close()
 
 
 # Crear aplicación FastAPI
@@ -63,6 +190,21 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Lecturas REST de baja prioridad (registrado antes que CORS para que el 503 lleve sus headers)
+@app.middleware("http")
+async def admission_middleware(request: Request, call_next):
+    """Diferir o rechazar (503) los GET de /api mientras el event loop está saturado."""
+    if request.method == "GET" and request.url.path.startswith("/api/"):
+        if not await admission.admit("rest_read"):
+            error = admission.overloaded_error("rest_read")
+            return JSONResponse(
+                status_code=503,
+                content={"detail": error["message"], **error},
+                headers={"Retry-After": str(max(round(admission.max_defer), 1))}
+            )
+    return await call_next(request)
+
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -78,48 +220,45 @@ app.include_router(messages_router)
 
 # Crear aplicación ASGI con Socket.IO
 socket_app = socketio.ASGIApp(sio, app)
+if sio_msgpack:
+    socket_app = socketio.ASGIApp(sio_msgpack, socket_app, socketio_path=settings.WIRE_MSGPACK_PATH)
 
 
 # Eventos de Socket.IO
-@sio.event
+@gateway.event
 async def connect(sid, environ):
     """Evento de conexión de Socket.IO."""
     logger.info(f"Client connected: {sid}")
-    await sio.emit("connected", {"message": "Connected successfully"}, room=sid)
+    wire = gateway.wire_of(sid)
+    await gateway.emit("connected", {
+        "message": "Connected successfully",
+        "wire": wire,
+        "wire_version": MSGPACK_WIRE_VERSIONS[-1] if wire == WIRE_MSGPACK else None,
+        # Formatos disponibles, para que un cliente JSON sepa si puede pasar a msgpack
+        "wire_versions": {WIRE_JSON: [1], **({WIRE_MSGPACK: list(MSGPACK_WIRE_VERSIONS)} if sio_msgpack else {})}
+    }, room=sid)
 
 
-@sio.event
+@gateway.event
 async def disconnect(sid):
     """Evento de desconexión de Socket.IO."""
     logger.info(f"Client disconnected: {sid}")
+    send_rate_limiter.forget(sid)
     
     # Desconectar usuario del chat
     user = chat_service.disconnect_user(sid)
     if user:
         logger.info(f"User {user.name} disconnected")
-        
-        # Actualizar lista de usuarios para todos los demás
-        users = chat_service.get_all_users()
-        await sio.emit("users_list", {
-            "users": [
-                {
-                    "id": u.id,
-                    "name": u.name,
-                    "is_active": u.is_active,
-                    "joined_at": u.joined_at.isoformat()
-                }
-                for u in users
-            ]
-        }, room="general")
-
-
-@sio.event
+        # El SocketIOObserver publica el delta del roster al resto de la sala
+
+
+@gateway.event
 async def join_chat(sid, data):
     """Evento para unirse al chat."""
     try:
         name = data.get("name", "").strip()
         if not name:
-            await sio.emit("error", {"message": "Name is required"}, room=sid)
+            await gateway.emit("error", {"message": "Name is required"}, room=sid)
             return
         
         # Crear usuario
@@ -127,69 +266,55 @@ async def join_chat(sid, data):
         user = chat_service.create_user(user_request, sid)
         
         # Unir a la sala general
-        await sio.enter_room(sid, "general")
+        await gateway.enter_room(sid, "general")
         
         # Enviar confirmación al usuario
-        await sio.emit("joined_chat", {
-            "user": {
-                "id": user.id,
-                "name": user.name,
-                "joined_at": user.joined_at.isoformat()
-            },
-            "message": f"Welcome to the chat, {user.name}!"
-        }, room=sid)
+        user_data = {
+            "id": user.id,
+            "name": user.name,
+            "joined_at": user.joined_at.isoformat()
+        }
+        welcome = f"Welcome to the chat, {user.name}!"
+        await gateway.emit(
+            "joined_chat",
+            {"user": user_data, "message": welcome},
+            room=sid,
+            compact=lambda: {"user": compact_user(user_data), "message": welcome}
+        )
         
-        # Enviar lista de usuarios actuales solo al nuevo usuario
-        users = chat_service.get_all_users()
-        await sio.emit("users_list", {
-            "users": [
-                {
-                    "id": u.id,
-                    "name": u.name,
-                    "is_active": u.is_active,
-                    "joined_at": u.joined_at.isoformat()
-                }
-                for u in users
-            ]
-        }, room=sid)
+        # El roster (snapshot para este cliente, delta para la sala) lo envía el SocketIOObserver
         
-        # Después de crear el usuario, notificar a TODOS en la sala sobre la lista actualizada
-        await sio.emit("users_list", {
-            "users": [
-                {
-                    "id": u.id,
-                    "name": u.name,
-                    "is_active": u.is_active,
-                    "joined_at": u.joined_at.isoformat()
-                }
-                for u in users
-            ]
-        }, room="general")  # Enviar a toda la sala general
-        
-        # Enviar mensajes recientes
-        messages = chat_service.get_messages_by_room("general", 20)
-        await sio.emit("recent_messages", {
-            "messages": [
-                {
-                    "id": msg.id,
-                    "user_id": msg.user_id,
-                    "user_name": msg.user_name,
-                    "content": msg.content,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "room_id": msg.room_id
-                }
-                for msg in messages
-            ]
-        }, room=sid)
+        last_seq = data.get("last_seq")
+        if isinstance(last_seq, dict):
+            # Reconexión: solo los mensajes que se perdió
+            await gateway.emit("resumed", build_resume_payload(last_seq, gateway.wire_of(sid)), room=sid)
+        else:
+            # Enviar mensajes recientes
+            messages = chat_service.get_messages_by_room("general", settings.RECENT_MESSAGES_LIMIT)
+            await gateway.emit(
+                "recent_messages",
+                {"messages": [msg.payload for msg in messages]},
+                room=sid,
+                compact=lambda: {"messages": compact_messages(messages)}
+            )
         
         logger.info(f"User {name} joined the chat with ID {user.id}")
         
     except Exception as e:
         logger.error(f"Error in join_chat: {e}")
-        await sio.emit("error", {"message": "Failed to join chat"}, room=sid)
+        await gateway.emit("error", {"message": "Failed to join chat"}, room=sid)
+
 
+async def emit_rate_limited(sid: str, cost: int = 1) -> None:
+    """Avisar al cliente que superó su tasa de envío y cuándo puede reintentar."""
+    await gateway.emit("error", {
+        "message": "Too many messages, slow down",
+        "code": "rate_limited",
+        "retry_after_ms": int(send_rate_limiter.retry_after(sid, cost) * 1000)
+    }, room=sid)
 
-@sio.event
+
+@gateway.event
 async def send_message(sid, data):
     """Evento para enviar mensaje."""
     try:
@@ -197,13 +322,17 @@ async def send_message(sid, data):
         room_id = data.get("room_id", "general")
         
         if not content:
-            await sio.emit("error", {"message": "Message content is required"}, room=sid)
+            await gateway.emit("error", {"message": "Message content is required"}, room=sid)
+            return
+        
+        if not send_rate_limiter.acquire(sid):
+            await emit_rate_limited(sid)
             return
         
         # Obtener usuario por socket ID
         user = chat_service.get_user_by_socket_id(sid)
         if not user:
-            await sio.emit("error", {"message": "User not found"}, room=sid)
+            await gateway.emit("error", {"message": "User not found"}, room=sid)
             return
         
         # Crear mensaje
@@ -213,33 +342,140 @@ async def send_message(sid, data):
         if message:
             logger.info(f"Message sent by {user.name}: {content[:50]}...")
         else:
-            await sio.emit("error", {"message": "Failed to send message"}, room=sid)
+            await gateway.emit("error", {"message": "Failed to send message"}, room=sid)
         
     except Exception as e:
         logger.error(f"Error in send_message: {e}")
-        await sio.emit("error", {"message": "Failed to send message"}, room=sid)
+        await gateway.emit("error", {"message": "Failed to send message"}, room=sid)
+
 
+@gateway.event
+async def send_messages(sid, data):
+    """Evento para enviar varios mensajes de una vez (`{"messages": [{content, room_id}]}`).
 
-@sio.event
+    El lote se valida completo antes de crear nada: un elemento inválido
+    rechaza todo el lote indicando su posición (`index`).
+    """
+    try:
+        items = data.get("messages") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            await gateway.emit("error", {"message": "messages must be a non-empty list"}, room=sid)
+            return
+        if len(items) > send_messages_max_batch:
+            await gateway.emit(
+                "error",
+                {"message": f"Too many messages in batch (max {send_messages_max_batch})"},
+                room=sid
+            )
+            return
+        
+        message_requests = []
+        for index, item in enumerate(items):
+            content = item.get("content", "").strip() if isinstance(item, dict) else ""
+            if not content:
+                await gateway.emit("error", {"message": "Message content is required", "index": index}, room=sid)
+                return
+            try:
+                message_requests.append(MessageCreateRequest(content=content, room_id=item.get("room_id", "general")))
+            except ValueError:
+                await gateway.emit("error", {"message": "Invalid message", "index": index}, room=sid)
+                return
+        
+        # Cada mensaje consume un token
+        if not send_rate_limiter.acquire(sid, len(message_requests)):
+            await emit_rate_limited(sid, len(message_requests))
+            return
+        
+        user = chat_service.get_user_by_socket_id(sid)
+        if not user:
+            await gateway.emit("error", {"message": "User not found"}, room=sid)
+            return
+        
+        messages = chat_service.create_messages(user.id, message_requests)
+        
+        if messages:
+            logger.info(f"{len(messages)} messages sent by {user.name}")
+        else:
+            await gateway.emit("error", {"message": "Failed to send messages"}, room=sid)
+        
+    except Exception as e:
+        logger.error(f"Error in send_messages: {e}")
+        await gateway.emit("error", {"message": "Failed to send messages"}, room=sid)
+
+
+def build_resume_payload(last_seq: dict, wire: str = WIRE_JSON) -> dict:
+    """Mensajes perdidos por sala a partir de la última secuencia vista por el cliente.
+
+    Cada sala responde `ok` con exactamente los mensajes posteriores, o
+    `resync` con los últimos mensajes cuando el rango ya no está en memoria
+    (el cliente reemplaza su historial de esa sala).
+    """
+    rooms = {}
+    for room_id, seq in last_seq.items():
+        if not isinstance(room_id, str) or not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            continue
+        missed = chat_service.get_missed_messages(room_id, seq)
+        status = "ok"
+        if missed is None:
+            status = "resync"
+            seq = 0
+            missed = chat_service.get_messages_by_room(room_id, settings.RECENT_MESSAGES_LIMIT)
+        rooms[room_id] = {
+            "status": status,
+            "messages": compact_messages(missed) if wire == WIRE_MSGPACK else [msg.payload for msg in missed],
+            "last_seq": missed[-1].seq if missed else seq
+        }
+    return {"rooms": rooms}
+
+
+@gateway.event
+async def resume(sid, data):
+    """Evento para recuperar los mensajes perdidos durante una desconexión."""
+    try:
+        if not chat_service.get_user_by_socket_id(sid):
+            await gateway.emit("error", {"message": "User not found"}, room=sid)
+            return
+        
+        last_seq = data.get("last_seq") if isinstance(data, dict) else None
+        if not isinstance(last_seq, dict):
+            await gateway.emit("error", {"message": "last_seq is required"}, room=sid)
+            return
+        
+        await gateway.emit("resumed", build_resume_payload(last_seq, gateway.wire_of(sid)), room=sid)
+        
+    except Exception as e:
+        logger.error(f"Error in resume: {e}")
+        await gateway.emit("error", {"message": "Failed to resume"}, room=sid)
+
+
+@gateway.event
+async def app_state(sid, data):
+    """Evento con el estado de la app del cliente (primer o segundo plano)."""
+    state = data.get("state") if isinstance(data, dict) else None
+    if state not in ("foreground", "background"):
+        await gateway.emit("error", {"message": "state must be 'foreground' or 'background'"}, room=sid)
+        return
+    
+    user = chat_service.get_user_by_socket_id(sid)
+    if user:
+        presence_service.set_backgrounded(user.id, state == "background")
+
+
+@gateway.event
 async def get_users(sid):
-    """Evento para obtener lista de usuarios."""
+    """Evento para obtener la lista de usuarios."""
     try:
-        users = chat_service.get_all_users()
-        await sio.emit("users_list", {
-            "users": [
-                {
-                    "id": user.id,
-                    "name": user.name,
-                    "is_active": user.is_active,
-                    "joined_at": user.joined_at.isoformat()
-                }
-                for user in users
-            ]
-        }, room=sid)
+        # Baja prioridad: con el event loop saturado el cliente reintenta más tarde
+        if not await admission.admit("get_users"):
+            await gateway.emit("error", admission.overloaded_error("get_users"), room=sid)
+            return
+        
+        # Snapshot del roster versionado (también se usa para recuperarse de un hueco de versión)
+        await socketio_observer.send_roster_snapshot(sid)
         
     except Exception as e:
         logger.error(f"Error in get_users: {e}")
-        await sio.emit("error", {"message": "Failed to get users"}, room=sid)
+        await gateway.emit("error", {"message": "Failed to get users"}, room=sid)
 
 
 # Ruta de salud
@@ -253,6 +489,22 @@ async def health_check():
     }
 
 
+# Métricas internas
+@app.get("/metrics")
+async def metrics():
+    """Endpoint con métricas internas (colas de persistencia, etc.)."""
+    metrics = chat_service.get_metrics()
+    metrics["event_bus"] = event_subject.stats()
+    metrics["presence_broadcast"] = presence_broadcaster.stats()
+    metrics["message_broadcast"] = message_batcher.stats()
+    metrics["admission"] = {**admission.stats(), "send_rate_limit": send_rate_limiter.stats()}
+    if notification_digest:
+        metrics["notification_digest"] = notification_digest.stats()
+    if cluster_replicator:
+        metrics["cluster"] = cluster_replicator.stats()
+    return metrics
+
+
 # Ruta raíz
 @app.get("/")
 async def root():
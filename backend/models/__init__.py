@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -35,6 +35,7 @@ class Message(BaseModel):
     message_type: MessageType = Field(MessageType.TEXT, description="Tipo de mensaje")
     timestamp: datetime = Field(default_factory=datetime.now, description="Timestamp del mensaje")
     room_id: str = Field("general", description="ID de la sala de chat")
+    seq: int = Field(0, description="Número de secuencia del mensaje dentro de la sala")
 
     class Config:
         json_encoders = {
@@ -46,7 +47,8 @@ class ChatRoom(BaseModel):
     """Modelo para representar una sala de chat."""
     id: str = Field(..., description="ID único de la sala")
     name: str = Field(..., description="Nombre de la sala")
-    users: List[User] = Field(default_factory=list, description="Lista de usuarios en la sala")
+    # Valores `UserRecord` (clase con slots, no pydantic; se importa al final del módulo)
+    users: Dict[str, Any] = Field(default_factory=dict, description="Usuarios en la sala indexados por ID")
     messages: List[Message] = Field(default_factory=list, description="Lista de mensajes de la sala")
     created_at: datetime = Field(default_factory=datetime.now, description="Fecha de creación")
     is_active: bool = Field(True, description="Estado de la sala")
@@ -64,6 +66,7 @@ class NotificationData(BaseModel):
     user_id: str = Field(..., description="ID del usuario destinatario")
     message_id: Optional[str] = Field(None, description="ID del mensaje relacionado")
     data: Optional[dict] = Field(default_factory=dict, description="Datos adicionales")
+    collapse_key: Optional[str] = Field(None, description="Clave para reemplazar notificaciones previas en el dispositivo")
 
 
 # DTOs (Data Transfer Objects)
@@ -78,6 +81,12 @@ class MessageCreateRequest(BaseModel):
     room_id: str = Field("general")
 
 
+class DeviceTokenRequest(BaseModel):
+    """DTO para registrar un token de dispositivo (FCM)."""
+    token: str = Field(..., min_length=1, max_length=4096)
+    platform: Optional[str] = Field(None, max_length=20, description="android, ios o web")
+
+
 class UserResponse(BaseModel):
     """DTO para respuesta de usuario."""
     id: str
@@ -91,6 +100,13 @@ class UserResponse(BaseModel):
         }
 
 
+class DeviceTokenResponse(BaseModel):
+    """DTO para respuesta de registro de token de dispositivo."""
+    user_id: str
+    token: str
+    platform: Optional[str] = None
+
+
 class MessageResponse(BaseModel):
     """DTO para respuesta de mensaje."""
     id: str
@@ -100,8 +116,19 @@ class MessageResponse(BaseModel):
     message_type: MessageType
     timestamp: datetime
     room_id: str
+    seq: int
 
     class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat()
         }
+
+
+class MessageHistoryResponse(BaseModel):
+    """DTO para una página del historial de mensajes."""
+    messages: List[MessageResponse]
+    next_cursor: Optional[int] = Field(None, description="Cursor para pedir la siguiente página")
+
+
+# Representación interna compacta (importada al final para evitar ciclos)
+from .records import UserRecord, MessageRecord  # noqa: E402
@@ -0,0 +1,191 @@
+"""
+Representación interna compacta de usuarios y mensajes.
+
+Los repositorios y el camino de eventos trabajan con estas clases con
+`__slots__` (sin validación ni `__dict__` por instancia). Los modelos
+pydantic se construyen solo en el borde REST/Socket.IO mediante `to_model()`.
+Los IDs de sala y nombres de usuario se internan porque se repiten en cada
+mensaje.
+
+Un mensaje no cambia después de creado, así que su representación de red
+(dict y JSON ya codificado) se calcula una sola vez y se reutiliza en el
+broadcast de Socket.IO, en `recent_messages` y en las respuestas REST.
+"""
+
+import json
+import sys
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from . import Message, MessageType, User
+
+
+class UserRecord:
+    """Usuario del chat tal como se guarda en memoria."""
+
+    __slots__ = ("id", "name", "room", "socket_id", "is_active", "is_online", "joined_at")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        room: str = "general",
+        socket_id: Optional[str] = None,
+        is_active: bool = True,
+        is_online: bool = True,
+        joined_at: Optional[datetime] = None
+    ):
+        self.id = id
+        self.name = sys.intern(name)
+        self.room = sys.intern(room)
+        self.socket_id = socket_id
+        self.is_active = is_active
+        self.is_online = is_online
+        self.joined_at = joined_at or datetime.now()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable (joined_at en ISO-8601)."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "room": self.room,
+            "socket_id": self.socket_id,
+            "is_active": self.is_active,
+            "is_online": self.is_online,
+            "joined_at": self.joined_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserRecord":
+        """Reconstruir un registro a partir de `to_dict()`."""
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            room=data.get("room", "general"),
+            socket_id=data.get("socket_id"),
+            is_active=data.get("is_active", True),
+            is_online=data.get("is_online", True),
+            joined_at=datetime.fromisoformat(data["joined_at"])
+        )
+
+    def to_model(self) -> User:
+        """Construir el modelo pydantic para el borde de la API."""
+        return User(
+            id=self.id,
+            name=self.name,
+            room=self.room,
+            socket_id=self.socket_id,
+            is_active=self.is_active,
+            is_online=self.is_online,
+            joined_at=self.joined_at
+        )
+
+
+class MessageRecord:
+    """Mensaje del chat tal como se guarda en memoria."""
+
+    __slots__ = (
+        "id", "user_id", "user_name", "content", "message_type", "timestamp", "room_id", "seq",
+        "_payload", "_payload_json", "_payload_compact"
+    )
+
+    def __init__(
+        self,
+        id: str,
+        user_id: str,
+        user_name: str,
+        content: str,
+        room_id: str = "general",
+        timestamp: Optional[datetime] = None,
+        seq: int = 0,
+        message_type: MessageType = MessageType.TEXT
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.user_name = sys.intern(user_name)
+        self.content = content
+        self.message_type = message_type
+        self.timestamp = timestamp or datetime.now()
+        self.room_id = sys.intern(room_id)
+        self.seq = seq
+        self._payload: Optional[Dict[str, Any]] = None
+        self._payload_json: Optional[bytes] = None
+        self._payload_compact: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable (timestamp en ISO-8601)."""
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "content": self.content,
+            "message_type": self.message_type.value,
+            "timestamp": self.timestamp.isoformat(),
+            "room_id": self.room_id,
+            "seq": self.seq,
+        }
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """Payload de red, calculado una vez (compartido: no modificar)."""
+        if self._payload is None:
+            self._payload = self.to_dict()
+        return self._payload
+
+    @property
+    def payload_json(self) -> bytes:
+        """`payload` codificado en JSON UTF-8 (mismo formato que las respuestas de FastAPI)."""
+        if self._payload_json is None:
+            self._payload_json = json.dumps(
+                self.payload,
+                ensure_ascii=False,
+                separators=(",", ":")
+            ).encode("utf-8")
+        return self._payload_json
+
+    def to_compact(self) -> Dict[str, Any]:
+        """Representación del protocolo binario: claves cortas y timestamp en epoch ms."""
+        return {
+            "i": self.id,
+            "u": self.user_id,
+            "n": self.user_name,
+            "c": self.content,
+            "k": self.message_type.value,
+            "t": int(self.timestamp.timestamp() * 1000),
+            "r": self.room_id,
+            "s": self.seq,
+        }
+
+    @property
+    def payload_compact(self) -> Dict[str, Any]:
+        """`to_compact()` calculado una vez (compartido: no modificar)."""
+        if self._payload_compact is None:
+            self._payload_compact = self.to_compact()
+        return self._payload_compact
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MessageRecord":
+        """Reconstruir un registro a partir de `to_dict()`."""
+        return cls(
+            id=data["id"],
+            user_id=data["user_id"],
+            user_name=data["user_name"],
+            content=data["content"],
+            room_id=data.get("room_id", "general"),
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            seq=data.get("seq", 0),
+            message_type=MessageType(data.get("message_type", MessageType.TEXT.value))
+        )
+
+    def to_model(self) -> Message:
+        """Construir el modelo pydantic para el borde de la API."""
+        return Message(
+            id=self.id,
+            user_id=self.user_id,
+            user_name=self.user_name,
+            content=self.content,
+            message_type=self.message_type,
+            timestamp=self.timestamp,
+            room_id=self.room_id,
+            seq=self.seq
+        )
@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from models import User, Message, NotificationData
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from models import UserRecord, MessageRecord, NotificationData
 import logging
 import asyncio
 
+if TYPE_CHECKING:
+    from services.notification_dispatcher import DispatchResult, NotificationDispatcher
+    from services.presence_service import PresenceService
+    from services.admission import AdmissionController
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,6 +20,14 @@ class IObserver(ABC):
         pass
 
 
+class IAsyncObserver(IObserver):
+    """Interfaz para observadores que procesan los eventos en el event loop."""
+    
+    @abstractmethod
+    async def async_update(self, event_type: str, data: Dict[str, Any]) -> None:
+        pass
+
+
 class ISubject(ABC):
     """Interfaz para sujetos observables."""
     
@@ -60,16 +73,36 @@ class ChatEventSubject(ISubject):
 
 
 class NotificationObserver(IObserver):
-    """Observador para el manejo de notificaciones."""
+    """Observador para el manejo de notificaciones.
+
+    Las notificaciones de cada evento se entregan en un solo despacho al
+    `NotificationDispatcher` o al `NotificationDigest`, que las agrupa por
+    destinatario. El `PresenceService` omite a quienes ya reciben el evento
+    por Socket.IO. El `AdmissionController` descarta el fan-out mientras el
+    event loop está saturado.
+    """
     
-    def __init__(self, notification_service):
-        self.notification_service = notification_service
+    def __init__(
+        self,
+        dispatcher: "NotificationDispatcher",
+        presence: Optional["PresenceService"] = None,
+        admission: Optional["AdmissionController"] = None
+    ):
+        self.dispatcher = dispatcher
+        self.presence = presence
+        self.admission = admission
+        self.suppressed = 0
     
     def update(self, event_type: str, data: Dict[str, Any]) -> None:
         """Procesar eventos y generar notificaciones."""
+        # Los eventos replicados de otro worker ya los notificó ese worker
+        if data.get("replicated"):
+            return
         try:
             if event_type == "message_sent":
                 self._handle_message_notification(data)
+            elif event_type == "messages_sent":
+                self._handle_messages_notification(data)
             elif event_type == "user_joined":
                 self._handle_user_joined_notification(data)
             elif event_type == "user_left":
@@ -77,67 +110,116 @@ class NotificationObserver(IObserver):
         except Exception as e:
             logger.error(f"Error processing notification for event {event_type}: {e}")
     
-    def _handle_message_notification(self, data: Dict[str, Any]) -> None:
+    def _dispatch(self, notifications: List[NotificationData]) -> Optional["DispatchResult"]:
+        """Enviar las notificaciones en un único despacho."""
+        if self.presence is not None:
+            total = len(notifications)
+            notifications = [n for n in notifications if self.presence.needs_push(n.user_id)]
+            self.suppressed += total - len(notifications)
+        
+        if not notifications:
+            return None
+        # Baja prioridad: se pierde el push antes que la entrega del chat
+        if self.admission is not None and not self.admission.admit_now("notifications"):
+            return None
+        return self.dispatcher.dispatch(notifications)
+    
+    def _handle_message_notification(self, data: Dict[str, Any]) -> Optional["DispatchResult"]:
         """Manejar notificaciones de mensajes."""
-        message: Message = data.get("message")
-        users: List[User] = data.get("users", [])
+        message: MessageRecord = data.get("message")
+        users: List[UserRecord] = data.get("users", [])
         
         if not message or not users:
-            return
+            return None
         
         # Crear notificación para todos los usuarios excepto el remitente
-        for user in users:
-            if user.id != message.user_id:
-                notification_data = NotificationData(
-                    title=f"Nuevo mensaje de {message.user_name}",
-                    body=message.content[:100] + "..." if len(message.content) > 100 else message.content,
-                    user_id=user.id,
-                    message_id=message.id,
-                    data={
-                        "type": "new_message",
-                        "room_id": message.room_id,
-                        "sender_name": message.user_name
-                    }
-                )
-                
-                # Enviar notificación (si el servicio está configurado)
-                self.notification_service.send_notification(notification_data)
+        body = message.content[:100] + "..." if len(message.content) > 100 else message.content
+        notifications = [
+            NotificationData(
+                title=f"Nuevo mensaje de {message.user_name}",
+                body=body,
+                user_id=user.id,
+                message_id=message.id,
+                data={
+                    "type": "new_message",
+                    "room_id": message.room_id,
+                    "sender_name": message.user_name
+                }
+            )
+            for user in users
+            if user.id != message.user_id
+        ]
+        
+        return self._dispatch(notifications)
+    
+    def _handle_messages_notification(self, data: Dict[str, Any]) -> Optional["DispatchResult"]:
+        """Manejar notificaciones de un lote de mensajes: una sola por destinatario."""
+        messages: List[MessageRecord] = data.get("messages", [])
+        users: List[UserRecord] = data.get("users", [])
+        
+        if not messages or not users:
+            return None
+        if len(messages) == 1:
+            return self._handle_message_notification({"message": messages[0], "users": users})
+        
+        last = messages[-1]
+        body = last.content[:100] + "..." if len(last.content) > 100 else last.content
+        notifications = [
+            NotificationData(
+                title=f"{len(messages)} mensajes nuevos de {last.user_name}",
+                body=body,
+                user_id=user.id,
+                message_id=last.id,
+                data={
+                    "type": "new_messages",
+                    "room_id": last.room_id,
+                    "sender_name": last.user_name,
+                    "count": str(len(messages))
+                }
+            )
+            for user in users
+            if user.id != last.user_id
+        ]
+        
+        return self._dispatch(notifications)
     
-    def _handle_user_joined_notification(self, data: Dict[str, Any]) -> None:
+    def _handle_user_joined_notification(self, data: Dict[str, Any]) -> Optional["DispatchResult"]:
         """Manejar notificaciones de usuario que se une."""
-        user: User = data.get("user")
-        users: List[User] = data.get("users", [])
+        user: UserRecord = data.get("user")
+        users: List[UserRecord] = data.get("users", [])
         
         if not user or not users:
-            return
+            return None
         
         # Notificar a todos los usuarios existentes
-        for existing_user in users:
-            if existing_user.id != user.id:
-                notification_data = NotificationData(
-                    title="Nuevo participante",
-                    body=f"{user.name} se ha unido al chat",
-                    user_id=existing_user.id,
-                    data={
-                        "type": "user_joined",
-                        "user_name": user.name,
-                        "user_id": user.id
-                    }
-                )
-                
-                self.notification_service.send_notification(notification_data)
+        notifications = [
+            NotificationData(
+                title="Nuevo participante",
+                body=f"{user.name} se ha unido al chat",
+                user_id=existing_user.id,
+                data={
+                    "type": "user_joined",
+                    "user_name": user.name,
+                    "user_id": user.id
+                }
+            )
+            for existing_user in users
+            if existing_user.id != user.id
+        ]
+        
+        return self._dispatch(notifications)
     
-    def _handle_user_left_notification(self, data: Dict[str, Any]) -> None:
+    def _handle_user_left_notification(self, data: Dict[str, Any]) -> Optional["DispatchResult"]:
         """Manejar notificaciones de usuario que sale."""
-        user: User = data.get("user")
-        users: List[User] = data.get("users", [])
+        user: UserRecord = data.get("user")
+        users: List[UserRecord] = data.get("users", [])
         
         if not user or not users:
-            return
+            return None
         
         # Notificar a todos los usuarios restantes
-        for existing_user in users:
-            notification_data = NotificationData(
+        notifications = [
+            NotificationData(
                 title="Participante salió",
                 body=f"{user.name} ha salido del chat",
                 user_id=existing_user.id,
@@ -147,31 +229,56 @@ class NotificationObserver(IObserver):
                     "user_id": user.id
                 }
             )
-            
-            self.notification_service.send_notification(notification_data)
+            for existing_user in users
+        ]
+        
+        return self._dispatch(notifications)
 
 
 import asyncio
 
-class SocketIOObserver(IObserver):
-    """Observador para eventos de Socket.IO."""
+class SocketIOObserver(IAsyncObserver):
+    """Observador para eventos de Socket.IO.
+
+    Los cambios de usuarios se publican como deltas versionados del roster
+    (`roster_delta`); la lista completa (`roster_snapshot`) solo se envía a
+    quien se une o a quien la pide tras detectar un hueco de versión. El
+    `PresenceBroadcaster` agrupa los cambios de una ventana en una emisión y
+    el `MessageBatcher` hace lo mismo con los mensajes de salas con ráfagas.
     
-    def __init__(self, socketio_instance):
+    `socketio_instance` es el `SocketGateway`: JSON y, opcionalmente, msgpack
+    con payloads compactos. Las emisiones usan `ignore_queue`. En modo
+    cluster cada worker recibe todos los eventos, propios y replicados, y los
+    entrega solo a sus clientes sin volver a pasar por el broker.
+    """
+    
+    def __init__(self, socketio_instance, presence_broadcaster=None, message_batcher=None):
         self.sio = socketio_instance
+        if presence_broadcaster is None:
+            from services.presence_broadcaster import PresenceBroadcaster
+            presence_broadcaster = PresenceBroadcaster(socketio_instance, window=0)
+        if message_batcher is None:
+            from services.message_batcher import MessageBatcher
+            message_batcher = MessageBatcher(socketio_instance, window=0)
+        self.presence = presence_broadcaster
+        self.roster = presence_broadcaster.roster
+        self.messages = message_batcher
     
     def update(self, event_type: str, data: Dict[str, Any]) -> None:
         """Procesar eventos y emitir via Socket.IO usando asyncio.create_task."""
         try:
             # Crear una tarea asíncrona para manejar el evento
-            asyncio.create_task(self._async_update(event_type, data))
+            asyncio.create_task(self.async_update(event_type, data))
         except Exception as e:
             logger.error(f"Error creating async task for SocketIO event {event_type}: {e}")
     
-    async def _async_update(self, event_type: str, data: Dict[str, Any]) -> None:
-        """Versión asíncrona del update."""
+    async def async_update(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Versión asíncrona del update (la que usa `AsyncEventBus`)."""
         try:
             if event_type == "message_sent":
                 await self._handle_message_broadcast(data)
+            elif event_type == "messages_sent":
+                await self._handle_messages_broadcast(data)
             elif event_type == "user_joined":
                 await self._handle_user_joined_broadcast(data)
             elif event_type == "user_left":
@@ -182,99 +289,53 @@ class SocketIOObserver(IObserver):
             logger.error(f"Error broadcasting via SocketIO for event {event_type}: {e}")
     
     async def _handle_message_broadcast(self, data: Dict[str, Any]) -> None:
-        """Broadcast de mensajes a todos los clientes."""
-        message: Message = data.get("message")
+        """Broadcast de mensajes a todos los clientes (agrupado si la sala tiene ráfagas)."""
+        message: MessageRecord = data.get("message")
         room_id = data.get("room_id", "general")
         
         if message:
-            await self.sio.emit("new_message", {
-                "id": message.id,
-                "user_id": message.user_id,
-                "user_name": message.user_name,
-                "content": message.content,
-                "timestamp": message.timestamp.isoformat(),
-                "room_id": message.room_id
-            }, room=room_id)
-            logger.info(f"Broadcasted message from {message.user_name} to room {room_id}")
+            await self.messages.add(room_id, [message])
+            logger.debug(f"Queued message from {message.user_name} for room {room_id}")
+    
+    async def _handle_messages_broadcast(self, data: Dict[str, Any]) -> None:
+        """Broadcast de un lote de mensajes de una sala."""
+        messages: List[MessageRecord] = data.get("messages", [])
+        room_id = data.get("room_id", "general")
+        
+        if messages:
+            await self.messages.add(room_id, messages)
+            logger.debug(f"Queued {len(messages)} messages for room {room_id}")
+    
+    async def send_roster_snapshot(self, sid: str) -> None:
+        """Enviar el roster completo a un cliente."""
+        await self.presence.send_snapshot(sid)
     
     async def _handle_user_joined_broadcast(self, data: Dict[str, Any]) -> None:
-        """Broadcast cuando un usuario se une."""
-        user: User = data.get("user")
-        users: List[User] = data.get("users", [])
+        """Publicar la entrada de un usuario (agrupada con las de la ventana)."""
+        user: UserRecord = data.get("user")
         
         if user:
-            # Emitir evento de usuario que se unió
-            await self.sio.emit("user_joined", {
-                "user": {
-                    "id": user.id,
-                    "name": user.name,
-                    "joined_at": user.joined_at.isoformat()
-                },
-                "users_count": len(users)
-            }, room="general")
-            
-            # También emitir la lista actualizada de usuarios
-            users_data = [
-                {
-                    "id": u.id,
-                    "name": u.name,
-                    "is_active": u.is_active,
-                    "joined_at": u.joined_at.isoformat()
-                }
-                for u in users
-            ]
-            
-            await self.sio.emit("users_list", {
-                "users": users_data,
-                "count": len(users_data)
-            }, room="general")
+            # El snapshot para quien entra lo envía el worker donde está su socket
+            await self.presence.user_joined(user, send_snapshot=not data.get("replicated"))
     
     async def _handle_user_left_broadcast(self, data: Dict[str, Any]) -> None:
-        """Broadcast cuando un usuario sale."""
-        user: User = data.get("user")
-        users: List[User] = data.get("users", [])
+        """Publicar la salida de un usuario (agrupada con las de la ventana)."""
+        user: UserRecord = data.get("user")
         
         if user:
-            # Emitir evento de usuario que salió
-            await self.sio.emit("user_left", {
-                "user": {
-                    "id": user.id,
-                    "name": user.name
-                },
-                "users_count": len(users)
-            }, room="general")
-            
-            # También emitir la lista actualizada de usuarios
-            users_data = [
-                {
-                    "id": u.id,
-                    "name": u.name,
-                    "is_active": u.is_active,
-                    "joined_at": u.joined_at.isoformat()
-                }
-                for u in users
-            ]
-            
-            await self.sio.emit("users_list", {
-                "users": users_data,
-                "count": len(users_data)
-            }, room="general")
+            await self.presence.user_left(user)
     
     async def _handle_users_updated_broadcast(self, data: Dict[str, Any]) -> None:
-        """Broadcast cuando la lista de usuarios se actualiza."""
-        users: List[User] = data.get("users", [])
+        """Publicar cambios netos de la lista de usuarios."""
+        users: List[UserRecord] = data.get("users", [])
         
-        users_data = [
-            {
-                "id": user.id,
-                "name": user.name,
-                "is_active": user.is_active,
-                "joined_at": user.joined_at.isoformat()
-            }
-            for user in users
-        ]
-        
-        await self.sio.emit("users_updated", {
-            "users": users_data,
-            "count": len(users_data)
-        }, room="general")
+        await self.presence.sync(users)
+
+
+# Bus de eventos asíncrono (importado al final para evitar ciclos)
+from .event_bus import AsyncEventBus  # noqa: E402
+
+__all__ = [
+    "IObserver", "IAsyncObserver", "ISubject", "ChatEventSubject",
+    "NotificationObserver", "SocketIOObserver", "AsyncEventBus"
+]
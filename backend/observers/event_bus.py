@@ -0,0 +1,241 @@
+"""
+Bus de eventos asíncrono.
+
+`ChatEventSubject.notify` llama a cada observador dentro del handler que
+produjo el evento, así que un observador lento (p. ej. llamadas a FCM) frena
+el event loop. `AsyncEventBus` solo encola el evento: cada observador tiene su
+propia cola acotada y sus tareas consumidoras, con un límite de concurrencia y
+una política de desborde. Los observadores asíncronos (`IAsyncObserver`) se
+ejecutan en el loop; los síncronos, en un pool de threads.
+
+Políticas de desborde (cola llena):
+
+- `buffer`: el evento espera en un buffer de desborde ordenado y acotado
+  (otro `max_size`) que el consumidor vuelca a la cola a medida que la
+  drena; conserva el orden. No frena al productor (`notify()` es síncrono):
+  si el buffer también se llena se descarta el evento más antiguo, como
+  `drop_oldest` con el doble de capacidad. `block` es el nombre anterior.
+- `drop`: se descarta el evento nuevo.
+- `drop_oldest`: se descarta el evento más antiguo de la cola.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import IAsyncObserver, IObserver, ISubject
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("buffer", "drop", "drop_oldest")
+
+
+class _Subscription:
+    """Cola, consumidores y métricas de un observador."""
+
+    def __init__(self, observer: IObserver, name: str, max_size: int, concurrency: int, overflow_policy: str):
+        if overflow_policy == "block":
+            logger.warning("Event bus overflow policy 'block' is deprecated, use 'buffer' (it never blocks)")
+            overflow_policy = "buffer"
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.observer = observer
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.overflow_policy = overflow_policy
+        self.queue: "asyncio.Queue[Tuple[str, Dict[str, Any], float]]" = asyncio.Queue(maxsize=max_size)
+        # Desborde de `buffer`: eventos más nuevos que todos los de la cola, en orden
+        self.overflow: "deque[Tuple[str, Dict[str, Any], float]]" = deque()
+        self.max_overflow = max_size
+        self.tasks: List[asyncio.Task] = []
+
+        # Métricas
+        self.enqueued = 0
+        self.dropped = 0
+        self.buffered = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+
+    def refill(self) -> None:
+        """Pasar a la cola los eventos en desborde que ya entran."""
+        while self.overflow and not self.queue.full():
+            self.queue.put_nowait(self.overflow.popleft())
+
+    def record_lag(self, enqueued_at: float) -> None:
+        lag_ms = (time.monotonic() - enqueued_at) * 1000
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self.total_lag_ms += lag_ms
+
+    def stats(self) -> Dict[str, Any]:
+        handled = self.processed + self.failed
+        return {
+            "queue_depth": self.queue.qsize(),
+            "overflow_depth": len(self.overflow),
+            "concurrency": self.concurrency,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "buffered": self.buffered,
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "avg_lag_ms": round(self.total_lag_ms / handled, 2) if handled else 0.0,
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
+
+
+class AsyncEventBus(ISubject):
+    """Sujeto observable que entrega los eventos en background."""
+
+    def __init__(
+        self,
+        max_queue_size: int = 10000,
+        overflow_policy: str = "buffer",
+        sync_workers: int = 4
+    ):
+        self._default_max_size = max_queue_size
+        self._default_policy = overflow_policy
+        self._subscriptions: Dict[IObserver, _Subscription] = {}
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="event-bus")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(
+        self,
+        observer: IObserver,
+        concurrency: int = 1,
+        max_queue_size: Optional[int] = None,
+        overflow_policy: Optional[str] = None
+    ) -> None:
+        """Agregar un observador con su propia cola.
+
+        Con `concurrency` 1 (por defecto) los eventos se entregan en orden.
+        """
+        if observer in self._subscriptions:
+            return
+        name = observer.__class__.__name__
+        taken = {sub.name for sub in self._subscriptions.values()}
+        if name in taken:
+            name = next(f"{name}-{n}" for n in range(2, len(taken) + 2) if f"{name}-{n}" not in taken)
+        subscription = _Subscription(
+            observer,
+            name,
+            max_queue_size or self._default_max_size,
+            concurrency,
+            overflow_policy or self._default_policy
+        )
+        self._subscriptions[observer] = subscription
+        if self._loop is not None:
+            self._start_consumers(subscription)
+        logger.info(f"Observer {subscription.name} attached")
+
+    def detach(self, observer: IObserver) -> None:
+        """Remover un observador; los eventos aún en su cola se descartan."""
+        subscription = self._subscriptions.pop(observer, None)
+        if subscription:
+            for task in subscription.tasks:
+                task.cancel()
+            logger.info(f"Observer {subscription.name} detached")
+
+    def notify(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Encolar el evento para cada observador sin esperar a que lo procesen."""
+        loop = self._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if loop is not None and running is not loop:
+            # Llamado desde otro thread: las colas de asyncio no son thread-safe
+            loop.call_soon_threadsafe(self._enqueue, event_type, data, time.monotonic())
+        else:
+            self._enqueue(event_type, data, time.monotonic())
+
+    def _enqueue(self, event_type: str, data: Dict[str, Any], enqueued_at: float) -> None:
+        item = (event_type, data, enqueued_at)
+        for subscription in self._subscriptions.values():
+            queue = subscription.queue
+            subscription.enqueued += 1
+            # Con eventos en desborde, los nuevos van detrás de ellos para conservar el orden
+            if not subscription.overflow and not queue.full():
+                queue.put_nowait(item)
+                continue
+
+            if subscription.overflow_policy == "drop":
+                subscription.dropped += 1
+                if subscription.dropped % 1000 == 1:
+                    logger.warning(f"Event queue for {subscription.name} full, dropped {subscription.dropped} events")
+            elif subscription.overflow_policy == "drop_oldest":
+                queue.get_nowait()
+                queue.task_done()
+                subscription.dropped += 1
+                queue.put_nowait(item)
+            else:
+                # notify() es síncrono: el evento espera en el desborde acotado
+                subscription.buffered += 1
+                if len(subscription.overflow) >= subscription.max_overflow:
+                    subscription.overflow.popleft()
+                    subscription.dropped += 1
+                    if subscription.dropped % 1000 == 1:
+                        logger.warning(
+                            f"Event overflow for {subscription.name} full, dropped {subscription.dropped} events"
+                        )
+                subscription.overflow.append(item)
+
+    async def start(self) -> None:
+        """Arrancar las tareas consumidoras en el event loop actual."""
+        self._loop = asyncio.get_running_loop()
+        for subscription in self._subscriptions.values():
+            self._start_consumers(subscription)
+
+    def _start_consumers(self, subscription: _Subscription) -> None:
+        subscription.tasks = [
+            self._loop.create_task(self._consume(subscription), name=f"event-bus-{subscription.name}-{index}")
+            for index in range(subscription.concurrency)
+        ]
+
+    async def _consume(self, subscription: _Subscription) -> None:
+        observer = subscription.observer
+        queue = subscription.queue
+        while True:
+            event_type, data, enqueued_at = await queue.get()
+            subscription.refill()
+            subscription.record_lag(enqueued_at)
+            try:
+                if isinstance(observer, IAsyncObserver):
+                    await observer.async_update(event_type, data)
+                else:
+                    await self._loop.run_in_executor(self._executor, observer.update, event_type, data)
+                subscription.processed += 1
+            except Exception as e:
+                subscription.failed += 1
+                logger.error(f"Error notifying observer {subscription.name}: {e}")
+            finally:
+                queue.task_done()
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Esperar a que se vacíen las colas (hasta `timeout`) y detener los consumidores."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(sub.queue.join() for sub in self._subscriptions.values())),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            pending = sum(sub.queue.qsize() + len(sub.overflow) for sub in self._subscriptions.values())
+            logger.warning(f"Event bus stopped with {pending} undelivered events")
+
+        for subscription in self._subscriptions.values():
+            for task in subscription.tasks:
+                task.cancel()
+        self._executor.shutdown(wait=False)
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas por observador: profundidad de cola, descartes y lag."""
+        return {sub.name: sub.stats() for sub in self._subscriptions.values()}
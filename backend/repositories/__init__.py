@@ -1,27 +1,32 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict
-from models import User, Message, ChatRoom
+from typing import Any, List, Optional, Dict, Set, Tuple
+from models import ChatRoom, UserRecord, MessageRecord
+import heapq
+import time
 import uuid
 from datetime import datetime
+from itertools import islice
+
+from .ring_buffer import RingBuffer
 
 
 class IUserRepository(ABC):
     """Interfaz para el repositorio de usuarios."""
     
     @abstractmethod
-    def create_user(self, name: str, socket_id: Optional[str] = None) -> User:
+    def create_user(self, name: str, socket_id: Optional[str] = None) -> UserRecord:
         pass
     
     @abstractmethod
-    def get_user_by_id(self, user_id: str) -> Optional[User]:
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
         pass
     
     @abstractmethod
-    def get_user_by_socket_id(self, socket_id: str) -> Optional[User]:
+    def get_user_by_socket_id(self, socket_id: str) -> Optional[UserRecord]:
         pass
     
     @abstractmethod
-    def get_all_users(self) -> List[User]:
+    def get_all_users(self) -> List[UserRecord]:
         pass
     
     @abstractmethod
@@ -35,25 +40,96 @@ class IUserRepository(ABC):
     @abstractmethod
     def delete_user(self, user_id: str) -> bool:
         pass
+    
+    @abstractmethod
+    def reap_inactive_users(self, ttl_seconds: float) -> List[str]:
+        """Eliminar de memoria los usuarios inactivos hace más de `ttl_seconds`; retorna sus IDs."""
+        pass
+    
+    def get_inactive_since(self, user_id: str) -> Optional[float]:
+        """Instante (monotónico) en que el usuario se desconectó, o None."""
+        return None
+    
+    @abstractmethod
+    def apply_replica(self, user: UserRecord) -> None:
+        """Aplicar el estado de un usuario de otro worker (sin persistirlo)."""
+        pass
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas de persistencia en background (vacío si no aplica)."""
+        return {}
+    
+    def close(self) -> None:
+        """Liberar recursos y drenar escrituras pendientes."""
+        pass
 
 
 class IMessageRepository(ABC):
     """Interfaz para el repositorio de mensajes."""
     
     @abstractmethod
-    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> Message:
+    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> MessageRecord:
+        pass
+    
+    def create_messages(self, user_id: str, user_name: str, items: List[Tuple[str, str]]) -> List[MessageRecord]:
+        """Crear varios mensajes de un mismo autor; `items` son pares (content, room_id)."""
+        return [self.create_message(user_id, user_name, content, room_id) for content, room_id in items]
+    
+    @abstractmethod
+    def get_message_by_id(self, message_id: str) -> Optional[MessageRecord]:
         pass
     
     @abstractmethod
-    def get_message_by_id(self, message_id: str) -> Optional[Message]:
+    def get_messages_by_room(
+        self,
+        room_id: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[MessageRecord]:
+        """Mensajes de una sala en orden cronológico.
+
+        `before`/`after` son cursores de secuencia exclusivos: con `after` se
+        avanza hacia adelante desde ese punto; en otro caso se retornan los
+        últimos `limit` mensajes anteriores a `before` (o a la cola).
+        """
         pass
     
     @abstractmethod
-    def get_messages_by_room(self, room_id: str, limit: int = 50) -> List[Message]:
+    def get_recent_messages(self, limit: int = 50) -> List[MessageRecord]:
+        pass
+    
+    def get_missed_messages(self, room_id: str, last_seq: int, limit: int) -> Optional[List[MessageRecord]]:
+        """Todos los mensajes de la sala con `seq > last_seq`, o None si no se
+        pueden entregar completos (el rango ya no está en memoria o supera `limit`)."""
+        return None
+    
+    @abstractmethod
+    def add_replica(self, message: MessageRecord) -> bool:
+        """Registrar un mensaje creado en otro worker (sin persistirlo)."""
         pass
     
     @abstractmethod
-    def get_recent_messages(self, limit: int = 50) -> List[Message]:
+    def get_room_ids(self) -> List[str]:
+        """Salas con mensajes en memoria."""
+        pass
+    
+    @abstractmethod
+    def set_history_floor(self, room_id: str, seq: int) -> None:
+        """Indicar que los mensajes de la sala hasta `seq` no están en memoria
+        (p. ej. al cargar el snapshot de otro worker): quien los pida resincroniza."""
+        pass
+    
+    def set_sequence_partition(self, node_id: int, stride: int) -> None:
+        """Repartir los números de secuencia entre workers (ver `InMemoryMessageRepository`)."""
+        pass
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas de persistencia en background (vacío si no aplica)."""
+        return {}
+    
+    def close(self) -> None:
+        """Liberar recursos y drenar escrituras pendientes."""
         pass
 
 
@@ -73,24 +149,76 @@ class IChatRoomRepository(ABC):
         pass
     
     @abstractmethod
-    def add_user_to_room(self, room_id: str, user: User) -> bool:
+    def add_user_to_room(self, room_id: str, user: UserRecord) -> bool:
         pass
     
     @abstractmethod
     def remove_user_from_room(self, room_id: str, user_id: str) -> bool:
         pass
+    
+    @abstractmethod
+    def remove_user_from_all_rooms(self, user_id: str) -> List[str]:
+        """Sacar al usuario de todas sus salas; retorna los IDs afectados."""
+        pass
+    
+    @abstractmethod
+    def get_users_in_room(self, room_id: str) -> List[UserRecord]:
+        pass
+    
+    @abstractmethod
+    def get_rooms_for_user(self, user_id: str) -> List[str]:
+        pass
+
+
+class IDeviceTokenRepository(ABC):
+    """Interfaz para el registro de tokens de dispositivo (FCM)."""
+    
+    @abstractmethod
+    def register_token(self, user_id: str, token: str, platform: Optional[str] = None) -> bool:
+        """Asociar el token al usuario; retorna True si el registro cambió."""
+        pass
+    
+    @abstractmethod
+    def unregister_token(self, token: str) -> bool:
+        pass
+    
+    @abstractmethod
+    def get_tokens(self, user_id: str) -> List[str]:
+        pass
+    
+    @abstractmethod
+    def remove_tokens(self, tokens: List[str]) -> int:
+        """Eliminar tokens (p. ej. los que FCM reporta inválidos); retorna cuántos existían."""
+        pass
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas de persistencia en background (vacío si no aplica)."""
+        return {}
+    
+    def close(self) -> None:
+        """Liberar recursos y drenar escrituras pendientes."""
+        pass
 
 
 class InMemoryUserRepository(IUserRepository):
-    """Implementación en memoria del repositorio de usuarios."""
+    """Implementación en memoria del repositorio de usuarios.
+
+    Los usuarios activos se mantienen en un índice aparte (en orden de
+    ingreso), así el roster cuesta O(usuarios conectados) y no O(usuarios
+    históricos). Los desactivados se registran por orden de desactivación
+    para que `reap_inactive_users` los elimine sin recorrer todo.
+    """
     
     def __init__(self):
-        self._users: Dict[str, User] = {}
+        self._users: Dict[str, UserRecord] = {}
         self._socket_to_user: Dict[str, str] = {}
+        self._active_users: Dict[str, UserRecord] = {}
+        # user_id -> instante (monotónico) de desactivación, en orden de inserción
+        self._inactive_since: Dict[str, float] = {}
     
-    def create_user(self, name: str, socket_id: Optional[str] = None) -> User:
+    def create_user(self, name: str, socket_id: Optional[str] = None) -> UserRecord:
         user_id = str(uuid.uuid4())
-        user = User(
+        user = UserRecord(
             id=user_id,
             name=name,
             socket_id=socket_id,
@@ -98,23 +226,24 @@ class InMemoryUserRepository(IUserRepository):
             joined_at=datetime.now()
         )
         self._users[user_id] = user
+        self._active_users[user_id] = user
         
         if socket_id:
             self._socket_to_user[socket_id] = user_id
             
         return user
     
-    def get_user_by_id(self, user_id: str) -> Optional[User]:
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
         return self._users.get(user_id)
     
-    def get_user_by_socket_id(self, socket_id: str) -> Optional[User]:
+    def get_user_by_socket_id(self, socket_id: str) -> Optional[UserRecord]:
         user_id = self._socket_to_user.get(socket_id)
         if user_id:
             return self._users.get(user_id)
         return None
     
-    def get_all_users(self) -> List[User]:
-        return [user for user in self._users.values() if user.is_active]
+    def get_all_users(self) -> List[UserRecord]:
+        return list(self._active_users.values())
     
     def update_user_socket(self, user_id: str, socket_id: str) -> bool:
         if user_id in self._users:
@@ -132,7 +261,10 @@ class InMemoryUserRepository(IUserRepository):
     def deactivate_user(self, user_id: str) -> bool:
         if user_id in self._users:
             user = self._users[user_id]
-            user.is_active = False
+            if user.is_active:
+                user.is_active = False
+                self._active_users.pop(user_id, None)
+                self._inactive_since[user_id] = time.monotonic()
             
             # Remover socket mapping
             if user.socket_id and user.socket_id in self._socket_to_user:
@@ -151,55 +283,220 @@ class InMemoryUserRepository(IUserRepository):
                 del self._socket_to_user[user.socket_id]
             
             del self._users[user_id]
+            self._active_users.pop(user_id, None)
+            self._inactive_since.pop(user_id, None)
             return True
         return False
+    
+    def reap_inactive_users(self, ttl_seconds: float) -> List[str]:
+        cutoff = time.monotonic() - ttl_seconds
+        expired = []
+        # El dict está ordenado por instante de desactivación
+        for user_id, since in self._inactive_since.items():
+            if since > cutoff:
+                break
+            expired.append(user_id)
+        
+        for user_id in expired:
+            del self._inactive_since[user_id]
+            user = self._users.pop(user_id, None)
+            if user and user.socket_id and self._socket_to_user.get(user.socket_id) == user_id:
+                del self._socket_to_user[user.socket_id]
+        
+        return expired
+    
+    def get_inactive_since(self, user_id: str) -> Optional[float]:
+        return self._inactive_since.get(user_id)
+    
+    def apply_replica(self, user: UserRecord) -> None:
+        if not user.is_active:
+            if user.id in self._users:
+                self.deactivate_user(user.id)
+            else:
+                # Salida de un usuario que este worker nunca vio activo (p. ej. se
+                # unió antes de que arrancara): ya llega inactivo, se registra
+                # directo para que el reaper lo elimine
+                user.socket_id = None
+                self._users[user.id] = user
+                self._active_users.pop(user.id, None)
+                self._inactive_since[user.id] = time.monotonic()
+            return
+        
+        current = self._users.get(user.id)
+        if current and current.socket_id and current.socket_id != user.socket_id:
+            self._socket_to_user.pop(current.socket_id, None)
+        self._users[user.id] = user
+        self._active_users[user.id] = user
+        self._inactive_since.pop(user.id, None)
+        if user.socket_id:
+            self._socket_to_user[user.socket_id] = user.id
 
 
 class InMemoryMessageRepository(IMessageRepository):
-    """Implementación en memoria del repositorio de mensajes."""
-    
-    def __init__(self):
-        self._messages: Dict[str, Message] = {}
-        self._room_messages: Dict[str, List[str]] = {}
-    
-    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> Message:
+    """Implementación en memoria del repositorio de mensajes.
+
+    Cada sala guarda su historial en un `RingBuffer`. Si se indica
+    `room_capacity`, solo se conservan los últimos N mensajes por sala y los
+    desalojados también se eliminan del índice por ID.
+    
+    Con varios workers, cada uno numera en su propia partición
+    (`seq % stride == node_id`) y avanza su contador al ver secuencias
+    replicadas, así los números son únicos y crecientes en cada sala.
+    """
+    
+    def __init__(self, room_capacity: Optional[int] = None):
+        self._room_capacity = room_capacity
+        self._messages: Dict[str, MessageRecord] = {}
+        self._room_messages: Dict[str, RingBuffer] = {}
+        # Mayor número de secuencia visto por sala
+        self._room_seq: Dict[str, int] = {}
+        # Mayor secuencia desalojada por sala: lo anterior ya no se puede reenviar
+        self._room_evicted_seq: Dict[str, int] = {}
+        self._seq_node = 0
+        self._seq_stride = 1
+    
+    def set_sequence_partition(self, node_id: int, stride: int) -> None:
+        self._seq_node = node_id
+        self._seq_stride = stride
+    
+    def _next_seq(self, room_id: str) -> int:
+        last = self._room_seq.get(room_id, 0)
+        seq = (last // self._seq_stride + 1) * self._seq_stride + self._seq_node
+        self._room_seq[room_id] = seq
+        return seq
+    
+    def _room_buffer(self, room_id: str) -> RingBuffer:
+        buffer = self._room_messages.get(room_id)
+        if buffer is None:
+            buffer = RingBuffer(self._room_capacity)
+            self._room_messages[room_id] = buffer
+        return buffer
+    
+    def _evict(self, message: MessageRecord) -> None:
+        self._messages.pop(message.id, None)
+        room_id = message.room_id
+        self._room_evicted_seq[room_id] = max(self._room_evicted_seq.get(room_id, 0), message.seq)
+    
+    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> MessageRecord:
         message_id = str(uuid.uuid4())
-        message = Message(
+        seq = self._next_seq(room_id)
+        message = MessageRecord(
             id=message_id,
             user_id=user_id,
             user_name=user_name,
             content=content,
             room_id=room_id,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            seq=seq
         )
         
         self._messages[message_id] = message
         
-        # Agregar a la lista de mensajes de la sala
-        if room_id not in self._room_messages:
-            self._room_messages[room_id] = []
-        self._room_messages[room_id].append(message_id)
+        # Agregar al buffer de la sala, desalojando el más antiguo si está lleno
+        evicted = self._room_buffer(room_id).append(message)
+        if evicted is not None:
+            self._evict(evicted)
         
         return message
     
-    def get_message_by_id(self, message_id: str) -> Optional[Message]:
-        return self._messages.get(message_id)
+    def create_messages(self, user_id: str, user_name: str, items: List[Tuple[str, str]]) -> List[MessageRecord]:
+        # Un solo timestamp para todo el lote; las secuencias quedan contiguas por sala
+        timestamp = datetime.now()
+        messages = []
+        for content, room_id in items:
+            message = MessageRecord(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                user_name=user_name,
+                content=content,
+                room_id=room_id,
+                timestamp=timestamp,
+                seq=self._next_seq(room_id)
+            )
+            self._messages[message.id] = message
+            evicted = self._room_buffer(room_id).append(message)
+            if evicted is not None:
+                self._evict(evicted)
+            messages.append(message)
+        return messages
+    
+    def add_replica(self, message: MessageRecord) -> bool:
+        if message.id in self._messages:
+            return False
+        room_id = message.room_id
+        self._room_seq[room_id] = max(self._room_seq.get(room_id, 0), message.seq)
+        self._messages[message.id] = message
+        
+        # Puede llegar después de mensajes locales más nuevos: se inserta en orden
+        evicted = self._room_buffer(room_id).insert_sorted(message, key=lambda x: x.seq)
+        if evicted is not None:
+            self._evict(evicted)
+        return True
+    
+    def get_room_ids(self) -> List[str]:
+        return list(self._room_messages)
     
-    def get_messages_by_room(self, room_id: str, limit: int = 50) -> List[Message]:
-        message_ids = self._room_messages.get(room_id, [])
-        messages = [self._messages[msg_id] for msg_id in message_ids[-limit:]]
-        return sorted(messages, key=lambda x: x.timestamp)
+    def set_history_floor(self, room_id: str, seq: int) -> None:
+        self._room_evicted_seq[room_id] = max(self._room_evicted_seq.get(room_id, 0), seq)
+        self._room_seq[room_id] = max(self._room_seq.get(room_id, 0), seq)
     
-    def get_recent_messages(self, limit: int = 50) -> List[Message]:
-        all_messages = list(self._messages.values())
-        return sorted(all_messages, key=lambda x: x.timestamp, reverse=True)[:limit]
+    def get_message_by_id(self, message_id: str) -> Optional[MessageRecord]:
+        return self._messages.get(message_id)
+    
+    def get_messages_by_room(
+        self,
+        room_id: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[MessageRecord]:
+        buffer = self._room_messages.get(room_id)
+        if buffer is None:
+            return []
+        
+        # El buffer está ordenado por secuencia: los cursores se ubican por bisección
+        start = 0 if after is None else buffer.bisect_right(after, key=lambda x: x.seq)
+        stop = len(buffer) if before is None else buffer.bisect_left(before, key=lambda x: x.seq)
+        if after is not None:
+            return buffer.slice(start, min(stop, start + limit))
+        return buffer.slice(max(start, stop - limit), stop)
+    
+    def get_missed_messages(self, room_id: str, last_seq: int, limit: int) -> Optional[List[MessageRecord]]:
+        if last_seq > self._room_seq.get(room_id, 0):
+            # El cliente vio secuencias que este proceso no conoce (p. ej. tras un reinicio)
+            return None
+        if last_seq < self._room_evicted_seq.get(room_id, 0):
+            # Parte del rango ya fue desalojada del buffer
+            return None
+        
+        buffer = self._room_messages.get(room_id)
+        if buffer is None:
+            return []
+        start = buffer.bisect_right(last_seq, key=lambda x: x.seq)
+        if len(buffer) - start > limit:
+            return None
+        return buffer.slice(start, len(buffer))
+    
+    def get_recent_messages(self, limit: int = 50) -> List[MessageRecord]:
+        # Merge k-way de las colas de cada sala (ya ordenadas por secuencia, el
+        # mismo orden de los cursores): solo se recorren `limit` mensajes en
+        # lugar de ordenar todo el historial
+        room_tails = [reversed(buffer) for buffer in self._room_messages.values()]
+        merged = heapq.merge(*room_tails, key=lambda x: x.seq, reverse=True)
+        return list(islice(merged, limit))
 
 
 class InMemoryChatRoomRepository(IChatRoomRepository):
-    """Implementación en memoria del repositorio de salas de chat."""
+    """Implementación en memoria del repositorio de salas de chat.
+
+    La membresía de cada sala es un dict indexado por ID de usuario y se
+    mantiene un índice inverso usuario -> salas, de modo que unirse, salir y
+    desconectarse cuestan O(salas del usuario).
+    """
     
     def __init__(self):
         self._rooms: Dict[str, ChatRoom] = {}
+        self._user_rooms: Dict[str, Set[str]] = {}
         # Crear sala general por defecto
         self.create_room("General")
     
@@ -208,7 +505,7 @@ class InMemoryChatRoomRepository(IChatRoomRepository):
         room = ChatRoom(
             id=room_id,
             name=name,
-            users=[],
+            users={},
             messages=[],
             created_at=datetime.now(),
             is_active=True
@@ -222,21 +519,85 @@ class InMemoryChatRoomRepository(IChatRoomRepository):
     def get_all_rooms(self) -> List[ChatRoom]:
         return [room for room in self._rooms.values() if room.is_active]
     
-    def add_user_to_room(self, room_id: str, user: User) -> bool:
+    def add_user_to_room(self, room_id: str, user: UserRecord) -> bool:
         room = self._rooms.get(room_id)
         if room:
-            # Verificar si el usuario ya está en la sala
-            for existing_user in room.users:
-                if existing_user.id == user.id:
-                    return True
-            
-            room.users.append(user)
+            # Si el usuario ya está en la sala no se duplica
+            if user.id not in room.users:
+                room.users[user.id] = user
+                self._user_rooms.setdefault(user.id, set()).add(room_id)
             return True
         return False
     
     def remove_user_from_room(self, room_id: str, user_id: str) -> bool:
         room = self._rooms.get(room_id)
         if room:
-            room.users = [user for user in room.users if user.id != user_id]
+            room.users.pop(user_id, None)
+            user_rooms = self._user_rooms.get(user_id)
+            if user_rooms is not None:
+                user_rooms.discard(room_id)
+                if not user_rooms:
+                    del self._user_rooms[user_id]
             return True
         return False
+    
+    def remove_user_from_all_rooms(self, user_id: str) -> List[str]:
+        room_ids = list(self._user_rooms.pop(user_id, ()))
+        for room_id in room_ids:
+            room = self._rooms.get(room_id)
+            if room:
+                room.users.pop(user_id, None)
+        return room_ids
+    
+    def get_users_in_room(self, room_id: str) -> List[UserRecord]:
+        room = self._rooms.get(room_id)
+        if room:
+            return list(room.users.values())
+        return []
+    
+    def get_rooms_for_user(self, user_id: str) -> List[str]:
+        return list(self._user_rooms.get(user_id, ()))
+
+
+class InMemoryDeviceTokenRepository(IDeviceTokenRepository):
+    """Implementación en memoria del registro de tokens de dispositivo.
+
+    Mantiene el índice usuario -> tokens y el inverso token -> usuario: un
+    token pertenece a un solo usuario, así que registrarlo con otro usuario
+    lo mueve en lugar de duplicarlo.
+    """
+    
+    def __init__(self):
+        # user_id -> {token: plataforma}
+        self._user_tokens: Dict[str, Dict[str, Optional[str]]] = {}
+        self._token_owner: Dict[str, str] = {}
+    
+    def register_token(self, user_id: str, token: str, platform: Optional[str] = None) -> bool:
+        owner = self._token_owner.get(token)
+        if owner == user_id and self._user_tokens[user_id].get(token) == platform:
+            return False
+        if owner is not None and owner != user_id:
+            self._discard(owner, token)
+        self._user_tokens.setdefault(user_id, {})[token] = platform
+        self._token_owner[token] = user_id
+        return True
+    
+    def unregister_token(self, token: str) -> bool:
+        owner = self._token_owner.pop(token, None)
+        if owner is None:
+            return False
+        self._discard(owner, token)
+        return True
+    
+    def get_tokens(self, user_id: str) -> List[str]:
+        return list(self._user_tokens.get(user_id, ()))
+    
+    def remove_tokens(self, tokens: List[str]) -> int:
+        return sum(1 for token in tokens if self.unregister_token(token))
+    
+    def _discard(self, user_id: str, token: str) -> None:
+        user_tokens = self._user_tokens.get(user_id)
+        if user_tokens is not None:
+            user_tokens.pop(token, None)
+            if not user_tokens:
+                del self._user_tokens[user_id]
@@ -0,0 +1,312 @@
+"""
+Reintentos y spill a disco para la persistencia en background.
+
+`DurableWriter` envuelve una función de flush por lotes (p. ej.
+`FirebaseService.save_messages_batch`): reintenta con backoff exponencial y
+jitter y, si el lote sigue fallando, lo agrega a un archivo local append-only
+(`SpillFile`, uno por proceso). Un thread de replay reenvía ese archivo
+cuando Firestore vuelve a responder. Todo ocurre en los workers de
+persistencia, nunca en el camino caliente de los mensajes.
+
+Con `versioned=True` los elementos son operaciones dict con `id` y `version`
+(las del `CoalescingWriteBuffer`). Mientras hay spill pendiente se recuerdan
+los campos escritos después con éxito, y al reenviar una operación más
+antigua se le aplican encima: el replay nunca restaura valores viejos.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """Backoff exponencial con full jitter."""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.2, max_delay: float = 10.0):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Espera antes del reintento número `attempt` (0 = primer reintento)."""
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def run(self, operation: Callable[[], bool], stop_event: Optional[threading.Event] = None) -> bool:
+        """Ejecutar `operation` hasta que retorne True o se agoten los intentos."""
+        for attempt in range(self.max_attempts):
+            try:
+                if operation():
+                    return True
+            except Exception as e:
+                logger.warning(f"Persistence attempt {attempt + 1} raised: {e}")
+
+            if attempt < self.max_attempts - 1:
+                # Durante el apagado no se espera: el lote va directo al spill
+                if stop_event is not None:
+                    if stop_event.wait(self.delay(attempt)):
+                        return False
+                else:
+                    time.sleep(self.delay(attempt))
+        return False
+
+
+class SpillFile:
+    """Archivo append-only de lotes que no se pudieron persistir (JSON lines).
+
+    Cada proceso escribe su propio archivo: `path` es el nombre base y el
+    archivo real lleva el pid (`users.jsonl` -> `users.<pid>.jsonl`), así
+    varios workers pueden compartir el directorio. Los archivos de procesos
+    que ya no existen (y el `users.jsonl` compartido de versiones anteriores)
+    se adoptan en el replay: se renombran atómicamente al `.replaying` propio,
+    de modo que un solo worker los reenvía.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serialize: Callable[[Any], Dict[str, Any]],
+        deserialize: Callable[[Dict[str, Any]], Any]
+    ):
+        self.directory = os.path.dirname(os.path.abspath(path))
+        root, ext = os.path.splitext(os.path.basename(path))
+        self.path = os.path.join(self.directory, f"{root}.{os.getpid()}{ext}")
+        self._replaying_path = self.path + ".replaying"
+        # `<root>[.<pid>]<ext>[.replaying]`; sin pid es el archivo compartido anterior
+        self._pattern = re.compile(re.escape(root) + r"(?:\.(\d+))?" + re.escape(ext) + r"(\.replaying)?$")
+        self._serialize = serialize
+        self._deserialize = deserialize
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, items: List[Any]) -> None:
+        """Agregar elementos al final del archivo y forzarlos a disco."""
+        if not items:
+            return
+        lines = "".join(json.dumps(self._serialize(item), default=str) + "\n" for item in items)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as spill:
+                spill.write(lines)
+                spill.flush()
+                os.fsync(spill.fileno())
+
+    def has_pending(self) -> bool:
+        return any(
+            os.path.exists(path) and os.path.getsize(path) > 0
+            for path in (self.path, self._replaying_path)
+        )
+
+    def has_backlog(self) -> bool:
+        """Hay algo para reenviar: el spill propio o el de un proceso muerto."""
+        return self.has_pending() or bool(self.orphans())
+
+    def orphans(self) -> List[str]:
+        """Archivos de spill de procesos que ya no existen (los `.replaying` primero)."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = self._pattern.match(name)
+            if match is None:
+                continue
+            pid = match.group(1)
+            if pid is not None and (int(pid) == os.getpid() or _process_alive(int(pid))):
+                continue
+            found.append((pid or "", match.group(2) is None, os.path.join(self.directory, name)))
+        return [path for _, _, path in sorted(found)]
+
+    def _claim(self) -> bool:
+        """Mover a `.replaying` el archivo propio o, si no hay, uno huérfano."""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.replace(self.path, self._replaying_path)
+                return True
+        for orphan in self.orphans():
+            try:
+                # Atómico: si otro worker lo adoptó primero, el archivo ya no está
+                os.rename(orphan, self._replaying_path)
+            except FileNotFoundError:
+                continue
+            logger.info(f"Adopting orphaned spill file {orphan}")
+            return True
+        return False
+
+    def replay(self, flush_fn: Callable[[List[Any]], bool], batch_size: int = 500) -> int:
+        """Reenviar lo acumulado (propio y huérfano); lo que vuelva a fallar se reescribe al archivo."""
+        with self._replay_lock:
+            replayed = 0
+            # Un `.replaying` previo indica un replay interrumpido: se retoma primero
+            while os.path.exists(self._replaying_path) or self._claim():
+                count, ok = self._replay_claimed(flush_fn, batch_size)
+                replayed += count
+                if not ok:
+                    break
+            return replayed
+
+    def _replay_claimed(self, flush_fn: Callable[[List[Any]], bool], batch_size: int) -> Tuple[int, bool]:
+        items = []
+        with open(self._replaying_path, encoding="utf-8") as spill:
+            for line in spill:
+                if not line.strip():
+                    continue
+                try:
+                    items.append(self._deserialize(json.loads(line)))
+                except Exception as e:
+                    logger.error(f"Discarding corrupt spill entry in {self.path}: {e}")
+
+        replayed = 0
+        ok = True
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                ok = flush_fn(batch)
+            except Exception as e:
+                logger.warning(f"Spill replay raised: {e}")
+                ok = False
+            if not ok:
+                self.append(items[start:])
+                break
+            replayed += len(batch)
+
+        os.remove(self._replaying_path)
+        return replayed, ok
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, pero es de otro usuario
+        return True
+    return True
+
+
+class DurableWriter:
+    """Función de flush con reintentos, spill a disco y replay automático."""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], bool],
+        spill: SpillFile,
+        retry_policy: Optional[RetryPolicy] = None,
+        replay_interval: float = 30.0,
+        name: str = "durable-writer",
+        versioned: bool = False
+    ):
+        self._flush_fn = flush_fn
+        self._spill = spill
+        self._retry = retry_policy or RetryPolicy()
+        self._replay_interval = replay_interval
+        self._name = name
+        self._versioned = versioned
+
+        self._lock = threading.Lock()
+        # Elementos descartados por backpressure, pendientes de escribirse al spill
+        self._overflow: List[Any] = []
+        # Último estado escrito por clave mientras hay spill pendiente (`versioned`)
+        self._latest: Dict[str, Dict[str, Any]] = {}
+
+        # Métricas
+        self._spilled = 0
+        self._replayed = 0
+
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name=f"{name}-replay", daemon=True)
+        self._thread.start()
+
+    def __call__(self, batch: List[Any]) -> bool:
+        """Persistir un lote con reintentos; si falla, se guarda en el spill."""
+        if self._retry.run(lambda: self._flush_fn(batch), self._stop_event):
+            # Firestore responde: buen momento para vaciar el spill (propio o huérfano)
+            if self._spill.has_backlog():
+                if self._versioned:
+                    self._remember(batch)
+                self._wake.set()
+            return True
+
+        logger.warning(f"{self._name}: spilling {len(batch)} items to {self._spill.path}")
+        self._spill.append(batch)
+        with self._lock:
+            self._spilled += len(batch)
+        return False
+
+    def spill_later(self, item: Any) -> None:
+        """Guardar un elemento rechazado por la cola sin bloquear al llamador."""
+        with self._lock:
+            self._overflow.append(item)
+        self._wake.set()
+
+    def _remember(self, batch: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for operation in batch:
+                latest = self._latest.get(operation["id"])
+                if latest is None:
+                    self._latest[operation["id"]] = dict(operation)
+                elif operation.get("version", 0) >= latest.get("version", 0):
+                    latest.update(operation)
+                else:
+                    self._latest[operation["id"]] = {**operation, **latest}
+
+    def _refresh(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+        """Aplicar a una operación del spill lo escrito después para la misma clave."""
+        latest = self._latest.get(operation["id"])
+        if latest is None or latest.get("version", 0) <= operation.get("version", 0):
+            return operation
+        newer = {key: value for key, value in latest.items() if key != "create"}
+        return {**operation, **newer}
+
+    def _replay_flush(self, batch: List[Any]) -> bool:
+        if self._versioned:
+            with self._lock:
+                batch = [self._refresh(operation) for operation in batch]
+        return self._flush_fn(batch)
+
+    def _drain_overflow(self) -> None:
+        with self._lock:
+            overflow, self._overflow = self._overflow, []
+            self._spilled += len(overflow)
+        self._spill.append(overflow)
+
+    def _replay_loop(self) -> None:
+        while not self._stop_event.is_set():
+            self._wake.wait(self._replay_interval)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self._drain_overflow()
+                if self._spill.has_backlog():
+                    replayed = self._spill.replay(self._replay_flush)
+                    if replayed:
+                        logger.info(f"{self._name}: replayed {replayed} spilled items")
+                        with self._lock:
+                            self._replayed += replayed
+                if not self._spill.has_backlog():
+                    with self._lock:
+                        self._latest.clear()
+            except Exception as e:
+                logger.error(f"{self._name}: spill replay failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "spilled": self._spilled,
+                "replayed": self._replayed,
+                "spill_pending": self._spill.has_pending(),
+            }
+
+    def close(self) -> None:
+        """Detener el replay y dejar en disco lo que quede pendiente."""
+        self._stop_event.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._drain_overflow()
@@ -9,55 +9,90 @@ Resuelve el problema de async/sync conflicts al mantener todas las operaciones
 síncronas para el usuario mientras persiste datos a Firebase en background.
 """
 
+import os
 import uuid
 import logging
 from datetime import datetime
-from typing import List, Optional
-import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-from models import User, Message
-from repositories import IUserRepository, IMessageRepository, InMemoryUserRepository, InMemoryMessageRepository
+from config import settings
+from models import UserRecord, MessageRecord
+from repositories import (
+    IUserRepository, IMessageRepository, IDeviceTokenRepository,
+    InMemoryUserRepository, InMemoryMessageRepository, InMemoryDeviceTokenRepository
+)
+from repositories.durability import DurableWriter, RetryPolicy, SpillFile
+from repositories.write_behind import CoalescingWriteBuffer, WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
+
+def _create_durable_writer(flush_fn, spill_name: str, serialize, deserialize, versioned: bool = False) -> DurableWriter:
+    """Envolver un flush por lotes con reintentos y spill a disco según la configuración."""
+    return DurableWriter(
+        flush_fn,
+        SpillFile(os.path.join(settings.PERSIST_SPILL_DIR, spill_name), serialize, deserialize),
+        RetryPolicy(
+            max_attempts=settings.PERSIST_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.PERSIST_RETRY_BASE_SECONDS,
+            max_delay=settings.PERSIST_RETRY_MAX_SECONDS
+        ),
+        replay_interval=settings.PERSIST_REPLAY_INTERVAL_SECONDS,
+        name=spill_name,
+        versioned=versioned
+    )
+
+
 class HybridUserRepository(IUserRepository):
     """Repositorio híbrido: memoria para velocidad + Firebase para persistencia."""
     
-    def __init__(self):
+    def __init__(self, firebase_service=None):
         # Usar solo memoria para operaciones síncronas
         self.memory_repo = InMemoryUserRepository()
         # Firebase se maneja en background
         self._firebase_enabled = False
-        self._init_firebase()
+        self._write_buffer: Optional[CoalescingWriteBuffer] = None
+        self._writer: Optional[DurableWriter] = None
+        self._init_firebase(firebase_service)
     
-    def _init_firebase(self):
-        """Inicializar Firebase en background."""
+    def _init_firebase(self, firebase_service=None):
+        """Configurar el servicio Firebase compartido y el buffer de escrituras."""
         try:
             from services.firebase_service import FirebaseService
-            self.firebase_service = FirebaseService()
+            self.firebase_service = firebase_service or FirebaseService()
+            # Reintentos + spill a disco para lotes que Firestore rechace
+            self._writer = _create_durable_writer(
+                self.firebase_service.write_users_batch,
+                "users.jsonl",
+                serialize=dict,
+                deserialize=dict,
+                versioned=True
+            )
+            # Las escrituras sobre el mismo usuario se fusionan dentro de la ventana
+            self._write_buffer = CoalescingWriteBuffer(
+                self._writer,
+                name="user-persistence",
+                window=settings.USER_WRITE_COALESCE_SECONDS
+            )
             self._firebase_enabled = True
             logger.info("Firebase service initialized for background persistence")
         except Exception as e:
             logger.warning(f"Firebase not available: {e}")
             self._firebase_enabled = False
     
-    def _persist_to_firebase(self, user: User):
-        """Persistir usuario a Firebase en background."""
+    def _persist_to_firebase(self, user: UserRecord):
+        """Registrar la creación del usuario para persistirla en background."""
         if not self._firebase_enabled:
             return
         
-        def background_save():
-            try:
-                self.firebase_service.create_user(user)
-                logger.debug(f"User {user.name} persisted to Firebase")
-            except Exception as e:
-                logger.warning(f"Failed to persist user to Firebase: {e}")
-        
-        # Ejecutar en background thread
-        thread = threading.Thread(target=background_save, daemon=True)
-        thread.start()
+        self._write_buffer.put(user.id, {
+            'name': user.name,
+            'room': user.room,
+            'is_online': user.is_online,
+            'is_active': user.is_active
+        }, create=True)
     
-    def create_user(self, name: str, socket_id: str = None) -> User:
+    def create_user(self, name: str, socket_id: str = None) -> UserRecord:
         """Crear usuario en memoria y persistir a Firebase en background."""
         # Crear en memoria (operación síncrona rápida)
         user = self.memory_repo.create_user(name, socket_id)
@@ -67,15 +102,15 @@ class HybridUserRepository(IUserRepository):
         
         return user
     
-    def get_user_by_id(self, user_id: str) -> Optional[User]:
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
         """Obtener usuario por ID desde memoria."""
         return self.memory_repo.get_user_by_id(user_id)
     
-    def get_user_by_socket_id(self, socket_id: str) -> Optional[User]:
+    def get_user_by_socket_id(self, socket_id: str) -> Optional[UserRecord]:
         """Obtener usuario por socket ID desde memoria."""
         return self.memory_repo.get_user_by_socket_id(socket_id)
     
-    def get_all_users(self) -> List[User]:
+    def get_all_users(self) -> List[UserRecord]:
         """Obtener todos los usuarios desde memoria."""
         return self.memory_repo.get_all_users()
     
@@ -88,63 +123,102 @@ class HybridUserRepository(IUserRepository):
         # Desactivar en memoria
         result = self.memory_repo.deactivate_user(user_id)
         
-        # Actualizar estado en Firebase en background
+        # Actualizar estado en Firebase en background (fusionado con lo pendiente)
         if self._firebase_enabled and result:
-            def background_update():
-                try:
-                    self.firebase_service.update_user_status(user_id, False)
-                    logger.debug(f"User {user_id} status updated in Firebase")
-                except Exception as e:
-                    logger.warning(f"Failed to update user status in Firebase: {e}")
-            
-            thread = threading.Thread(target=background_update, daemon=True)
-            thread.start()
+            self._write_buffer.put(user_id, {'is_online': False})
         
         return result
     
     def delete_user(self, user_id: str) -> bool:
         """Eliminar usuario."""
         return self.memory_repo.delete_user(user_id)
+    
+    def reap_inactive_users(self, ttl_seconds: float) -> List[str]:
+        """Liberar de memoria usuarios inactivos (Firestore conserva su registro)."""
+        return self.memory_repo.reap_inactive_users(ttl_seconds)
+    
+    def get_inactive_since(self, user_id: str) -> Optional[float]:
+        """Instante de desconexión registrado en memoria."""
+        return self.memory_repo.get_inactive_since(user_id)
+    
+    def apply_replica(self, user: UserRecord) -> None:
+        """Aplicar en memoria el estado de un usuario de otro worker (ese worker lo persiste)."""
+        self.memory_repo.apply_replica(user)
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas del buffer de escrituras de usuarios."""
+        if not self._write_buffer:
+            return {}
+        return {**self._write_buffer.stats(), "durability": self._writer.stats()}
+    
+    def close(self) -> None:
+        """Escribir lo pendiente antes de apagar."""
+        if self._write_buffer:
+            self._write_buffer.close()
+            self._writer.close()
 
 
 class HybridMessageRepository(IMessageRepository):
     """Repositorio híbrido para mensajes: memoria + Firebase background."""
     
-    def __init__(self):
-        # Usar solo memoria para operaciones síncronas
-        self.memory_repo = InMemoryMessageRepository()
+    def __init__(self, room_capacity: Optional[int] = None, firebase_service=None):
+        # Usar solo memoria para operaciones síncronas (buffer circular por sala)
+        self.memory_repo = InMemoryMessageRepository(room_capacity=room_capacity)
         # Firebase se maneja en background
         self._firebase_enabled = False
-        self._init_firebase()
+        self._write_queue: Optional[WriteBehindQueue] = None
+        self._writer: Optional[DurableWriter] = None
+        self._init_firebase(firebase_service)
     
-    def _init_firebase(self):
-        """Inicializar Firebase en background."""
+    def _init_firebase(self, firebase_service=None):
+        """Configurar el servicio Firebase compartido y la cola write-behind."""
         try:
             from services.firebase_service import FirebaseService
-            self.firebase_service = FirebaseService()
+            self.firebase_service = firebase_service or FirebaseService()
+            # Reintentos + spill a disco; el replay corre en su propio thread
+            self._writer = _create_durable_writer(
+                self.firebase_service.save_messages_batch,
+                "messages.jsonl",
+                serialize=MessageRecord.to_dict,
+                deserialize=MessageRecord.from_dict
+            )
+            self._write_queue = WriteBehindQueue(
+                self._writer,
+                name="message-persistence",
+                max_size=settings.PERSIST_QUEUE_MAX_SIZE,
+                workers=settings.PERSIST_WORKERS,
+                batch_size=settings.PERSIST_BATCH_SIZE,
+                flush_interval=settings.PERSIST_FLUSH_INTERVAL_SECONDS,
+                overflow_policy=settings.PERSIST_OVERFLOW_POLICY,
+                # Lo que no entra en la cola se guarda en el spill en lugar de perderse
+                on_overflow=self._writer.spill_later
+            )
             self._firebase_enabled = True
             logger.info("Firebase service initialized for message persistence")
         except Exception as e:
             logger.warning(f"Firebase not available for messages: {e}")
             self._firebase_enabled = False
     
-    def _persist_to_firebase(self, message: Message):
-        """Persistir mensaje a Firebase en background."""
+    def _persist_to_firebase(self, message: MessageRecord):
+        """Encolar el mensaje para persistirlo en lote a Firebase."""
         if not self._firebase_enabled:
             return
         
-        def background_save():
-            try:
-                self.firebase_service.save_message(message)
-                logger.debug(f"Message {message.id} persisted to Firebase")
-            except Exception as e:
-                logger.warning(f"Failed to persist message to Firebase: {e}")
-        
-        # Ejecutar en background thread
-        thread = threading.Thread(target=background_save, daemon=True)
-        thread.start()
+        self._write_queue.put(message)
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas de la cola de persistencia (profundidad, latencia de flush)."""
+        if not self._write_queue:
+            return {}
+        return {**self._write_queue.stats(), "durability": self._writer.stats()}
     
-    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> Message:
+    def close(self) -> None:
+        """Drenar la cola de persistencia antes de apagar."""
+        if self._write_queue:
+            self._write_queue.close()
+            self._writer.close()
+    
+    def create_message(self, user_id: str, user_name: str, content: str, room_id: str = "general") -> MessageRecord:
         """Crear mensaje en memoria y persistir a Firebase en background."""
         # Crear en memoria (operación síncrona rápida)
         message = self.memory_repo.create_message(user_id, user_name, content, room_id)
@@ -154,22 +228,126 @@ class HybridMessageRepository(IMessageRepository):
         
         return message
     
-    def get_message_by_id(self, message_id: str) -> Optional[Message]:
+    def create_messages(self, user_id: str, user_name: str, items: List[Tuple[str, str]]) -> List[MessageRecord]:
+        """Crear un lote en memoria y encolarlo como una sola escritura en lote."""
+        messages = self.memory_repo.create_messages(user_id, user_name, items)
+        if self._firebase_enabled and messages:
+            self._write_queue.put_many(messages)
+        return messages
+    
+    def get_message_by_id(self, message_id: str) -> Optional[MessageRecord]:
         """Obtener mensaje por ID desde memoria."""
         return self.memory_repo.get_message_by_id(message_id)
     
-    def get_messages_by_room(self, room_id: str, limit: int = 50) -> List[Message]:
+    def get_messages_by_room(
+        self,
+        room_id: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[MessageRecord]:
         """Obtener mensajes por sala desde memoria."""
-        return self.memory_repo.get_messages_by_room(room_id, limit)
+        return self.memory_repo.get_messages_by_room(room_id, limit, before, after)
     
-    def get_all_messages(self) -> List[Message]:
+    def get_missed_messages(self, room_id: str, last_seq: int, limit: int) -> Optional[List[MessageRecord]]:
+        """Mensajes perdidos desde memoria (None si hay que resincronizar)."""
+        return self.memory_repo.get_missed_messages(room_id, last_seq, limit)
+    
+    def get_all_messages(self) -> List[MessageRecord]:
         """Obtener todos los mensajes desde memoria."""
         return self.memory_repo.get_all_messages()
     
-    def get_recent_messages(self, limit: int = 50) -> List[Message]:
+    def get_recent_messages(self, limit: int = 50) -> List[MessageRecord]:
         """Obtener mensajes recientes desde memoria."""
         return self.memory_repo.get_recent_messages(limit)
     
     def delete_message(self, message_id: str) -> bool:
         """Eliminar mensaje."""
         return self.memory_repo.delete_message(message_id)
+    
+    def add_replica(self, message: MessageRecord) -> bool:
+        """Registrar en memoria un mensaje de otro worker (ese worker lo persiste)."""
+        return self.memory_repo.add_replica(message)
+    
+    def get_room_ids(self) -> List[str]:
+        """Salas con mensajes en memoria."""
+        return self.memory_repo.get_room_ids()
+    
+    def set_history_floor(self, room_id: str, seq: int) -> None:
+        """Marcar el inicio del historial en memoria de la sala."""
+        self.memory_repo.set_history_floor(room_id, seq)
+    
+    def set_sequence_partition(self, node_id: int, stride: int) -> None:
+        """Repartir los números de secuencia entre workers."""
+        self.memory_repo.set_sequence_partition(node_id, stride)
+
+
+class HybridDeviceTokenRepository(IDeviceTokenRepository):
+    """Repositorio híbrido de tokens de dispositivo: índice en memoria + Firebase background.
+
+    Las altas y bajas sobre el mismo token se fusionan en el buffer antes de
+    escribirse en la colección `device_tokens`.
+    """
+    
+    def __init__(self, firebase_service=None):
+        self.memory_repo = InMemoryDeviceTokenRepository()
+        self._firebase_enabled = False
+        self._write_buffer: Optional[CoalescingWriteBuffer] = None
+        self._writer: Optional[DurableWriter] = None
+        self._init_firebase(firebase_service)
+    
+    def _init_firebase(self, firebase_service=None):
+        """Configurar el servicio Firebase compartido y el buffer de escrituras."""
+        try:
+            from services.firebase_service import FirebaseService
+            self.firebase_service = firebase_service or FirebaseService()
+            self._writer = _create_durable_writer(
+                self.firebase_service.write_device_tokens_batch,
+                "device_tokens.jsonl",
+                serialize=dict,
+                deserialize=dict,
+                versioned=True
+            )
+            self._write_buffer = CoalescingWriteBuffer(
+                self._writer,
+                name="device-token-persistence",
+                window=settings.USER_WRITE_COALESCE_SECONDS
+            )
+            self._firebase_enabled = True
+        except Exception as e:
+            logger.warning(f"Firebase not available for device tokens: {e}")
+            self._firebase_enabled = False
+    
+    def register_token(self, user_id: str, token: str, platform: Optional[str] = None) -> bool:
+        """Registrar el token en memoria y persistirlo en background."""
+        changed = self.memory_repo.register_token(user_id, token, platform)
+        if changed and self._firebase_enabled:
+            self._write_buffer.put(token, {'deleted': False, 'user_id': user_id, 'platform': platform})
+        return changed
+    
+    def unregister_token(self, token: str) -> bool:
+        """Eliminar el token de memoria y de Firebase en background."""
+        removed = self.memory_repo.unregister_token(token)
+        if removed and self._firebase_enabled:
+            self._write_buffer.put(token, {'deleted': True})
+        return removed
+    
+    def get_tokens(self, user_id: str) -> List[str]:
+        """Obtener los tokens del usuario desde memoria."""
+        return self.memory_repo.get_tokens(user_id)
+    
+    def remove_tokens(self, tokens: List[str]) -> int:
+        """Eliminar varios tokens (los que FCM reporta inválidos)."""
+        return sum(1 for token in tokens if self.unregister_token(token))
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Métricas del buffer de escrituras de tokens."""
+        if not self._write_buffer:
+            return {}
+        return {**self._write_buffer.stats(), "durability": self._writer.stats()}
+    
+    def close(self) -> None:
+        """Escribir lo pendiente antes de apagar."""
+        if self._write_buffer:
+            self._write_buffer.close()
+            self._writer.close()
@@ -0,0 +1,122 @@
+"""
+Buffer circular para el historial de mensajes por sala.
+
+Permite acotar la memoria usada por el repositorio en memoria: cada sala
+conserva como máximo `capacity` elementos y el más antiguo se desaloja al
+insertar uno nuevo. Con `capacity=None` el buffer crece sin límite
+(comportamiento original).
+"""
+
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class RingBuffer:
+    """Buffer circular de capacidad fija con append O(1) y lectura de cola O(k)."""
+
+    __slots__ = ("_capacity", "_items", "_head", "_size")
+
+    def __init__(self, capacity: Optional[int] = None):
+        if capacity is not None and capacity <= 0:
+            raise ValueError("capacity must be a positive integer or None")
+        self._capacity = capacity
+        self._items: List[Any] = []
+        # Posición física del elemento más antiguo
+        self._head = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> Optional[int]:
+        return self._capacity
+
+    def append(self, item: Any) -> Optional[Any]:
+        """Agregar un elemento; retorna el elemento desalojado, si lo hay."""
+        if self._capacity is None or self._size < self._capacity:
+            # Todavía hay espacio: la lista crece de forma perezosa
+            self._items.append(item)
+            self._size += 1
+            return None
+
+        evicted = self._items[self._head]
+        self._items[self._head] = item
+        self._head = (self._head + 1) % self._capacity
+        return evicted
+
+    def insert_sorted(self, item: Any, key: Callable[[Any], Any]) -> Optional[Any]:
+        """Insertar manteniendo el orden por `key`; retorna el elemento desalojado.
+
+        Pensado para llegadas levemente desordenadas (p. ej. mensajes
+        replicados desde otro worker). Mientras el buffer no está lleno es un
+        `list.insert`; lleno, cuesta O(distancia a la cola).
+        """
+        if self._capacity is None or self._size < self._capacity:
+            # Sin desalojos la lista física está en orden lógico (_head == 0)
+            self._items.insert(self.bisect_right(key(item), key), item)
+            self._size += 1
+            return None
+
+        if key(item) < key(self[0]):
+            # Más antiguo que todo lo que cabe: no se conserva
+            return item
+
+        evicted = self.append(item)
+        index = self._size - 1
+        while index > 0 and key(self[index - 1]) > key(item):
+            self._set(index, self[index - 1])
+            index -= 1
+        self._set(index, item)
+        return evicted
+
+    def _set(self, index: int, item: Any) -> None:
+        self._items[(self._head + index) % len(self._items)] = item
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Any:
+        """Acceso por posición lógica (0 = más antiguo, -1 = más reciente)."""
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._head + index) % len(self._items)]
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(self._size):
+            yield self[index]
+
+    def __reversed__(self) -> Iterator[Any]:
+        for index in range(self._size - 1, -1, -1):
+            yield self[index]
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        """Retornar los elementos en las posiciones lógicas [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, self._size)
+        return [self[index] for index in range(start, stop)]
+
+    def tail(self, k: int) -> List[Any]:
+        """Retornar los últimos `k` elementos en orden de inserción."""
+        k = min(max(k, 0), self._size)
+        return self.slice(self._size - k, self._size)
+
+    def bisect_left(self, value: Any, key: Callable[[Any], Any]) -> int:
+        """Primera posición cuyo `key(item) >= value` (requiere orden por `key`)."""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(self[mid]) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, value: Any, key: Callable[[Any], Any]) -> int:
+        """Primera posición cuyo `key(item) > value` (requiere orden por `key`)."""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if value < key(self[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
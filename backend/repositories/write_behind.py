@@ -0,0 +1,337 @@
+"""
+Cola write-behind para persistencia en background.
+
+Reemplaza el patrón "un thread por escritura": las operaciones se encolan en
+una cola acotada y un pool fijo de workers las agrupa en lotes (hasta
+`batch_size` elementos o `flush_interval` segundos) que se entregan a una
+función de flush, por ejemplo un `WriteBatch` de Firestore.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Políticas cuando la cola está llena
+# Espera sincrónica: solo para productores que corren en threads, nunca en el event loop
+OVERFLOW_BLOCK = "block"          # Esperar hasta `put_timeout` y luego descartar
+OVERFLOW_DROP = "drop"            # Descartar el elemento nuevo
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Descartar el elemento más antiguo encolado
+
+_STOP = object()
+
+
+class _Chunk(list):
+    """Varios elementos encolados como una sola entrada (ver `put_many`)."""
+
+
+class WriteBehindQueue:
+    """Cola acotada drenada por un pool fijo de workers que escriben por lotes."""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], bool],
+        name: str = "write-behind",
+        max_size: int = 10000,
+        workers: int = 2,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        overflow_policy: str = OVERFLOW_DROP,
+        put_timeout: float = 0.05,
+        on_overflow: Optional[Callable[[Any], None]] = None
+    ):
+        if overflow_policy not in (OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self._flush_fn = flush_fn
+        self._name = name
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._overflow_policy = overflow_policy
+        self._put_timeout = put_timeout
+        # Destino opcional de los elementos descartados (p. ej. spill a disco)
+        self._on_overflow = on_overflow
+
+        # Métricas
+        self._stats_lock = threading.Lock()
+        self._enqueued = 0
+        self._dropped = 0
+        self._flushed = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def depth(self) -> int:
+        """Entradas pendientes de persistir (un `put_many` cuenta como una)."""
+        return self._queue.qsize()
+
+    def put(self, item: Any) -> bool:
+        """Encolar un elemento; retorna False si se descartó por backpressure."""
+        return self._put(item, 1)
+
+    def put_many(self, items: List[Any]) -> bool:
+        """Encolar varios elementos como una sola entrada (se escriben en el mismo lote).
+
+        Si superan `batch_size` se dividen en entradas de ese tamaño.
+        """
+        ok = True
+        for start in range(0, len(items), self._batch_size):
+            chunk = _Chunk(items[start:start + self._batch_size])
+            ok = self._put(chunk, len(chunk)) and ok
+        return ok
+
+    def _put(self, item: Any, count: int) -> bool:
+        if self._closed:
+            # Escrituras durante el apagado: al spill, como las que no entran en la cola
+            self._reject(item, count, "closed")
+            return False
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if not self._handle_overflow(item):
+                self._reject(item, count, "full")
+                return False
+
+        with self._stats_lock:
+            self._enqueued += count
+        return True
+
+    def _reject(self, item: Any, count: int, reason: str) -> None:
+        with self._stats_lock:
+            self._dropped += count
+            dropped = self._dropped
+        # Evitar inundar el log mientras dura la saturación
+        if dropped % 1000 < count:
+            logger.warning(f"{self._name} queue {reason}, dropped {dropped} writes so far")
+        self._spill(item)
+
+    def _spill(self, item: Any) -> None:
+        if not self._on_overflow:
+            return
+        for element in item if isinstance(item, _Chunk) else (item,):
+            self._on_overflow(element)
+
+    def _handle_overflow(self, item: Any) -> bool:
+        """Aplicar la política de overflow; retorna True si el elemento quedó encolado."""
+        if self._overflow_policy == OVERFLOW_BLOCK:
+            try:
+                self._queue.put(item, timeout=self._put_timeout)
+                return True
+            except queue.Full:
+                return False
+
+        if self._overflow_policy == OVERFLOW_DROP_OLDEST:
+            try:
+                oldest = self._queue.get_nowait()
+                with self._stats_lock:
+                    self._dropped += len(oldest) if isinstance(oldest, _Chunk) else 1
+                if oldest is not _STOP:
+                    self._spill(oldest)
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                return False
+
+        return False
+
+    def _worker_loop(self) -> None:
+        """Tomar lotes de la cola y persistirlos hasta recibir la señal de parada."""
+        # Entrada ya tomada de la cola que no entraba en el lote anterior
+        carry = None
+        while True:
+            item = carry if carry is not None else self._queue.get()
+            carry = None
+            if item is _STOP:
+                return
+
+            batch = list(item) if isinstance(item, _Chunk) else [item]
+            deadline = time.monotonic() + self._flush_interval
+            stop = False
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, _Chunk):
+                    if len(batch) + len(item) > self._batch_size:
+                        carry = item
+                        break
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[Any]) -> None:
+        start = time.perf_counter()
+        try:
+            ok = self._flush_fn(batch)
+        except Exception as e:
+            logger.warning(f"{self._name} flush raised: {e}")
+            ok = False
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._stats_lock:
+            self._batches += 1
+            self._last_flush_ms = elapsed_ms
+            self._total_flush_ms += elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            if ok:
+                self._flushed += len(batch)
+            else:
+                self._failed += len(batch)
+
+        if not ok:
+            logger.warning(f"{self._name} failed to persist batch of {len(batch)} items")
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de la cola: profundidad, contadores y latencia de flush."""
+        with self._stats_lock:
+            return {
+                "queue_depth": self.depth,
+                "enqueued": self._enqueued,
+                "dropped": self._dropped,
+                "flushed": self._flushed,
+                "failed": self._failed,
+                "batches": self._batches,
+                "last_flush_ms": round(self._last_flush_ms, 2),
+                "avg_flush_ms": round(self._total_flush_ms / self._batches, 2) if self._batches else 0.0,
+                "max_flush_ms": round(self._max_flush_ms, 2),
+            }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Drenar lo pendiente y detener los workers."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+
+
+class CoalescingWriteBuffer:
+    """Buffer last-write-wins indexado por clave.
+
+    Las operaciones pendientes sobre la misma clave (p. ej. un documento
+    `users/{id}`) se fusionan dentro de una ventana de `window` segundos y se
+    entregan a `flush_fn` como un único lote, evitando la amplificación de
+    escrituras cuando un cliente se reconecta repetidamente. Cada operación
+    lleva su `version` (epoch de la última escritura fusionada) para que un
+    replay del spill no pise escrituras posteriores (ver `DurableWriter`).
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Dict[str, Any]]], bool],
+        name: str = "coalescing-buffer",
+        window: float = 0.5,
+        max_batch: int = 500
+    ):
+        self._flush_fn = flush_fn
+        self._name = name
+        self._window = window
+        self._max_batch = max_batch
+
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+        # Métricas
+        self._operations = 0
+        self._coalesced = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, key: str, fields: Dict[str, Any], create: bool = False) -> None:
+        """Registrar una operación; los campos nuevos sobrescriben a los pendientes."""
+        with self._lock:
+            self._operations += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = {"id": key, "create": create, **fields, "version": time.time()}
+                return
+            self._coalesced += 1
+            pending.update(fields)
+            pending["create"] = pending["create"] or create
+            pending["version"] = time.time()
+
+    @property
+    def depth(self) -> int:
+        """Claves con escrituras pendientes."""
+        return len(self._pending)
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.wait(self._window):
+            self.flush()
+
+    def flush(self) -> None:
+        """Entregar todas las operaciones pendientes en lotes de `max_batch`."""
+        with self._lock:
+            if not self._pending:
+                return
+            operations = list(self._pending.values())
+            self._pending = {}
+
+        for start in range(0, len(operations), self._max_batch):
+            batch = operations[start:start + self._max_batch]
+            try:
+                ok = self._flush_fn(batch)
+            except Exception as e:
+                logger.warning(f"{self._name} flush raised: {e}")
+                ok = False
+            with self._lock:
+                self._batches += 1
+                if ok:
+                    self._written += len(batch)
+                else:
+                    self._failed += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas: operaciones recibidas, fusionadas y escrituras realizadas."""
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "operations": self._operations,
+                "coalesced": self._coalesced,
+                "written": self._written,
+                "failed": self._failed,
+                "batches": self._batches,
+            }
+
+    def close(self) -> None:
+        """Detener el thread de flush y escribir lo pendiente."""
+        self._stop_event.set()
+        self._thread.join(timeout=self._window + 1)
+        self.flush()
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List
-from models import MessageCreateRequest, MessageResponse
+import json
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
+from models import MessageCreateRequest, MessageResponse, MessageHistoryResponse, MessageRecord
 from services import ChatService
 
 router = APIRouter(prefix="/api/messages", tags=["messages"])
@@ -12,6 +13,16 @@ def get_chat_service() -> ChatService:
     return chat_service
 
 
+def _json_response(content: bytes) -> Response:
+    """Respuesta JSON ya codificada (sin pasar por la validación de pydantic)."""
+    return Response(content=content, media_type="application/json")
+
+
+def _encode_messages(messages: List[MessageRecord]) -> bytes:
+    """Arreglo JSON armado con el payload cacheado de cada mensaje."""
+    return b"[" + b",".join(message.payload_json for message in messages) + b"]"
+
+
 @router.post("/", response_model=MessageResponse)
 async def create_message(
     message_request: MessageCreateRequest,
@@ -24,42 +35,35 @@ async def create_message(
         if not message:
             raise HTTPException(status_code=400, detail="Failed to create message")
         
-        return MessageResponse(
-            id=message.id,
-            user_id=message.user_id,
-            user_name=message.user_name,
-            content=message.content,
-            message_type=message.message_type,
-            timestamp=message.timestamp,
-            room_id=message.room_id
-        )
+        return _json_response(message.payload_json)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/room/{room_id}", response_model=List[MessageResponse])
+@router.get("/room/{room_id}", response_model=MessageHistoryResponse)
 async def get_messages_by_room(
     room_id: str,
     limit: int = Query(50, ge=1, le=100, description="Número máximo de mensajes"),
+    before: Optional[int] = Query(None, ge=0, description="Cursor: mensajes con secuencia menor a este valor"),
+    after: Optional[int] = Query(None, ge=0, description="Cursor: mensajes con secuencia mayor a este valor"),
     chat_service: ChatService = Depends(get_chat_service)
 ):
-    """Obtener mensajes de una sala específica."""
+    """Obtener mensajes de una sala específica, paginando con cursores."""
     try:
-        messages = chat_service.get_messages_by_room(room_id, limit)
-        return [
-            MessageResponse(
-                id=message.id,
-                user_id=message.user_id,
-                user_name=message.user_name,
-                content=message.content,
-                message_type=message.message_type,
-                timestamp=message.timestamp,
-                room_id=message.room_id
-            )
-            for message in messages
-        ]
+        messages = chat_service.get_messages_by_room(room_id, limit, before, after)
+        
+        # El siguiente cursor continúa en la misma dirección de la consulta
+        next_cursor = None
+        if len(messages) == limit:
+            next_cursor = messages[-1].seq if after is not None else messages[0].seq
+        
+        # Mismo formato que `MessageHistoryResponse`, armado desde los bytes cacheados
+        return _json_response(
+            b'{"messages":' + _encode_messages(messages)
+            + b',"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -72,17 +76,6 @@ async def get_recent_messages(
     """Obtener mensajes recientes."""
     try:
         messages = chat_service.get_recent_messages(limit)
-        return [
-            MessageResponse(
-                id=message.id,
-                user_id=message.user_id,
-                user_name=message.user_name,
-                content=message.content,
-                message_type=message.message_type,
-                timestamp=message.timestamp,
-                room_id=message.room_id
-            )
-            for message in messages
-        ]
+        return _json_response(_encode_messages(messages))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
-from models import UserCreateRequest, UserResponse
+from models import UserCreateRequest, UserResponse, DeviceTokenRequest, DeviceTokenResponse
 from services import ChatService
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -72,3 +72,44 @@ async def get_user(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{user_id}/device-tokens", response_model=DeviceTokenResponse)
+async def register_device_token(
+    user_id: str,
+    token_request: DeviceTokenRequest,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Registrar un token FCM para recibir notificaciones push."""
+    try:
+        if not chat_service.register_device_token(user_id, token_request.token, token_request.platform):
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        return DeviceTokenResponse(
+            user_id=user_id,
+            token=token_request.token,
+            platform=token_request.platform
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{user_id}/device-tokens/{token}")
+async def unregister_device_token(
+    user_id: str,
+    token: str,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Eliminar un token FCM del usuario."""
+    try:
+        if token not in chat_service.get_device_tokens(user_id):
+            raise HTTPException(status_code=404, detail="Device token not found")
+        
+        chat_service.unregister_device_token(token)
+        return {"message": "Device token removed"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
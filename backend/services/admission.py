@@ -0,0 +1,196 @@
+"""
+Control de admisión para proteger el event loop bajo carga.
+
+- `EventLoopLagMonitor`: mide cada `interval` cuánto se retrasa un
+  `asyncio.sleep` (el lag del event loop) y lo suaviza con una media móvil.
+- `AdmissionController`: según el lag, el servidor está `ok`, `degraded` u
+  `overloaded`. El trabajo de baja prioridad (`get_users`, refrescos del
+  roster, fan-out de notificaciones, lecturas REST) se difiere mientras está
+  `degraded` y se descarta con un error `overloaded` explícito cuando está
+  `overloaded`. La entrega del chat (`send_message`, `join_chat`, `resume`)
+  nunca pasa por aquí.
+- `RateLimiter`: token bucket por clave (sid) para `send_message`.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LEVEL_OK = "ok"
+LEVEL_DEGRADED = "degraded"
+LEVEL_OVERLOADED = "overloaded"
+
+
+class EventLoopLagMonitor:
+    """Muestrea el lag del event loop en una tarea de fondo."""
+
+    def __init__(self, interval: float = 0.1, smoothing: float = 0.5):
+        self.interval = interval
+        self.smoothing = smoothing
+        # Media móvil exponencial del lag, en segundos
+        self.lag = 0.0
+        self.last_sample = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(time.monotonic() - expected, 0.0))
+
+    def record(self, sample: float) -> None:
+        self.last_sample = sample
+        self.max_lag = max(self.max_lag, sample)
+        self.lag += self.smoothing * (sample - self.lag)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lag_ms": round(self.lag * 1000, 2),
+            "last_sample_ms": round(self.last_sample * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+class AdmissionController:
+    """Decide si se acepta trabajo de baja prioridad según el lag del event loop."""
+
+    def __init__(
+        self,
+        monitor: EventLoopLagMonitor,
+        degraded_lag: float = 0.05,
+        overloaded_lag: float = 0.25,
+        max_defer: float = 1.0
+    ):
+        self.monitor = monitor
+        self.degraded_lag = degraded_lag
+        self.overloaded_lag = overloaded_lag
+        self.max_defer = max_defer
+
+        # Métricas por tipo de trabajo
+        self._deferred: Dict[str, int] = {}
+        self._shed: Dict[str, int] = {}
+
+    @property
+    def level(self) -> str:
+        lag = self.monitor.lag
+        if lag >= self.overloaded_lag:
+            return LEVEL_OVERLOADED
+        if lag >= self.degraded_lag:
+            return LEVEL_DEGRADED
+        return LEVEL_OK
+
+    def admit_now(self, work: str) -> bool:
+        """Admisión sin espera (usable desde threads): False si está `overloaded`."""
+        if self.level == LEVEL_OVERLOADED:
+            self._count(self._shed, work)
+            return False
+        return True
+
+    async def admit(self, work: str) -> bool:
+        """Difiere mientras el servidor está `degraded`; False si hay que descartar."""
+        if self.level == LEVEL_DEGRADED:
+            await self.defer(work)
+        return self.admit_now(work)
+
+    async def defer(self, work: str) -> None:
+        """Esperar a que el lag baje de `degraded_lag` (como mucho `max_defer`)."""
+        if self.level == LEVEL_OK:
+            return
+        self._count(self._deferred, work)
+        deadline = time.monotonic() + self.max_defer
+        while self.level != LEVEL_OK and time.monotonic() < deadline:
+            await asyncio.sleep(self.monitor.interval)
+
+    def overloaded_error(self, event: str) -> Dict[str, Any]:
+        """Payload del error que recibe el cliente cuando se descarta su pedido."""
+        return {
+            "message": "Server overloaded, try again later",
+            "code": LEVEL_OVERLOADED,
+            "event": event,
+            "retry_after_ms": int(self.max_defer * 1000),
+        }
+
+    @staticmethod
+    def _count(counter: Dict[str, int], work: str) -> None:
+        counter[work] = counter.get(work, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            **self.monitor.stats(),
+            "deferred": dict(self._deferred),
+            "shed": dict(self._shed),
+        }
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token bucket por clave: `rate` tokens por segundo, hasta `burst` acumulados.
+
+    Con `rate <= 0` no limita. Un pedido de más de `burst` tokens nunca se
+    acepta: quien llama debe rechazarlo antes (p. ej. lotes demasiado grandes).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.rejected = 0
+
+    def _refill(self, key: str) -> _TokenBucket:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def acquire(self, key: str, cost: float = 1) -> bool:
+        """Consumir `cost` tokens; False si no alcanzan."""
+        if self.rate <= 0:
+            return True
+        bucket = self._refill(key)
+        if bucket.tokens < cost:
+            self.rejected += 1
+            return False
+        bucket.tokens -= cost
+        return True
+
+    def retry_after(self, key: str, cost: float = 1) -> float:
+        """Segundos hasta que `key` tenga `cost` tokens."""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._refill(key)
+        return max(cost - bucket.tokens, 0.0) / self.rate
+
+    def forget(self, key: str) -> None:
+        self._buckets.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buckets": len(self._buckets), "rejected": self.rejected}
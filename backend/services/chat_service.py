@@ -1,10 +1,12 @@
-from typing import List, Optional
-from models import User, Message, ChatRoom, UserCreateRequest, MessageCreateRequest
+from typing import Any, Dict, List, Optional, Tuple
+from models import UserRecord, MessageRecord, ChatRoom, UserCreateRequest, MessageCreateRequest
 from repositories import (
-    IUserRepository, IMessageRepository, IChatRoomRepository,
-    InMemoryUserRepository, InMemoryMessageRepository, InMemoryChatRoomRepository
+    IUserRepository, IMessageRepository, IChatRoomRepository, IDeviceTokenRepository,
+    InMemoryUserRepository, InMemoryMessageRepository, InMemoryChatRoomRepository,
+    InMemoryDeviceTokenRepository
 )
-from observers import ChatEventSubject
+from observers import ISubject
+from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,15 +20,17 @@ class ChatService:
         user_repository: IUserRepository,
         message_repository: IMessageRepository,
         room_repository: IChatRoomRepository,
-        event_subject: ChatEventSubject
+        event_subject: ISubject,
+        device_token_repository: Optional[IDeviceTokenRepository] = None
     ):
         self.user_repository = user_repository
         self.message_repository = message_repository
         self.room_repository = room_repository
         self.event_subject = event_subject
+        self.device_token_repository = device_token_repository or InMemoryDeviceTokenRepository()
     
     # Métodos para usuarios
-    def create_user(self, user_request: UserCreateRequest, socket_id: Optional[str] = None) -> User:
+    def create_user(self, user_request: UserCreateRequest, socket_id: Optional[str] = None) -> UserRecord:
         """Crear un nuevo usuario."""
         try:
             user = self.user_repository.create_user(user_request.name, socket_id)
@@ -48,15 +52,15 @@ class ChatService:
             logger.error(f"Error creating user: {e}")
             raise
     
-    def get_user_by_id(self, user_id: str) -> Optional[User]:
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
         """Obtener usuario por ID."""
         return self.user_repository.get_user_by_id(user_id)
     
-    def get_user_by_socket_id(self, socket_id: str) -> Optional[User]:
+    def get_user_by_socket_id(self, socket_id: str) -> Optional[UserRecord]:
         """Obtener usuario por socket ID."""
         return self.user_repository.get_user_by_socket_id(socket_id)
     
-    def get_all_users(self) -> List[User]:
+    def get_all_users(self) -> List[UserRecord]:
         """Obtener todos los usuarios activos."""
         return self.user_repository.get_all_users()
     
@@ -73,7 +77,7 @@ class ChatService:
         
         return success
     
-    def disconnect_user(self, socket_id: str) -> Optional[User]:
+    def disconnect_user(self, socket_id: str) -> Optional[UserRecord]:
         """Desconectar un usuario por socket ID."""
         try:
             user = self.user_repository.get_user_by_socket_id(socket_id)
@@ -81,10 +85,8 @@ class ChatService:
                 # Desactivar usuario
                 self.user_repository.deactivate_user(user.id)
                 
-                # Remover de salas
-                rooms = self.room_repository.get_all_rooms()
-                for room in rooms:
-                    self.room_repository.remove_user_from_room(room.id, user.id)
+                # Remover solo de las salas en las que está (índice inverso)
+                self.room_repository.remove_user_from_all_rooms(user.id)
                 
                 # Notificar que el usuario salió
                 active_users = self.user_repository.get_all_users()
@@ -102,8 +104,47 @@ class ChatService:
             logger.error(f"Error disconnecting user: {e}")
             return None
     
+    def reap_inactive_users(self, ttl_seconds: float) -> int:
+        """Eliminar de memoria los usuarios desconectados hace más de `ttl_seconds`.
+
+        Sus tokens de dispositivo se dan de baja también (en memoria y, en
+        background, en Firestore): cada ingreso crea un usuario nuevo, así que
+        nadie más los volvería a usar.
+        """
+        reaped = self.user_repository.reap_inactive_users(ttl_seconds)
+        tokens = 0
+        for user_id in reaped:
+            tokens += self.device_token_repository.remove_tokens(self.device_token_repository.get_tokens(user_id))
+        if reaped:
+            logger.info(f"Reaped {len(reaped)} inactive users ({tokens} device tokens)")
+        return len(reaped)
+    
+    # Métodos para tokens de dispositivo
+    def register_device_token(self, user_id: str, token: str, platform: Optional[str] = None) -> bool:
+        """Registrar un token FCM para el usuario; False si el usuario no existe."""
+        if not self.user_repository.get_user_by_id(user_id):
+            logger.warning(f"Cannot register device token, user not found: {user_id}")
+            return False
+        self.device_token_repository.register_token(user_id, token, platform)
+        return True
+    
+    def unregister_device_token(self, token: str) -> bool:
+        """Eliminar un token FCM (p. ej. al cerrar sesión en el dispositivo)."""
+        return self.device_token_repository.unregister_token(token)
+    
+    def get_device_tokens(self, user_id: str) -> List[str]:
+        """Obtener los tokens FCM registrados para el usuario."""
+        return self.device_token_repository.get_tokens(user_id)
+    
+    def prune_device_tokens(self, tokens: List[str]) -> int:
+        """Eliminar tokens que FCM reportó como inválidos."""
+        pruned = self.device_token_repository.remove_tokens(tokens)
+        if pruned:
+            logger.info(f"Pruned {pruned} stale device tokens")
+        return pruned
+    
     # Métodos para mensajes
-    def create_message(self, user_id: str, message_request: MessageCreateRequest) -> Optional[Message]:
+    def create_message(self, user_id: str, message_request: MessageCreateRequest) -> Optional[MessageRecord]:
         """Crear un nuevo mensaje."""
         try:
             user = self.user_repository.get_user_by_id(user_id)
@@ -133,11 +174,57 @@ class ChatService:
             logger.error(f"Error creating message: {e}")
             return None
     
-    def get_messages_by_room(self, room_id: str, limit: int = 50) -> List[Message]:
-        """Obtener mensajes de una sala."""
-        return self.message_repository.get_messages_by_room(room_id, limit)
+    def create_messages(self, user_id: str, message_requests: List[MessageCreateRequest]) -> Optional[List[MessageRecord]]:
+        """Crear un lote de mensajes del mismo usuario.
+
+        Se insertan en el repositorio en una sola pasada (una escritura en lote
+        a Firebase) y se notifica un `messages_sent` por sala.
+        """
+        try:
+            user = self.user_repository.get_user_by_id(user_id)
+            if not user:
+                logger.warning(f"User not found: {user_id}")
+                return None
+            
+            messages = self.message_repository.create_messages(
+                user_id=user.id,
+                user_name=user.name,
+                items=[(request.content, request.room_id) for request in message_requests]
+            )
+            
+            # Notificar un evento por sala, conservando el orden de envío
+            by_room: Dict[str, List[MessageRecord]] = {}
+            for message in messages:
+                by_room.setdefault(message.room_id, []).append(message)
+            for room_id, room_messages in by_room.items():
+                self.event_subject.notify("messages_sent", {
+                    "messages": room_messages,
+                    "users": self._get_users_in_room(room_id),
+                    "room_id": room_id
+                })
+            
+            logger.info(f"{len(messages)} messages created by {user.name} in {len(by_room)} room(s)")
+            return messages
+            
+        except Exception as e:
+            logger.error(f"Error creating messages: {e}")
+            return None
+    
+    def get_messages_by_room(
+        self,
+        room_id: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[MessageRecord]:
+        """Obtener mensajes de una sala, opcionalmente paginando por cursor de secuencia."""
+        return self.message_repository.get_messages_by_room(room_id, limit, before, after)
+    
+    def get_missed_messages(self, room_id: str, last_seq: int) -> Optional[List[MessageRecord]]:
+        """Mensajes posteriores a `last_seq` para un cliente que se reconecta; None = resincronizar."""
+        return self.message_repository.get_missed_messages(room_id, last_seq, settings.RESUME_MAX_MESSAGES)
     
-    def get_recent_messages(self, limit: int = 50) -> List[Message]:
+    def get_recent_messages(self, limit: int = 50) -> List[MessageRecord]:
         """Obtener mensajes recientes."""
         return self.message_repository.get_recent_messages(limit)
     
@@ -161,26 +248,110 @@ class ChatService:
         """Sacar usuario de una sala."""
         return self.room_repository.remove_user_from_room(room_id, user_id)
     
-    def _get_users_in_room(self, room_id: str) -> List[User]:
+    # Réplicas de otros workers (modo cluster)
+    def configure_cluster(self, node_id: int, stride: int) -> None:
+        """Reservar para este worker los números de secuencia `seq % stride == node_id`."""
+        self.message_repository.set_sequence_partition(node_id, stride)
+    
+    def apply_replicated_user(self, user: UserRecord) -> Dict[str, Any]:
+        """Aplicar la entrada o salida de un usuario de otro worker; devuelve los datos del evento."""
+        self.user_repository.apply_replica(user)
+        if user.is_active:
+            self.room_repository.add_user_to_room("general", user)
+        else:
+            self.room_repository.remove_user_from_all_rooms(user.id)
+        return {
+            "user": user,
+            "users": self.user_repository.get_all_users()
+        }
+    
+    def get_cluster_snapshot(self, messages_per_room: int) -> Tuple[List[UserRecord], Dict[str, List[MessageRecord]]]:
+        """Estado para un worker que arranca: usuarios activos y los últimos mensajes de cada sala."""
+        rooms = {
+            room_id: self.message_repository.get_messages_by_room(room_id, limit=messages_per_room)
+            for room_id in self.message_repository.get_room_ids()
+        }
+        return self.user_repository.get_all_users(), rooms
+    
+    def apply_cluster_snapshot(self, users: List[UserRecord], rooms: Dict[str, List[MessageRecord]]) -> Dict[str, Any]:
+        """Cargar el snapshot de otro worker; devuelve los datos del `users_updated`."""
+        for user in users:
+            self.user_repository.apply_replica(user)
+            self.room_repository.add_user_to_room("general", user)
+        for room_id, messages in rooms.items():
+            for message in messages:
+                self.message_repository.add_replica(message)
+            if messages:
+                # Lo anterior al snapshot no está en memoria: un `resume` desde ahí resincroniza
+                self.message_repository.set_history_floor(room_id, messages[0].seq - 1)
+        return {"users": self.user_repository.get_all_users()}
+    
+    def apply_replicated_message(self, message: MessageRecord) -> Optional[Dict[str, Any]]:
+        """Registrar un mensaje de otro worker; None si ya se conocía."""
+        if not self.message_repository.add_replica(message):
+            return None
+        return {
+            "message": message,
+            "users": self._get_users_in_room(message.room_id),
+            "room_id": message.room_id
+        }
+    
+    def apply_replicated_messages(self, messages: List[MessageRecord]) -> Optional[Dict[str, Any]]:
+        """Registrar un lote de otro worker (una sala); None si ya se conocían todos."""
+        applied = [message for message in messages if self.message_repository.add_replica(message)]
+        if not applied:
+            return None
+        room_id = applied[0].room_id
+        return {
+            "messages": applied,
+            "users": self._get_users_in_room(room_id),
+            "room_id": room_id
+        }
+    
+    # Métricas y ciclo de vida
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas internas del servicio."""
+        return {
+            "message_persistence": self.message_repository.get_persistence_stats(),
+            "user_persistence": self.user_repository.get_persistence_stats(),
+            "device_token_persistence": self.device_token_repository.get_persistence_stats()
+        }
+    
+    def close(self) -> None:
+        """Drenar escrituras pendientes de los repositorios."""
+        self.message_repository.close()
+        self.user_repository.close()
+        self.device_token_repository.close()
+    
+    def _get_users_in_room(self, room_id: str) -> List[UserRecord]:
         """Obtener usuarios en una sala específica."""
-        room = self.room_repository.get_room_by_id(room_id)
-        if room:
-            return room.users
-        return []
+        return self.room_repository.get_users_in_room(room_id)
 
 
 # Factory para crear instancia del servicio de chat
-def create_chat_service(event_subject: ChatEventSubject, firebase_service=None) -> ChatService:
-    """Factory para crear una instancia del servicio de chat."""
+def create_chat_service(event_subject: ISubject, firebase_service=None) -> ChatService:
+    """Factory para crear una instancia del servicio de chat.
+
+    `firebase_service` puede ser una instancia de `FirebaseService` para
+    compartirla entre repositorios, o `True` para que cada uno cree la suya.
+    """
     if firebase_service:
         # Usar repositorios híbridos simples (memoria + Firebase background)
-        from repositories.hybrid_repositories import HybridUserRepository, HybridMessageRepository
-        user_repository = HybridUserRepository()
-        message_repository = HybridMessageRepository()
+        from repositories.hybrid_repositories import (
+            HybridUserRepository, HybridMessageRepository, HybridDeviceTokenRepository
+        )
+        shared_service = firebase_service if firebase_service is not True else None
+        user_repository = HybridUserRepository(firebase_service=shared_service)
+        message_repository = HybridMessageRepository(
+            room_capacity=settings.MESSAGE_HISTORY_CAPACITY,
+            firebase_service=shared_service
+        )
+        device_token_repository = HybridDeviceTokenRepository(firebase_service=shared_service)
     else:
         # Usar repositorios en memoria
         user_repository = InMemoryUserRepository()
-        message_repository = InMemoryMessageRepository()
+        message_repository = InMemoryMessageRepository(room_capacity=settings.MESSAGE_HISTORY_CAPACITY)
+        device_token_repository = InMemoryDeviceTokenRepository()
     
     room_repository = InMemoryChatRoomRepository()
     
@@ -188,5 +359,6 @@ def create_chat_service(event_subject: ChatEventSubject, firebase_service=None)
         user_repository=user_repository,
         message_repository=message_repository,
         room_repository=room_repository,
-        event_subject=event_subject
+        event_subject=event_subject,
+        device_token_repository=device_token_repository
     )
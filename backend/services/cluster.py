@@ -0,0 +1,231 @@
+"""
+Modo cluster: varios workers detrás del mismo puerto.
+
+Dos piezas comparten la conexión al `IPCBrokerClient`:
+
+- `IPCClientManager`: client manager de Socket.IO sobre el broker (como
+  `AsyncRedisManager`, pero sin servicios externos). Un `sio.emit` a una sala
+  o a un sid llega a los clientes conectados en cualquier worker.
+- `ClusterReplicator`: observador que publica los eventos del chat de este
+  worker y aplica los de los demás (usuarios, roster, mensajes) a través del
+  `ChatService`, para que cada worker tenga el estado completo. Luego vuelve
+  a notificar el evento marcado con `replicated`, así el `SocketIOObserver`
+  de cada worker lo entrega a sus clientes locales (`ignore_queue`) y el
+  `NotificationObserver` lo ignora (los push los envía el worker de origen).
+
+Un worker que arranca (o se reinicia) con otros ya en marcha pide un
+snapshot al conectarse: el primer worker sincronizado que responde le manda
+los usuarios activos y los últimos mensajes de cada sala, y el resto de las
+respuestas se descarta. Si nadie responde dentro de `snapshot_timeout` se
+asume que es el primero. Lo anterior al snapshot no está en memoria, así que
+un `resume` desde ahí pide resincronizar.
+
+Los payloads viajan en msgpack y los registros como `to_dict()`: nada de lo
+que llega por el broker se deserializa como objeto Python arbitrario.
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import msgpack
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from models import MessageRecord, UserRecord
+from observers import IAsyncObserver, ISubject
+from services.ipc_broker import IPCBrokerClient
+
+if TYPE_CHECKING:
+    from services.chat_service import ChatService
+
+logger = logging.getLogger(__name__)
+
+REPLICATED_EVENTS = ("message_sent", "messages_sent", "user_joined", "user_left")
+
+
+class IPCClientManager(AsyncPubSubManager):
+    """Client manager de Socket.IO que reparte las emisiones por el broker IPC."""
+
+    name = "ipc"
+
+    def __init__(self, client: IPCBrokerClient, channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.client = client
+
+    async def _publish(self, data):
+        # Los sets (p. ej. `skip_sid`) viajan como listas
+        await self.client.publish(self.channel, msgpack.packb(data, default=list))
+
+    async def _listen(self):
+        queue = await self.client.subscribe(self.channel)
+        while True:
+            body = await queue.get()
+            try:
+                message = msgpack.unpackb(body)
+            except Exception as e:
+                logger.error(f"Invalid IPC client manager message: {e}")
+                continue
+            # `AsyncPubSubManager` usa los dicts tal cual (sin pickle)
+            if isinstance(message, dict):
+                yield message
+
+
+class ClusterReplicator(IAsyncObserver):
+    """Replica el estado del chat entre los workers conectados al broker."""
+
+    def __init__(
+        self,
+        client: IPCBrokerClient,
+        chat_service: "ChatService",
+        event_subject: ISubject,
+        seq_stride: int = 1024,
+        channel: str = "chat-state",
+        snapshot_timeout: float = 1.0,
+        snapshot_messages: int = 500
+    ):
+        self.client = client
+        self.chat_service = chat_service
+        self.event_subject = event_subject
+        self.seq_stride = seq_stride
+        self.channel = channel
+        self.snapshot_timeout = snapshot_timeout
+        # Mensajes por sala en cada snapshot
+        self.snapshot_messages = snapshot_messages
+        self._listen_task: Optional[asyncio.Task] = None
+        # Tiene el estado del cluster (snapshot recibido o ningún par respondió)
+        self._synced = asyncio.Event()
+
+        # Métricas
+        self.published = 0
+        self.applied = 0
+        self.duplicates = 0
+        self.snapshots_sent = 0
+        self.snapshot_received = False
+
+    async def start(self) -> int:
+        """Conectarse al broker, reservar la partición de secuencias, escuchar y
+        cargar el estado de los workers que ya estaban corriendo."""
+        queue = await self.client.subscribe(self.channel)
+        node_id = await self.client.start()
+        if node_id >= self.seq_stride:
+            raise RuntimeError(f"Node id {node_id} exceeds CLUSTER_SEQ_STRIDE ({self.seq_stride})")
+        self.chat_service.configure_cluster(node_id, self.seq_stride)
+        self._listen_task = asyncio.create_task(self._listen(queue))
+        await self._request_snapshot()
+        return node_id
+
+    async def _request_snapshot(self) -> None:
+        if await self._publish("snapshot_request", None):
+            try:
+                await asyncio.wait_for(self._synced.wait(), self.snapshot_timeout)
+            except asyncio.TimeoutError:
+                logger.info("No cluster peer answered the snapshot request, starting with empty state")
+        self._synced.set()
+
+    async def _send_snapshot(self, node_id: int) -> None:
+        users, rooms = self.chat_service.get_cluster_snapshot(self.snapshot_messages)
+        record = {
+            "to": node_id,
+            "users": [user.to_dict() for user in users],
+            "rooms": {room_id: [message.to_dict() for message in messages] for room_id, messages in rooms.items()},
+        }
+        if await self._publish("snapshot", record):
+            self.snapshots_sent += 1
+            logger.info(f"Sent cluster snapshot to node {node_id} ({len(users)} users, {len(rooms)} rooms)")
+
+    def _apply_snapshot(self, record: Dict[str, Any]) -> None:
+        if record["to"] != self.client.node_id or self._synced.is_set():
+            # Dirigido a otro worker, o ya respondió otro par
+            return
+        users = [UserRecord.from_dict(user) for user in record["users"]]
+        rooms = {
+            room_id: [MessageRecord.from_dict(message) for message in messages]
+            for room_id, messages in record["rooms"].items()
+        }
+        data = self.chat_service.apply_cluster_snapshot(users, rooms)
+        self.snapshot_received = True
+        self._synced.set()
+        logger.info(f"Loaded cluster snapshot ({len(users)} users, {len(rooms)} rooms)")
+        data["replicated"] = True
+        self.event_subject.notify("users_updated", data)
+
+    async def _publish(self, event_type: str, record: Any) -> bool:
+        body = msgpack.packb({"node": self.client.node_id, "event": event_type, "record": record})
+        return await self.client.publish(self.channel, body)
+
+    async def close(self) -> None:
+        if self._listen_task:
+            self._listen_task.cancel()
+        await self.client.close()
+
+    def update(self, event_type: str, data: Dict[str, Any]) -> None:
+        asyncio.create_task(self.async_update(event_type, data))
+
+    async def async_update(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Publicar los eventos originados en este worker."""
+        if data.get("replicated") or event_type not in REPLICATED_EVENTS:
+            return
+        if event_type == "message_sent":
+            record = data.get("message")
+        elif event_type == "messages_sent":
+            record = data.get("messages")
+        else:
+            record = data.get("user")
+        if not record:
+            return
+        if isinstance(record, list):
+            record = [message.to_dict() for message in record]
+        else:
+            record = record.to_dict()
+        if await self._publish(event_type, record):
+            self.published += 1
+
+    async def _listen(self, queue: asyncio.Queue) -> None:
+        while True:
+            body = await queue.get()
+            try:
+                self._apply(msgpack.unpackb(body))
+            except Exception as e:
+                logger.error(f"Error applying replicated event: {e}")
+
+    def _apply(self, envelope: Dict[str, Any]) -> None:
+        if envelope["node"] == self.client.node_id:
+            return
+        event_type = envelope["event"]
+        record = envelope["record"]
+        if event_type == "snapshot_request":
+            # Solo responde quien ya tiene el estado del cluster
+            if self._synced.is_set():
+                asyncio.create_task(self._send_snapshot(envelope["node"]))
+            return
+        if event_type == "snapshot":
+            self._apply_snapshot(record)
+            return
+        if event_type == "message_sent":
+            data = self.chat_service.apply_replicated_message(MessageRecord.from_dict(record))
+        elif event_type == "messages_sent":
+            data = self.chat_service.apply_replicated_messages([MessageRecord.from_dict(item) for item in record])
+        elif event_type in REPLICATED_EVENTS:
+            data = self.chat_service.apply_replicated_user(UserRecord.from_dict(record))
+        else:
+            return
+
+        if data is None:
+            self.duplicates += 1
+            return
+        self.applied += 1
+        data["replicated"] = True
+        self.event_subject.notify(event_type, data)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "node_id": self.client.node_id,
+            "published": self.published,
+            "applied": self.applied,
+            "duplicates": self.duplicates,
+            "snapshots_sent": self.snapshots_sent,
+            "snapshot_received": self.snapshot_received,
+        }
+        if self.client.broker is not None:
+            stats["broker"] = self.client.broker.stats()
+        return stats
@@ -1,89 +1,186 @@
 """
-Wrapper asíncrono para FirebaseService
+Servicio Firebase asíncrono.
+
+Las operaciones de Firestore usan el `AsyncClient` nativo sobre el event loop,
+limitadas por un semáforo configurable en lugar de un pool de 4 threads. Solo
+FCM, que no tiene API asíncrona, sigue pasando por un executor.
 """
 
 import asyncio
+import logging
 from typing import List, Optional
 from concurrent.futures import ThreadPoolExecutor
 
+from config import settings
 from services.firebase_service import FirebaseService as SyncFirebaseService
+from services.firebase_client import firebase_registry
 from models import User, Message
 
+logger = logging.getLogger(__name__)
+
+
 class AsyncFirebaseService:
-    """Wrapper asíncrono para el servicio Firebase síncrono."""
-    
-    def __init__(self):
-        self._sync_service = SyncFirebaseService()
-        self._executor = ThreadPoolExecutor(max_workers=4)
-    
+    """Servicio Firebase asíncrono: Firestore nativo + FCM en executor."""
+
+    def __init__(
+        self,
+        sync_service: Optional[SyncFirebaseService] = None,
+        max_concurrency: Optional[int] = None,
+        fcm_workers: Optional[int] = None
+    ):
+        # El servicio síncrono aporta la conversión documento <-> modelo y FCM
+        self._sync_service = sync_service or SyncFirebaseService()
+        self._registry = firebase_registry
+        self._max_concurrency = max_concurrency or settings.FIRESTORE_MAX_CONCURRENCY
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._executor = ThreadPoolExecutor(max_workers=fcm_workers or settings.FCM_EXECUTOR_WORKERS)
+
+    @property
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Se crea dentro del event loop que la usa
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self._max_concurrency)
+        return self._limiter
+
+    @property
+    def _db(self):
+        if not self._registry.initialize():
+            return None
+        return self._registry.async_db
+
     async def create_user(self, user: User) -> bool:
         """Crear usuario de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.create_user, 
-            user
-        )
-    
+        try:
+            db = self._db
+            if not db:
+                logger.info(f"Firebase not initialized. Would create user: {user.name}")
+                return True
+
+            async with self._semaphore:
+                await db.collection('users').document(user.id).set(self._sync_service._user_to_document(user))
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to create user in Firestore: {e}")
+            return False
+
     async def get_user(self, user_id: str) -> Optional[User]:
         """Obtener usuario de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.get_user, 
-            user_id
-        )
-    
+        try:
+            db = self._db
+            if not db:
+                return None
+
+            async with self._semaphore:
+                doc = await db.collection('users').document(user_id).get()
+            if doc.exists:
+                return self._sync_service._document_to_user(doc.to_dict())
+            return None
+
+        except Exception as e:
+            logger.error(f"Failed to get user from Firestore: {e}")
+            return None
+
     async def save_message(self, message: Message) -> bool:
         """Guardar mensaje de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.save_message, 
-            message
-        )
-    
-    async def get_messages_by_room(self, room: str, limit: int = 50) -> List[Message]:
+        try:
+            db = self._db
+            if not db:
+                logger.info(f"Firebase not initialized. Would save message: {message.content}")
+                return True
+
+            async with self._semaphore:
+                await db.collection('messages').document(message.id).set(
+                    self._sync_service._message_to_document(message)
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to save message to Firestore: {e}")
+            return False
+
+    async def get_messages_by_room(
+        self,
+        room: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[Message]:
         """Obtener mensajes de una sala de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.get_messages_by_room, 
-            room, 
-            limit
-        )
-    
+        try:
+            db = self._db
+            if not db:
+                logger.info(f"Firebase not initialized. Would get messages for room: {room}")
+                return []
+
+            query = self._sync_service._room_messages_query(db, room, limit, before, after)
+            async with self._semaphore:
+                messages = [
+                    self._sync_service._document_to_message(doc.to_dict())
+                    async for doc in query.stream()
+                ]
+
+            # Retornar en orden cronológico
+            if after is not None:
+                return messages
+            return list(reversed(messages))
+
+        except Exception as e:
+            logger.error(f"Failed to get messages from Firestore: {e}")
+            return []
+
     async def get_users_by_room(self, room: str) -> List[User]:
         """Obtener usuarios de una sala de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.get_users_by_room, 
-            room
-        )
-    
+        try:
+            db = self._db
+            if not db:
+                logger.info(f"Firebase not initialized. Would get users for room: {room}")
+                return []
+
+            query = db.collection('users')\
+                .where('room', '==', room)\
+                .where('is_active', '==', True)
+            async with self._semaphore:
+                return [
+                    self._sync_service._document_to_user(doc.to_dict())
+                    async for doc in query.stream()
+                ]
+
+        except Exception as e:
+            logger.error(f"Failed to get users from Firestore: {e}")
+            return []
+
     async def update_user_status(self, user_id: str, is_online: bool) -> bool:
         """Actualizar estado del usuario de forma asíncrona."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.update_user_status, 
-            user_id, 
-            is_online
-        )
-    
+        try:
+            db = self._db
+            if not db:
+                logger.info(f"Firebase not initialized. Would update user {user_id} status to {is_online}")
+                return True
+
+            async with self._semaphore:
+                await db.collection('users').document(user_id).update({
+                    'is_online': is_online,
+                    'last_seen': self._registry.firestore.SERVER_TIMESTAMP
+                })
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to update user status: {e}")
+            return False
+
     async def send_notification(self, token: str, title: str, body: str, data: dict = None) -> bool:
-        """Enviar notificación de forma asíncrona."""
-        loop = asyncio.get_event_loop()
+        """Enviar notificación de forma asíncrona (FCM no tiene API async: usa el executor)."""
+        loop = asyncio.get_running_loop()
         return await loop.run_in_executor(
-            self._executor, 
-            self._sync_service.send_notification, 
-            token, 
-            title, 
-            body, 
+            self._executor,
+            self._sync_service.send_notification,
+            token,
+            title,
+            body,
             data
         )
-    
+
     def __del__(self):
         """Cleanup del executor."""
         if hasattr(self, '_executor'):
@@ -0,0 +1,97 @@
+"""
+Registro de proceso para el cliente de Firebase.
+
+Todas las instancias de `FirebaseService` (repositorios híbridos, wrapper
+asíncrono, notificaciones) comparten una única app de Firebase y un único
+cliente de Firestore. La inicialización es perezosa: importar el módulo no
+toca credenciales ni carga el SDK; eso ocurre en `initialize()`, que la
+aplicación llama desde el hook `lifespan` de FastAPI.
+"""
+
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FirebaseClientRegistry:
+    """Registro compartido de la app y el cliente de Firebase - Patrón Singleton."""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FirebaseClientRegistry, cls).__new__(cls)
+            cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        self._lock = threading.Lock()
+        self._attempted = False
+        self._initialized = False
+        self.app = None
+        self.db = None
+        self._async_db = None
+        # Módulos del SDK, cargados al inicializar
+        self.firestore = None
+        self.messaging = None
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._initialized
+
+    def initialize(self) -> bool:
+        """Inicializar Firebase Admin SDK una sola vez; retorna si quedó disponible."""
+        if self._attempted:
+            return self._initialized
+
+        with self._lock:
+            if self._attempted:
+                return self._initialized
+            self._attempted = True
+
+            try:
+                import firebase_admin
+                from firebase_admin import credentials, firestore, messaging
+
+                self.firestore = firestore.firestore
+                self.messaging = messaging
+
+                # Verificar si ya hay una app inicializada
+                if firebase_admin._apps:
+                    self.app = firebase_admin.get_app()
+                else:
+                    # Inicializar desde archivo de credenciales
+                    cred_path = './firebase-adminsdk.json'
+                    if not os.path.exists(cred_path):
+                        logger.error("Firebase credentials file not found")
+                        return False
+                    cred = credentials.Certificate(cred_path)
+                    self.app = firebase_admin.initialize_app(cred, {
+                        'databaseURL': os.getenv('FIREBASE_DATABASE_URL')
+                    })
+
+                # Inicializar cliente Firestore
+                self.db = firestore.client(app=self.app)
+                self._initialized = True
+                logger.info("Firebase initialized successfully")
+
+            except Exception as e:
+                logger.error(f"Failed to initialize Firebase: {e}")
+                self._initialized = False
+
+            return self._initialized
+
+    @property
+    def async_db(self):
+        """Cliente `AsyncClient` de Firestore, creado la primera vez que se usa."""
+        if self._async_db is None and self._initialized:
+            with self._lock:
+                if self._async_db is None:
+                    from firebase_admin import firestore_async
+                    self._async_db = firestore_async.client(app=self.app)
+        return self._async_db
+
+
+# Instancia global del registro
+firebase_registry = FirebaseClientRegistry()
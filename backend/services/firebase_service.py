@@ -2,55 +2,40 @@
 Servicio de Firebase corregido sin operaciones async incorrectas
 """
 
-import os
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
 
-import firebase_admin
-from firebase_admin import credentials, firestore, messaging
-from firebase_admin.firestore import firestore as firestore_module
-
 from models import User, Message
+from services.firebase_client import firebase_registry
 
 logger = logging.getLogger(__name__)
 
+# Límite de operaciones por commit de WriteBatch en Firestore
+MAX_BATCH_WRITES = 500
+
+# Límite de tokens por envío multicast de FCM
+MAX_MULTICAST_TOKENS = 500
+
 
 class FirebaseService:
-    """Servicio para manejar Firebase Firestore y Cloud Messaging."""
+    """Servicio para manejar Firebase Firestore y Cloud Messaging.
+
+    Crear instancias es barato: todas comparten el cliente del
+    `firebase_registry`, que se inicializa una sola vez por proceso.
+    """
     
     def __init__(self):
-        self._app = None
-        self._db = None
-        self._initialized = False
-        self._initialize()
+        self._registry = firebase_registry
     
-    def _initialize(self):
-        """Inicializar Firebase Admin SDK."""
-        try:
-            # Verificar si ya hay una app inicializada
-            if firebase_admin._apps:
-                self._app = firebase_admin.get_app()
-            else:
-                # Inicializar desde archivo de credenciales
-                cred_path = './firebase-adminsdk.json'
-                if os.path.exists(cred_path):
-                    cred = credentials.Certificate(cred_path)
-                    self._app = firebase_admin.initialize_app(cred, {
-                        'databaseURL': os.getenv('FIREBASE_DATABASE_URL')
-                    })
-                else:
-                    logger.error("Firebase credentials file not found")
-                    return
-            
-            # Inicializar cliente Firestore
-            self._db = firestore.client(app=self._app)
-            self._initialized = True
-            logger.info("Firebase initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize Firebase: {e}")
-            self._initialized = False
+    @property
+    def _initialized(self) -> bool:
+        # Inicialización perezosa si el lifespan todavía no la hizo
+        return self._registry.initialize()
+    
+    @property
+    def _db(self):
+        return self._registry.db
     
     def create_user(self, user: User) -> bool:
         """Crear usuario en Firestore (sincrónico)."""
@@ -59,18 +44,8 @@ class FirebaseService:
                 logger.info(f"Firebase not initialized. Would create user: {user.name}")
                 return True
             
-            user_data = {
-                'id': user.id,
-                'name': user.name,
-                'room': user.room,
-                'is_online': user.is_online,
-                'is_active': user.is_active,
-                'created_at': firestore_module.SERVER_TIMESTAMP,
-                'last_seen': firestore_module.SERVER_TIMESTAMP
-            }
-            
             # Operación síncrona
-            self._db.collection('users').document(user.id).set(user_data)
+            self._db.collection('users').document(user.id).set(self._user_to_document(user))
             logger.info(f"User {user.name} created in Firestore")
             return True
             
@@ -86,20 +61,79 @@ class FirebaseService:
             
             doc = self._db.collection('users').document(user_id).get()
             if doc.exists:
-                data = doc.to_dict()
-                return User(
-                    id=data['id'],
-                    name=data['name'],
-                    room=data.get('room', 'general'),
-                    is_online=data.get('is_online', True),
-                    is_active=data.get('is_active', True)
-                )
+                return self._document_to_user(doc.to_dict())
             return None
             
         except Exception as e:
             logger.error(f"Failed to get user from Firestore: {e}")
             return None
     
+    # Conversión entre modelos y documentos (compartida con el cliente asíncrono)
+    def _user_to_document(self, user: User) -> dict:
+        """Convertir un usuario al documento que se guarda en Firestore."""
+        return {
+            'id': user.id,
+            'name': user.name,
+            'room': user.room,
+            'is_online': user.is_online,
+            'is_active': user.is_active,
+            'created_at': self._registry.firestore.SERVER_TIMESTAMP,
+            'last_seen': self._registry.firestore.SERVER_TIMESTAMP
+        }
+    
+    @staticmethod
+    def _document_to_user(data: dict) -> User:
+        return User(
+            id=data['id'],
+            name=data['name'],
+            room=data.get('room', 'general'),
+            is_online=data.get('is_online', True),
+            is_active=data.get('is_active', True)
+        )
+    
+    @staticmethod
+    def _document_to_message(data: dict) -> Message:
+        return Message(
+            id=data['id'],
+            content=data['content'],
+            user_id=data['user_id'],
+            user_name=data['user_name'],
+            room_id=data['room'],
+            seq=data.get('seq', 0),
+            timestamp=data['timestamp'],
+            message_type=data.get('message_type', 'text')
+        )
+    
+    def _room_messages_query(self, db, room: str, limit: int, before: Optional[int], after: Optional[int]):
+        """Construir la consulta paginada por cursores de secuencia.
+
+        Con `after` se avanza en orden ascendente; si no, se lee desde la cola
+        en orden descendente y el llamador debe invertir el resultado.
+        """
+        query = db.collection('messages').where('room', '==', room)
+        if after is not None:
+            query = query.where('seq', '>', after)
+        if before is not None:
+            query = query.where('seq', '<', before)
+        
+        firestore = self._registry.firestore
+        direction = firestore.Query.ASCENDING if after is not None else firestore.Query.DESCENDING
+        return query.order_by('seq', direction=direction).limit(limit)
+    
+    def _message_to_document(self, message: Message) -> dict:
+        """Convertir un mensaje al documento que se guarda en Firestore."""
+        return {
+            'id': message.id,
+            'content': message.content,
+            'user_id': message.user_id,
+            'user_name': message.user_name,
+            'room': message.room_id,
+            'seq': message.seq,
+            'timestamp': message.timestamp,
+            'message_type': message.message_type,
+            'created_at': self._registry.firestore.SERVER_TIMESTAMP
+        }
+    
     def save_message(self, message: Message) -> bool:
         """Guardar mensaje en Firestore (sincrónico)."""
         try:
@@ -107,19 +141,8 @@ class FirebaseService:
                 logger.info(f"Firebase not initialized. Would save message: {message.content}")
                 return True
             
-            message_data = {
-                'id': message.id,
-                'content': message.content,
-                'user_id': message.user_id,
-                'user_name': message.user_name,
-                'room': message.room,
-                'timestamp': message.timestamp,
-                'message_type': message.message_type,
-                'created_at': firestore_module.SERVER_TIMESTAMP
-            }
-            
             # Operación síncrona
-            self._db.collection('messages').document(message.id).set(message_data)
+            self._db.collection('messages').document(message.id).set(self._message_to_document(message))
             logger.info(f"Message {message.id} saved to Firestore")
             return True
             
@@ -127,36 +150,52 @@ class FirebaseService:
             logger.error(f"Failed to save message to Firestore: {e}")
             return False
     
-    def get_messages_by_room(self, room: str, limit: int = 50) -> List[Message]:
-        """Obtener mensajes de una sala específica (sincrónico)."""
+    def save_messages_batch(self, messages: List[Message]) -> bool:
+        """Guardar varios mensajes con commits de `WriteBatch` (sincrónico)."""
+        try:
+            if not self._initialized or not self._db:
+                logger.info(f"Firebase not initialized. Would save {len(messages)} messages")
+                return True
+            
+            collection = self._db.collection('messages')
+            for start in range(0, len(messages), MAX_BATCH_WRITES):
+                batch = self._db.batch()
+                for message in messages[start:start + MAX_BATCH_WRITES]:
+                    batch.set(collection.document(message.id), self._message_to_document(message))
+                batch.commit()
+            
+            logger.debug(f"{len(messages)} messages saved to Firestore")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to save message batch to Firestore: {e}")
+            return False
+    
+    def get_messages_by_room(
+        self,
+        room: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None
+    ) -> List[Message]:
+        """Obtener mensajes de una sala específica (sincrónico).
+
+        Acepta los mismos cursores de secuencia que el repositorio en memoria.
+        """
         try:
             if not self._initialized or not self._db:
                 logger.info(f"Firebase not initialized. Would get messages for room: {room}")
                 return []
             
             # Query síncrono
-            messages_ref = self._db.collection('messages')\
-                .where('room', '==', room)\
-                .order_by('timestamp', direction=firestore.Query.DESCENDING)\
-                .limit(limit)
-            
+            messages_ref = self._room_messages_query(self._db, room, limit, before, after)
             docs = messages_ref.stream()
             
-            messages = []
-            for doc in docs:
-                data = doc.to_dict()
-                message = Message(
-                    id=data['id'],
-                    content=data['content'],
-                    user_id=data['user_id'],
-                    user_name=data['user_name'],
-                    room=data['room'],
-                    timestamp=data['timestamp'],
-                    message_type=data.get('message_type', 'text')
-                )
-                messages.append(message)
+            messages = [self._document_to_message(doc.to_dict()) for doc in docs]
             
             # Retornar en orden cronológico
+            if after is not None:
+                return messages
             return list(reversed(messages))
             
         except Exception as e:
@@ -177,19 +216,7 @@ class FirebaseService:
             
             docs = users_ref.stream()
             
-            users = []
-            for doc in docs:
-                data = doc.to_dict()
-                user = User(
-                    id=data['id'],
-                    name=data['name'],
-                    room=data['room'],
-                    is_online=data.get('is_online', True),
-                    is_active=data.get('is_active', True)
-                )
-                users.append(user)
-            
-            return users
+            return [self._document_to_user(doc.to_dict()) for doc in docs]
             
         except Exception as e:
             logger.error(f"Failed to get users from Firestore: {e}")
@@ -204,7 +231,7 @@ class FirebaseService:
             
             self._db.collection('users').document(user_id).update({
                 'is_online': is_online,
-                'last_seen': firestore_module.SERVER_TIMESTAMP
+                'last_seen': self._registry.firestore.SERVER_TIMESTAMP
             })
             
             logger.info(f"User {user_id} status updated to {is_online}")
@@ -214,6 +241,69 @@ class FirebaseService:
             logger.error(f"Failed to update user status: {e}")
             return False
     
+    def write_users_batch(self, operations: List[dict]) -> bool:
+        """Aplicar operaciones de usuario ya fusionadas en un `WriteBatch` (sincrónico).
+
+        Cada operación trae `id`, `create`, `version` y los campos a escribir.
+        Todas se fusionan con el documento existente (un replay del spill no
+        borra campos escritos después); las creaciones agregan `created_at`.
+        """
+        try:
+            if not self._initialized or not self._db:
+                logger.info(f"Firebase not initialized. Would write {len(operations)} user documents")
+                return True
+            
+            collection = self._db.collection('users')
+            for start in range(0, len(operations), MAX_BATCH_WRITES):
+                batch = self._db.batch()
+                for operation in operations[start:start + MAX_BATCH_WRITES]:
+                    data = {key: value for key, value in operation.items() if key not in ('create', 'version')}
+                    data['last_seen'] = self._registry.firestore.SERVER_TIMESTAMP
+                    if operation.get('create'):
+                        data['created_at'] = self._registry.firestore.SERVER_TIMESTAMP
+                    batch.set(collection.document(operation['id']), data, merge=True)
+                batch.commit()
+            
+            logger.debug(f"{len(operations)} user documents written to Firestore")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to write user batch to Firestore: {e}")
+            return False
+    
+    def write_device_tokens_batch(self, operations: List[dict]) -> bool:
+        """Aplicar altas y bajas de tokens de dispositivo en un `WriteBatch` (sincrónico).
+
+        Cada operación trae `id` (el token, que es el ID del documento),
+        `deleted` y, para las altas, `user_id` y `platform`.
+        """
+        try:
+            if not self._initialized or not self._db:
+                logger.info(f"Firebase not initialized. Would write {len(operations)} device tokens")
+                return True
+            
+            collection = self._db.collection('device_tokens')
+            for start in range(0, len(operations), MAX_BATCH_WRITES):
+                batch = self._db.batch()
+                for operation in operations[start:start + MAX_BATCH_WRITES]:
+                    document = collection.document(operation['id'])
+                    if operation.get('deleted'):
+                        batch.delete(document)
+                    else:
+                        batch.set(document, {
+                            'user_id': operation['user_id'],
+                            'platform': operation.get('platform'),
+                            'updated_at': self._registry.firestore.SERVER_TIMESTAMP
+                        })
+                batch.commit()
+            
+            logger.debug(f"{len(operations)} device token operations written to Firestore")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to write device tokens to Firestore: {e}")
+            return False
+    
     def send_notification(self, token: str, title: str, body: str, data: dict = None) -> bool:
         """Enviar notificación push usando Firebase Cloud Messaging."""
         try:
@@ -221,6 +311,7 @@ class FirebaseService:
                 logger.info(f"Firebase not initialized. Would send notification: {title}")
                 return True
             
+            messaging = self._registry.messaging
             message = messaging.Message(
                 notification=messaging.Notification(
                     title=title,
@@ -237,3 +328,71 @@ class FirebaseService:
         except Exception as e:
             logger.error(f"Failed to send notification: {e}")
             return False
+    
+    def send_multicast(
+        self,
+        tokens: List[str],
+        title: str,
+        body: str,
+        data: dict = None,
+        collapse_key: Optional[str] = None
+    ) -> List[Tuple[bool, Optional[str]]]:
+        """Enviar la misma notificación a varios tokens con `send_each_for_multicast`.
+
+        Retorna, alineado con `tokens`, un par (éxito, código de error) por token.
+        Con `collapse_key`, el dispositivo reemplaza la notificación anterior que
+        tenga la misma clave en lugar de mostrar otra.
+        """
+        if not tokens:
+            return []
+        
+        if not self._initialized:
+            logger.info(f"Firebase not initialized. Would send notification to {len(tokens)} devices: {title}")
+            return [(True, None)] * len(tokens)
+        
+        messaging = self._registry.messaging
+        # FCM solo acepta valores string en `data`
+        payload_data = {key: str(value) for key, value in (data or {}).items()}
+        android = apns = None
+        if collapse_key:
+            android = messaging.AndroidConfig(collapse_key=collapse_key)
+            apns = messaging.APNSConfig(headers={'apns-collapse-id': collapse_key})
+        results: List[Tuple[bool, Optional[str]]] = []
+        
+        for start in range(0, len(tokens), MAX_MULTICAST_TOKENS):
+            chunk = tokens[start:start + MAX_MULTICAST_TOKENS]
+            try:
+                message = messaging.MulticastMessage(
+                    notification=messaging.Notification(
+                        title=title,
+                        body=body
+                    ),
+                    data=payload_data,
+                    android=android,
+                    apns=apns,
+                    tokens=chunk
+                )
+                response = messaging.send_each_for_multicast(message)
+                for send_response in response.responses:
+                    if send_response.success:
+                        results.append((True, None))
+                    else:
+                        results.append((False, self._fcm_error_code(send_response.exception)))
+                logger.info(f"Multicast sent: {response.success_count} ok, {response.failure_count} failed")
+            
+            except Exception as e:
+                logger.error(f"Failed to send multicast notification: {e}")
+                results.extend([(False, self._fcm_error_code(e))] * len(chunk))
+        
+        return results
+    
+    def _fcm_error_code(self, error: Exception) -> str:
+        """Normalizar el error de FCM a un código estable."""
+        messaging = self._registry.messaging
+        if messaging is not None:
+            if isinstance(error, messaging.UnregisteredError):
+                return "UNREGISTERED"
+            if isinstance(error, messaging.SenderIdMismatchError):
+                return "SENDER_ID_MISMATCH"
+        code = getattr(error, 'code', None)
+        return str(code).upper() if code else "UNKNOWN"
@@ -0,0 +1,305 @@
+"""
+Broker pub/sub local sobre un socket Unix.
+
+Permite correr varios workers (p. ej. `uvicorn --workers N`) en la misma
+máquina sin servicios externos: los workers se conectan al socket y cada
+publicación en un canal se reenvía a todos los suscriptos, incluido quien
+publica (cada consumidor descarta lo propio).
+
+El broker corre dentro del primer worker que toma el lock `<path>.lock` (el
+sistema lo libera si el proceso muere); el resto se conecta como cliente. Si
+ese worker muere, los clientes reintentan y uno de ellos levanta un broker
+nuevo. También se puede correr aparte (por defecto en `CLUSTER_IPC_PATH`):
+
+    python -m services.ipc_broker [ruta]
+
+El socket y el lock viven en un directorio privado: se crea con permisos
+0700 y, si ya existe, tiene que pertenecer al usuario del proceso y no dar
+acceso a nadie más. Así ningún otro usuario de la máquina puede conectarse
+al broker ni hacerse pasar por él.
+
+Cada frame es `!BHI` (tipo, largo del canal, largo del cuerpo) seguido del
+canal y el cuerpo. Tipos: `H` saludo (el broker responde con el id de nodo
+asignado), `S` suscripción y `P` publicación.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import stat
+import struct
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!BHI")
+HELLO = ord("H")
+SUBSCRIBE = ord("S")
+PUBLISH = ord("P")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, str, bytes]:
+    kind, channel_length, body_length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    channel = (await reader.readexactly(channel_length)).decode("utf-8")
+    body = await reader.readexactly(body_length)
+    return kind, channel, body
+
+
+def encode_frame(kind: int, channel: str = "", body: bytes = b"") -> bytes:
+    channel_bytes = channel.encode("utf-8")
+    return HEADER.pack(kind, len(channel_bytes), len(body)) + channel_bytes + body
+
+
+def ensure_private_dir(path: str) -> None:
+    """Crear el directorio de `path` con 0700, o verificar que sea privado si ya existe."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(
+            f"IPC directory {directory} must be owned by uid {os.getuid()} "
+            f"and not accessible by group or others (mode 0700)"
+        )
+
+
+class IPCBroker:
+    """Servidor que reparte las publicaciones entre los workers conectados."""
+
+    def __init__(self, path: str, max_nodes: int = 1024):
+        self.path = path
+        self.max_nodes = max_nodes
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_fd: Optional[int] = None
+        self._subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        # id de nodo -> conexión que lo tiene asignado
+        self._nodes: Dict[int, asyncio.StreamWriter] = {}
+
+        # Métricas
+        self.published = 0
+        self.delivered = 0
+
+    def try_lock(self) -> bool:
+        """Tomar el lock del broker; False si otro proceso ya lo tiene."""
+        ensure_private_dir(self.path)
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def start(self) -> None:
+        """Hacer bind del socket (requiere el lock)."""
+        if self._lock_fd is None and not self.try_lock():
+            raise RuntimeError(f"IPC broker already running at {self.path}")
+        if os.path.exists(self.path):
+            # Socket huérfano de un broker que murió
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"IPC broker listening on {self.path}")
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._nodes.values()):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    def _assign_node(self, writer: asyncio.StreamWriter, requested: Optional[int]) -> int:
+        """Conservar el id pedido (reconexión) si está libre; si no, el menor libre."""
+        if requested is not None and 0 <= requested < self.max_nodes and requested not in self._nodes:
+            node_id = requested
+        else:
+            node_id = next((n for n in range(self.max_nodes) if n not in self._nodes), None)
+            if node_id is None:
+                raise RuntimeError(f"IPC broker supports at most {self.max_nodes} nodes")
+        self._nodes[node_id] = writer
+        return node_id
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        node_id: Optional[int] = None
+        try:
+            while True:
+                kind, channel, body = await read_frame(reader)
+                if kind == PUBLISH:
+                    self._publish(channel, body)
+                elif kind == SUBSCRIBE:
+                    self._subscribers.setdefault(channel, set()).add(writer)
+                elif kind == HELLO and node_id is None:
+                    node_id = self._assign_node(writer, int(body) if body else None)
+                    writer.write(encode_frame(HELLO, body=str(node_id).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Cierre de la conexión o del broker
+            pass
+        except Exception as e:
+            logger.error(f"IPC broker connection error: {e}")
+        finally:
+            for subscribers in self._subscribers.values():
+                subscribers.discard(writer)
+            if node_id is not None:
+                self._nodes.pop(node_id, None)
+            writer.close()
+
+    def _publish(self, channel: str, body: bytes) -> None:
+        self.published += 1
+        frame = encode_frame(PUBLISH, channel, body)
+        for subscriber in self._subscribers.get(channel, ()):
+            if not subscriber.is_closing():
+                subscriber.write(frame)
+                self.delivered += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "nodes": len(self._nodes),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+class IPCBrokerClient:
+    """Conexión de un worker al broker.
+
+    `subscribe()` devuelve una cola por canal; ante una desconexión el cliente
+    reintenta (levantando el broker si hace falta), conserva su id de nodo si
+    puede y vuelve a suscribirse. Lo publicado mientras no hay conexión se
+    descarta.
+    """
+
+    def __init__(self, path: str, reconnect_delay: float = 0.5, max_nodes: int = 1024):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.max_nodes = max_nodes
+        self.node_id: Optional[int] = None
+        self.broker: Optional[IPCBroker] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self._closed = False
+
+    async def start(self, attempts: int = 20) -> int:
+        """Conectarse reintentando mientras otro worker termina de levantar el broker."""
+        for attempt in range(attempts):
+            try:
+                return await self.connect()
+            except (ConnectionError, FileNotFoundError):
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def connect(self) -> int:
+        """Conectarse (levantando el broker si nadie lo tiene) y devolver el id de nodo."""
+        ensure_private_dir(self.path)
+        if self.broker is None:
+            self.broker = await ensure_broker(self.path, self.max_nodes)
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        requested = b"" if self.node_id is None else str(self.node_id).encode()
+        self._writer.write(encode_frame(HELLO, body=requested))
+        kind, _, body = await read_frame(self._reader)
+        if kind != HELLO:
+            raise ConnectionError("Unexpected IPC broker handshake")
+        self.node_id = int(body)
+        for channel in self._queues:
+            self._writer.write(encode_frame(SUBSCRIBE, channel))
+        await self._writer.drain()
+        self._connected.set()
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_loop())
+        logger.info(f"Connected to IPC broker at {self.path} as node {self.node_id}")
+        return self.node_id
+
+    async def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[channel] = queue
+            if self._connected.is_set():
+                self._writer.write(encode_frame(SUBSCRIBE, channel))
+                await self._writer.drain()
+        return queue
+
+    async def publish(self, channel: str, body: bytes) -> bool:
+        if not self._connected.is_set():
+            return False
+        try:
+            self._writer.write(encode_frame(PUBLISH, channel, body))
+            await self._writer.drain()
+            return True
+        except ConnectionError:
+            return False
+
+    async def _read_loop(self) -> None:
+        while not self._closed:
+            try:
+                while True:
+                    kind, channel, body = await read_frame(self._reader)
+                    queue = self._queues.get(channel)
+                    if kind == PUBLISH and queue is not None:
+                        queue.put_nowait(body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            self._connected.clear()
+            if self._closed:
+                return
+            logger.warning("Lost connection to IPC broker, reconnecting...")
+            await self._reconnect()
+
+    async def _reconnect(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                # Si el broker estaba en el worker que murió, otro toma el lock y lo levanta
+                await self.connect()
+                return
+            except Exception as e:
+                logger.error(f"IPC broker reconnect failed: {e}")
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+        if self.broker:
+            await self.broker.close()
+
+
+async def ensure_broker(path: str, max_nodes: int = 1024) -> Optional[IPCBroker]:
+    """Levantar el broker en este proceso salvo que otro ya tenga el lock.
+
+    Devuelve el broker si quedó en este proceso, None si ya había uno.
+    """
+    broker = IPCBroker(path, max_nodes)
+    if not broker.try_lock():
+        return None
+    await broker.start()
+    return broker
+
+
+async def _serve(path: str) -> None:
+    broker = IPCBroker(path)
+    await broker.start()
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    import sys
+    from config import settings
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(sys.argv[1] if len(sys.argv) > 1 else settings.CLUSTER_IPC_PATH))
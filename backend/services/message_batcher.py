@@ -0,0 +1,129 @@
+"""
+Micro-batching adaptativo de los broadcasts de mensajes por sala.
+
+Cada `new_message` es un paquete por cliente de la sala (y, en
+python-socketio, una tarea por destinatario), así que en salas con mucho
+tráfico el costo fijo por paquete domina. El `MessageBatcher` decide por
+sala:
+
+- Sala tranquila (ningún envío en la última ventana): el mensaje sale de
+  inmediato como `new_message`, sin latencia extra.
+- Ráfaga (llega otro mensaje antes de que pase la ventana): se acumula y se
+  emite un único `new_messages` `{room_id, messages}` al cerrar la ventana o
+  al juntar `max_batch` mensajes.
+
+Con `window=0` nunca se agrupa: cada mensaje es un `new_message` y cada lote
+de `send_messages` un `new_messages` (el comportamiento sin batching).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from models import MessageRecord
+from services.wire import compact_messages
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBatcher:
+    """Agrupa los broadcasts de mensajes de cada sala en ventanas cortas."""
+
+    def __init__(self, sio, window: float = 0.005, max_batch: int = 50):
+        self.sio = sio
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, List[MessageRecord]] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        # Momento (monotonic) de la última emisión por sala
+        self._last_emit: Dict[str, float] = {}
+
+        # Métricas
+        self._messages = 0
+        self._direct = 0
+        self._batched = 0
+        self._largest = 0
+
+    async def add(self, room_id: str, messages: List[MessageRecord]) -> None:
+        """Entregar mensajes de una sala, directo o en el próximo lote."""
+        if not messages:
+            return
+        self._messages += len(messages)
+        now = time.monotonic()
+
+        pending = self._pending.get(room_id)
+        if pending is None:
+            last = self._last_emit.get(room_id)
+            if self.window <= 0 or last is None or now - last >= self.window:
+                # Poco tráfico: sin esperar
+                self._last_emit[room_id] = now
+                await self._emit(room_id, messages)
+                return
+            pending = self._pending[room_id] = []
+            self._flush_tasks[room_id] = asyncio.create_task(self._flush_later(room_id))
+
+        pending.extend(messages)
+        if len(pending) >= self.max_batch:
+            await self.flush(room_id)
+
+    async def _flush_later(self, room_id: str) -> None:
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush(room_id)
+        except Exception as e:
+            logger.error(f"Message batch broadcast failed for room {room_id}: {e}")
+
+    async def flush(self, room_id: str) -> None:
+        """Emitir lo acumulado de una sala."""
+        task = self._flush_tasks.pop(room_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        messages = self._pending.pop(room_id, None)
+        if not messages:
+            return
+        # Mientras siga llegando tráfico, el siguiente mensaje vuelve a agruparse
+        self._last_emit[room_id] = time.monotonic()
+        await self._emit(room_id, messages)
+
+    async def close(self) -> None:
+        """Emitir todos los lotes pendientes (al apagar)."""
+        for room_id in list(self._pending):
+            await self.flush(room_id)
+
+    async def _emit(self, room_id: str, messages: List[MessageRecord]) -> None:
+        if len(messages) == 1:
+            message = messages[0]
+            self._direct += 1
+            # `compact` perezoso: sin clientes msgpack no se construye
+            await self.sio.emit(
+                "new_message", message.payload, room=room_id, ignore_queue=True,
+                compact=lambda: message.payload_compact
+            )
+            return
+
+        self._batched += 1
+        self._largest = max(self._largest, len(messages))
+        await self.sio.emit(
+            "new_messages",
+            {"room_id": room_id, "messages": [message.payload for message in messages]},
+            room=room_id,
+            ignore_queue=True,
+            compact=lambda: {"room_id": room_id, "messages": compact_messages(messages)}
+        )
+
+    def pending(self, room_id: Optional[str] = None) -> int:
+        if room_id is not None:
+            return len(self._pending.get(room_id, ()))
+        return sum(len(messages) for messages in self._pending.values())
+
+    def stats(self) -> Dict[str, Any]:
+        emissions = self._direct + self._batched
+        return {
+            "messages": self._messages,
+            "emissions": emissions,
+            "direct": self._direct,
+            "batched": self._batched,
+            "largest_batch": self._largest,
+            "messages_per_emission": round(self._messages / emissions, 2) if emissions else 0.0,
+        }
@@ -0,0 +1,251 @@
+"""
+Agregación de notificaciones push por destinatario.
+
+En una conversación activa un usuario desconectado recibiría un push por
+mensaje y otro por cada entrada o salida de participantes. `NotificationDigest`
+acumula los eventos de cada destinatario durante una ventana y los entrega
+como un resumen ("12 mensajes nuevos en general") con una clave de colapso,
+de modo que el dispositivo reemplaza la notificación anterior en lugar de
+apilar otra. Si en la ventana hubo un solo evento se envía tal cual.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models import NotificationData
+from services.notification_dispatcher import DispatchResult
+
+logger = logging.getLogger(__name__)
+
+# Remitentes que se nombran en el cuerpo del resumen
+MAX_NAMED_SENDERS = 3
+
+
+class _RoomDigest:
+    """Mensajes acumulados de una sala para un destinatario."""
+
+    __slots__ = ("first", "events", "count", "senders")
+
+    def __init__(self, first: NotificationData):
+        self.first = first
+        # Notificaciones recibidas; un `new_messages` cuenta varios mensajes
+        self.events = 0
+        self.count = 0
+        self.senders: List[str] = []
+
+
+class _RecipientDigest:
+    """Eventos pendientes de un destinatario dentro de la ventana."""
+
+    __slots__ = ("deadline", "rooms", "membership_first", "joined", "left", "other")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.rooms: Dict[str, _RoomDigest] = {}
+        self.membership_first: Optional[NotificationData] = None
+        self.joined = 0
+        self.left = 0
+        self.other: List[NotificationData] = []
+
+
+class NotificationDigest:
+    """Buffer por destinatario delante del `NotificationDispatcher`.
+
+    Expone el mismo `dispatch()` que el despachador, así que el observador de
+    notificaciones puede usar cualquiera de los dos. El envío ocurre en un
+    thread propio, fuera del event loop, por eso `dispatch()` no retorna el
+    `DispatchResult`: cada resultado se acumula en `stats()` y se pasa a
+    `on_result` si se indica.
+    """
+
+    def __init__(
+        self,
+        dispatcher,
+        window: float = 10.0,
+        recipient_filter: Optional[Callable[[str], bool]] = None,
+        on_result: Optional[Callable[[DispatchResult], None]] = None,
+        name: str = "notification-digest"
+    ):
+        self.dispatcher = dispatcher
+        self._window = window
+        # Se vuelve a consultar al vaciar (p. ej. el usuario se reconectó)
+        self._recipient_filter = recipient_filter
+        self._on_result = on_result
+
+        self._lock = threading.Lock()
+        # user_id -> resumen pendiente, en orden de primer evento (= orden de vencimiento)
+        self._pending: Dict[str, _RecipientDigest] = {}
+
+        # Métricas
+        self._events = 0
+        self._notifications = 0
+        self._filtered = 0
+        # Acumulado de los `DispatchResult` del despachador
+        self._sent = 0
+        self._failed = 0
+        self._pruned = 0
+        self._without_tokens = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def dispatch(self, notifications: List[NotificationData]) -> None:
+        """Acumular notificaciones; se envían al cerrar la ventana de cada destinatario.
+
+        El resultado del envío se conoce recién al vaciar (ver `stats()`).
+        """
+        deadline = time.monotonic() + self._window
+        with self._lock:
+            for notification in notifications:
+                self._events += 1
+                digest = self._pending.get(notification.user_id)
+                if digest is None:
+                    digest = self._pending[notification.user_id] = _RecipientDigest(deadline)
+                self._add(digest, notification)
+
+    @staticmethod
+    def _add(digest: _RecipientDigest, notification: NotificationData) -> None:
+        data = notification.data or {}
+        event_type = data.get("type")
+
+        if event_type in ("new_message", "new_messages"):
+            room_id = data.get("room_id", "general")
+            room = digest.rooms.get(room_id)
+            if room is None:
+                room = digest.rooms[room_id] = _RoomDigest(notification)
+            room.events += 1
+            # `new_messages` (un lote de `send_messages`) trae la cantidad como string
+            room.count += int(data.get("count", 1)) if event_type == "new_messages" else 1
+            sender = data.get("sender_name")
+            if sender and sender not in room.senders:
+                room.senders.append(sender)
+        elif event_type in ("user_joined", "user_left"):
+            if digest.membership_first is None:
+                digest.membership_first = notification
+            if event_type == "user_joined":
+                digest.joined += 1
+            else:
+                digest.left += 1
+        else:
+            digest.other.append(notification)
+
+    def _flush_loop(self) -> None:
+        # Revisar varias veces por ventana para no retrasar de más los resúmenes
+        interval = max(min(self._window / 4, 1.0), 0.05)
+        while not self._stop_event.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Notification digest flush failed: {e}")
+
+    def flush(self, force: bool = False) -> None:
+        """Enviar los resúmenes vencidos (o todos si `force`)."""
+        now = time.monotonic()
+        due: List[Tuple[str, _RecipientDigest]] = []
+        with self._lock:
+            for user_id, digest in self._pending.items():
+                if not force and digest.deadline > now:
+                    break
+                due.append((user_id, digest))
+            for user_id, _digest in due:
+                del self._pending[user_id]
+
+        notifications: List[NotificationData] = []
+        filtered = 0
+        for user_id, digest in due:
+            if self._recipient_filter is not None and not self._recipient_filter(user_id):
+                filtered += 1
+                continue
+            notifications.extend(self._render(user_id, digest))
+
+        with self._lock:
+            self._filtered += filtered
+            self._notifications += len(notifications)
+        if not notifications:
+            return
+
+        result = self.dispatcher.dispatch(notifications)
+        with self._lock:
+            self._sent += result.sent
+            self._failed += result.failed
+            self._pruned += result.pruned
+            self._without_tokens += result.recipients_without_tokens
+        if self._on_result is not None:
+            self._on_result(result)
+
+    def _render(self, user_id: str, digest: _RecipientDigest) -> List[NotificationData]:
+        notifications = []
+
+        for room_id, room in digest.rooms.items():
+            collapse_key = f"room-{room_id}"
+            if room.events == 1:
+                # Una sola notificación (un mensaje o un lote): tal cual, con su remitente y vista previa
+                notifications.append(room.first.model_copy(update={"collapse_key": collapse_key}))
+                continue
+            notifications.append(NotificationData(
+                title=f"{room.count} mensajes nuevos en {room_id}",
+                body=f"De {self._join_names(room.senders)}",
+                user_id=user_id,
+                collapse_key=collapse_key,
+                data={
+                    "type": "message_digest",
+                    "room_id": room_id,
+                    "count": room.count
+                }
+            ))
+
+        if digest.membership_first is not None:
+            if digest.joined + digest.left == 1:
+                notifications.append(digest.membership_first.model_copy(update={"collapse_key": "membership"}))
+            else:
+                parts = []
+                if digest.joined:
+                    parts.append(f"{digest.joined} se unieron")
+                if digest.left:
+                    parts.append(f"{digest.left} salieron")
+                notifications.append(NotificationData(
+                    title="Actividad en el chat",
+                    body=f"Participantes: {', '.join(parts)}",
+                    user_id=user_id,
+                    collapse_key="membership",
+                    data={
+                        "type": "membership_digest",
+                        "joined": digest.joined,
+                        "left": digest.left
+                    }
+                ))
+
+        notifications.extend(digest.other)
+        return notifications
+
+    @staticmethod
+    def _join_names(names: List[str]) -> str:
+        named = names[:MAX_NAMED_SENDERS]
+        extra = len(names) - len(named)
+        if extra:
+            return f"{', '.join(named)} y {extra} más"
+        if len(named) > 1:
+            return f"{', '.join(named[:-1])} y {named[-1]}"
+        return named[0] if named else "varios participantes"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_recipients": len(self._pending),
+                "events": self._events,
+                "notifications": self._notifications,
+                "filtered": self._filtered,
+                "sent": self._sent,
+                "failed": self._failed,
+                "pruned": self._pruned,
+                "recipients_without_tokens": self._without_tokens,
+            }
+
+    def close(self) -> None:
+        """Detener el thread y enviar lo pendiente."""
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self.flush(force=True)
@@ -0,0 +1,128 @@
+"""
+Despachador de notificaciones push.
+
+Agrupa los destinatarios que reciben exactamente el mismo contenido y los
+envía con FCM multicast (`send_each_for_multicast`, hasta 500 tokens por
+llamada) en lugar de una llamada HTTP por destinatario. Los fallos por token
+se devuelven al llamador y los tokens que FCM da por muertos se podan.
+"""
+
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from models import NotificationData
+
+logger = logging.getLogger(__name__)
+
+# Códigos de FCM que indican que el token nunca volverá a ser válido
+STALE_TOKEN_ERRORS = frozenset({"UNREGISTERED", "SENDER_ID_MISMATCH"})
+# INVALID_ARGUMENT también puede deberse al payload: solo indica un token
+# inválido si otros tokens del mismo envío sí lo aceptaron
+INVALID_TOKEN_ERROR = "INVALID_ARGUMENT"
+
+
+class TokenFailure(NamedTuple):
+    """Fallo de entrega para un token concreto."""
+    user_id: str
+    token: str
+    error_code: Optional[str]
+
+
+class DispatchResult:
+    """Resultado de un despacho: conteos y fallos por token."""
+
+    def __init__(self):
+        self.sent = 0
+        self.failures: List[TokenFailure] = []
+        self.recipients_without_tokens = 0
+        self.pruned = 0
+
+    @property
+    def failed(self) -> int:
+        return len(self.failures)
+
+    def __repr__(self) -> str:
+        return f"DispatchResult(sent={self.sent}, failed={self.failed}, pruned={self.pruned})"
+
+
+class NotificationDispatcher:
+    """Envía lotes de `NotificationData` agrupando por contenido idéntico."""
+
+    def __init__(
+        self,
+        firebase_service,
+        token_resolver: Optional[Callable[[str], List[str]]] = None,
+        token_pruner: Optional[Callable[[List[str]], int]] = None
+    ):
+        self.firebase_service = firebase_service
+        # user_id -> tokens de dispositivo registrados
+        self._token_resolver = token_resolver or (lambda user_id: [])
+        # Recibe los tokens que FCM rechazó de forma permanente
+        self._token_pruner = token_pruner
+
+    @staticmethod
+    def _payload_key(notification: NotificationData) -> Tuple:
+        data = notification.data or {}
+        return (
+            notification.title,
+            notification.body,
+            notification.collapse_key,
+            tuple(sorted((k, str(v)) for k, v in data.items()))
+        )
+
+    def dispatch(self, notifications: List[NotificationData]) -> DispatchResult:
+        """Enviar las notificaciones; retorna los fallos por token."""
+        result = DispatchResult()
+
+        # Agrupar destinatarios por payload idéntico
+        groups: Dict[Tuple, List[NotificationData]] = {}
+        for notification in notifications:
+            groups.setdefault(self._payload_key(notification), []).append(notification)
+
+        for group in groups.values():
+            sample = group[0]
+            targets: List[Tuple[str, str]] = []
+            for notification in group:
+                tokens = self._token_resolver(notification.user_id)
+                if not tokens:
+                    result.recipients_without_tokens += 1
+                targets.extend((notification.user_id, token) for token in tokens)
+
+            if not targets:
+                continue
+
+            responses = self.firebase_service.send_multicast(
+                [token for _user_id, token in targets],
+                sample.title,
+                sample.body,
+                sample.data,
+                collapse_key=sample.collapse_key
+            )
+            group_sent = 0
+            group_failures: List[TokenFailure] = []
+            for (user_id, token), (success, error_code) in zip(targets, responses):
+                if success:
+                    group_sent += 1
+                else:
+                    group_failures.append(TokenFailure(user_id, token, error_code))
+            result.sent += group_sent
+            result.failures.extend(group_failures)
+
+            if self._token_pruner and group_failures:
+                stale = self._stale_tokens(group_failures, payload_accepted=group_sent > 0)
+                if stale:
+                    result.pruned += self._token_pruner(stale)
+
+        if result.failures:
+            logger.warning(f"Push dispatch: {result.sent} sent, {result.failed} failed, {result.pruned} tokens pruned")
+        return result
+
+    @staticmethod
+    def _stale_tokens(failures: List[TokenFailure], payload_accepted: bool) -> List[str]:
+        """Tokens que no vale la pena volver a intentar."""
+        return [
+            failure.token
+            for failure in failures
+            if failure.error_code in STALE_TOKEN_ERRORS
+            or (payload_accepted and failure.error_code == INVALID_TOKEN_ERROR)
+        ]
@@ -0,0 +1,131 @@
+"""
+Broadcast de presencia con coalescing.
+
+Tras un deploy o un corte de red cientos de clientes se reconectan en pocos
+segundos y cada entrada o salida generaba sus propias emisiones. El
+`PresenceBroadcaster` acumula los cambios del roster durante una ventana
+corta y publica un único `roster_delta` por sala; los usuarios que se unieron
+en la ventana reciben además su `roster_snapshot`.
+
+Cada worker mantiene su propio roster y emite solo a sus clientes locales
+(`ignore_queue`); en modo cluster el roster se completa con los eventos
+replicados, así que todos ven la misma lista aunque con versiones propias.
+
+Con un `AdmissionController`, mientras el event loop está saturado el
+flush se difiere (los cambios se siguen acumulando en el mismo delta).
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from models import UserRecord
+from services.admission import AdmissionController
+from services.roster import Roster
+from services.wire import WIRE_MSGPACK, compact_roster_delta, compact_roster_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceBroadcaster:
+    """Publica los cambios del roster agrupados por ventana de tiempo."""
+
+    def __init__(
+        self,
+        sio,
+        roster: Optional[Roster] = None,
+        window: float = 0.1,
+        room: str = "general",
+        admission: Optional[AdmissionController] = None
+    ):
+        self.sio = sio
+        self.roster = roster if roster is not None else Roster()
+        self.window = window
+        self.room = room
+        self.admission = admission
+        # Clientes (sid) que esperan snapshot en el próximo flush; dict como set ordenado
+        self._pending_snapshots: Dict[str, None] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self._events = 0
+        self._flushes = 0
+        self._emissions = 0
+        self._changes = 0
+
+    async def user_joined(self, user: UserRecord, send_snapshot: bool = True) -> None:
+        self.roster.upsert(user)
+        if send_snapshot and user.socket_id:
+            self._pending_snapshots[user.socket_id] = None
+        await self._changed()
+
+    async def user_left(self, user: UserRecord) -> None:
+        self.roster.remove(user.id)
+        if user.socket_id:
+            self._pending_snapshots.pop(user.socket_id, None)
+        await self._changed()
+
+    async def sync(self, users: Iterable[UserRecord]) -> None:
+        self.roster.sync(users)
+        await self._changed()
+
+    async def _changed(self) -> None:
+        self._events += 1
+        if self.window <= 0:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        if self.admission is not None:
+            # Los deltas no se descartan: solo se espera a que baje el lag
+            await self.admission.defer("roster_broadcast")
+        # Los cambios que lleguen durante el flush programan la siguiente ventana
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Presence broadcast failed: {e}")
+
+    async def flush(self) -> None:
+        """Emitir el delta acumulado y los snapshots pendientes."""
+        snapshot_sids: List[str] = list(self._pending_snapshots)
+        self._pending_snapshots.clear()
+        delta = self.roster.commit()
+        self._flushes += 1
+
+        if delta:
+            self._changes += len(delta["changes"])
+            self._emissions += 1
+            # Quienes acaban de entrar reciben el snapshot, que ya incluye el delta
+            await self.sio.emit(
+                "roster_delta", delta, room=self.room, skip_sid=snapshot_sids or None, ignore_queue=True,
+                compact=lambda: compact_roster_delta(delta)
+            )
+
+        if snapshot_sids:
+            snapshot = self.roster.snapshot()
+            compact = None
+            for sid in snapshot_sids:
+                if compact is None and self.sio.wire_of(sid) == WIRE_MSGPACK:
+                    # Se calcula una vez y solo si algún cliente lo necesita
+                    compact = compact_roster_snapshot(snapshot)
+                await self.sio.emit("roster_snapshot", snapshot, room=sid, ignore_queue=True, compact=compact)
+
+    async def send_snapshot(self, sid: str) -> None:
+        """Enviar el roster completo a un cliente."""
+        snapshot = self.roster.snapshot()
+        await self.sio.emit(
+            "roster_snapshot", snapshot, room=sid, ignore_queue=True,
+            compact=lambda: compact_roster_snapshot(snapshot)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events": self._events,
+            "flushes": self._flushes,
+            "emissions": self._emissions,
+            "changes": self._changes,
+            "collapse_ratio": round(self._events / self._emissions, 2) if self._emissions else 0.0,
+        }
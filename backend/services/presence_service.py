@@ -0,0 +1,81 @@
+"""
+Presencia de usuarios para decidir la entrega de notificaciones push.
+
+Un usuario con un socket vivo ya recibe los eventos por Socket.IO, así que
+enviarle además un push solo duplica la entrega. `PresenceService` combina el
+mapeo socket -> usuario del repositorio, el estado real de la conexión en el
+manager de Socket.IO y el estado en segundo plano que reporta el cliente.
+
+Los destinatarios de un evento salen de la membresía de las salas, y quien se
+desconecta sale de todas sus salas: un usuario ya desconectado nunca recibe
+push. En la práctica el push llega a quienes siguen conectados con la app en
+segundo plano. La ventana de gracia solo actúa cuando el destinatario se
+desconecta entre el evento y el envío (p. ej. dentro de la ventana del
+`NotificationDigest`, que vuelve a consultar `needs_push`): si lo hizo hace
+menos de `grace_seconds` se asume una reconexión breve y no se le notifica.
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from repositories import IUserRepository
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceService:
+    """Determina qué usuarios necesitan recibir un push."""
+
+    def __init__(
+        self,
+        user_repository: IUserRepository,
+        grace_seconds: float = 30.0,
+        is_socket_connected: Optional[Callable[[str], bool]] = None
+    ):
+        self.user_repository = user_repository
+        self.grace_seconds = grace_seconds
+        # sid -> conectado según el manager de Socket.IO (None = confiar en el repositorio)
+        self._is_socket_connected = is_socket_connected
+        # user_id -> instante (monotónico) en que la app pasó a segundo plano
+        self._backgrounded: Dict[str, float] = {}
+
+    def set_backgrounded(self, user_id: str, backgrounded: bool) -> None:
+        """Registrar el estado de la app reportado por el cliente."""
+        if backgrounded:
+            self._backgrounded.setdefault(user_id, time.monotonic())
+        else:
+            self._backgrounded.pop(user_id, None)
+
+    def is_live(self, user_id: str) -> bool:
+        """True si el usuario tiene un socket conectado y la app en primer plano."""
+        user = self.user_repository.get_user_by_id(user_id)
+        if user is None:
+            self._backgrounded.pop(user_id, None)
+            return False
+        if user_id in self._backgrounded or not user.is_active or not user.socket_id:
+            return False
+
+        owner = self.user_repository.get_user_by_socket_id(user.socket_id)
+        if owner is None or owner.id != user_id:
+            return False
+        if self._is_socket_connected is not None:
+            return self._is_socket_connected(user.socket_id)
+        return True
+
+    def needs_push(self, user_id: str) -> bool:
+        """True si el usuario está en segundo plano o se desconectó hace más de la gracia.
+
+        Solo se consulta para usuarios que estaban en la sala al ocurrir el
+        evento (ver el docstring del módulo).
+        """
+        if self.is_live(user_id):
+            return False
+        if user_id in self._backgrounded:
+            return True
+
+        # Reconexiones breves: no notificar durante la ventana de gracia
+        inactive_since = self.user_repository.get_inactive_since(user_id)
+        if inactive_since is not None and time.monotonic() - inactive_since < self.grace_seconds:
+            return False
+        return True
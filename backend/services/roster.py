@@ -0,0 +1,106 @@
+"""
+Roster versionado de usuarios conectados.
+
+En lugar de reenviar la lista completa de usuarios a toda la sala en cada
+entrada o salida (O(usuarios²) bytes por ola de conexiones), los clientes
+reciben un snapshot al unirse y luego solo deltas `roster_delta`. Cada delta
+lleva `base_version` y `version`: si la versión local del cliente no coincide
+con `base_version` hubo un hueco y el cliente pide un snapshot nuevo.
+
+Los cambios se acumulan por usuario hasta `commit()`, que los compara contra
+el último estado publicado: una entrada y salida del mismo usuario antes del
+commit no genera nada.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from models import UserRecord
+
+
+class Roster:
+    """Lista de usuarios activos con versión y cambios pendientes de publicar."""
+
+    def __init__(self):
+        self.version = 0
+        # user_id -> entrada pública, en orden de ingreso
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # user_id -> entrada en el último commit (None = no estaba)
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    @staticmethod
+    def entry(user: UserRecord) -> Dict[str, Any]:
+        """Representación pública de un usuario en el roster."""
+        return {
+            "id": user.id,
+            "name": user.name,
+            "is_active": user.is_active,
+            "joined_at": user.joined_at.isoformat()
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def upsert(self, user: UserRecord) -> None:
+        """Agregar o actualizar un usuario."""
+        entry = self.entry(user)
+        current = self._entries.get(user.id)
+        if current == entry:
+            return
+        self._pending.setdefault(user.id, current)
+        self._entries[user.id] = entry
+
+    def remove(self, user_id: str) -> None:
+        """Quitar un usuario del roster."""
+        current = self._entries.pop(user_id, None)
+        if current is not None:
+            self._pending.setdefault(user_id, current)
+
+    def sync(self, users: Iterable[UserRecord]) -> None:
+        """Reconciliar con la lista completa de usuarios activos."""
+        seen = set()
+        for user in users:
+            seen.add(user.id)
+            self.upsert(user)
+        for user_id in [user_id for user_id in self._entries if user_id not in seen]:
+            self.remove(user_id)
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def commit(self) -> Optional[Dict[str, Any]]:
+        """Publicar los cambios pendientes como un delta; None si no hay cambios netos."""
+        changes: List[Dict[str, Any]] = []
+        for user_id, before in self._pending.items():
+            after = self._entries.get(user_id)
+            if before is None and after is not None:
+                changes.append({"op": "add", "user": after})
+            elif before is not None and after is None:
+                changes.append({"op": "remove", "user": {"id": user_id, "name": before["name"]}})
+            elif before != after:
+                changes.append({"op": "update", "user": after})
+        self._pending.clear()
+
+        if not changes:
+            return None
+        base_version = self.version
+        self.version += 1
+        return {
+            "base_version": base_version,
+            "version": self.version,
+            "changes": changes,
+            "count": len(self._entries)
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Lista completa con la versión actual.
+
+        Puede incluir cambios aún no publicados; los clientes aplican los
+        deltas de forma idempotente, así que recibirlos después no es un
+        problema.
+        """
+        return {
+            "version": self.version,
+            "users": list(self._entries.values()),
+            "count": len(self._entries)
+        }
@@ -0,0 +1,110 @@
+"""
+Fachada sobre los servidores Socket.IO de cada formato de red.
+
+El serializer de python-socketio es global por servidor, así que los
+clientes JSON y msgpack se atienden con dos `AsyncServer` (cada uno en su
+path). `SocketGateway` registra los handlers en ambos, recuerda en cuál está
+cada sid y reparte las emisiones: a un sid, por su servidor; a una sala, por
+los dos, con el payload compacto (`compact`) para los clientes msgpack.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from socketio import exceptions
+
+from services.wire import MSGPACK_WIRE_VERSIONS, WIRE_JSON, WIRE_MSGPACK, negotiate_msgpack_version
+
+logger = logging.getLogger(__name__)
+
+
+class SocketGateway:
+    """Expone `event`/`emit`/`enter_room` como un único servidor Socket.IO."""
+
+    def __init__(self, json_server, msgpack_server=None):
+        self.servers: Dict[str, Any] = {WIRE_JSON: json_server}
+        if msgpack_server is not None:
+            self.servers[WIRE_MSGPACK] = msgpack_server
+        self._wire_by_sid: Dict[str, str] = {}
+        self._clients: Dict[str, int] = {wire: 0 for wire in self.servers}
+
+    def event(self, handler: Callable) -> Callable:
+        """Decorador equivalente a `@sio.event` para todos los servidores."""
+        self.on(handler.__name__, handler)
+        return handler
+
+    def on(self, event: str, handler: Callable) -> None:
+        for wire, server in self.servers.items():
+            server.on(event, self._bind(event, wire, handler))
+
+    def _bind(self, event: str, wire: str, handler: Callable) -> Callable:
+        if event == "connect":
+            async def connect(sid, environ, auth=None):
+                if wire == WIRE_MSGPACK and negotiate_msgpack_version(auth) is None:
+                    # El cliente puede volver al servidor JSON
+                    raise exceptions.ConnectionRefusedError(
+                        "Unsupported wire version", {"supported": list(MSGPACK_WIRE_VERSIONS)}
+                    )
+                self._wire_by_sid[sid] = wire
+                self._clients[wire] += 1
+                return await handler(sid, environ)
+            return connect
+
+        if event == "disconnect":
+            async def disconnect(sid, *args):
+                try:
+                    return await handler(sid)
+                finally:
+                    if self._wire_by_sid.pop(sid, None) is not None:
+                        self._clients[wire] -= 1
+            return disconnect
+
+        return handler
+
+    def wire_of(self, sid: str) -> str:
+        return self._wire_by_sid.get(sid, WIRE_JSON)
+
+    def is_connected(self, sid: str) -> bool:
+        wire = self._wire_by_sid.get(sid)
+        return wire is not None and self.servers[wire].manager.is_connected(sid, "/")
+
+    async def enter_room(self, sid: str, room: str) -> None:
+        await self.servers[self.wire_of(sid)].enter_room(sid, room)
+
+    async def emit(
+        self,
+        event: str,
+        data: Any = None,
+        room: Optional[str] = None,
+        skip_sid=None,
+        ignore_queue: bool = False,
+        compact: Any = None
+    ) -> None:
+        """Emitir `data` (JSON) o `compact` (msgpack; valor o callable perezoso).
+
+        Sin `compact`, los clientes msgpack reciben `data` tal cual.
+        """
+        wire = self._wire_by_sid.get(room) if room else None
+        if wire is not None:
+            # Un cliente local: solo su servidor
+            await self.servers[wire].emit(
+                event, self._payload(wire, data, compact), room=room, ignore_queue=ignore_queue
+            )
+            return
+
+        for wire, server in self.servers.items():
+            if ignore_queue and not self._clients[wire]:
+                # Emisión local y sin clientes de este formato: ni siquiera se codifica
+                continue
+            await server.emit(
+                event, self._payload(wire, data, compact), room=room, skip_sid=skip_sid, ignore_queue=ignore_queue
+            )
+
+    @staticmethod
+    def _payload(wire: str, data: Any, compact: Any) -> Any:
+        if wire == WIRE_MSGPACK and compact is not None:
+            return compact() if callable(compact) else compact
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._clients)
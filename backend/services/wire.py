@@ -0,0 +1,76 @@
+"""
+Formatos de red de Socket.IO.
+
+- `json` (por defecto): los payloads de siempre, con timestamps ISO-8601.
+- `msgpack` (opcional): servidor Socket.IO aparte con el serializer msgpack
+  de python-socketio (compatible con `socket.io-msgpack-parser` en el
+  cliente). Mensajes y usuarios viajan en forma compacta: claves de una letra
+  y timestamps en epoch ms.
+
+Claves compactas:
+
+    mensaje: i=id, u=user_id, n=user_name, c=content, k=message_type,
+             t=timestamp, r=room_id, s=seq
+    usuario: i=id, n=name, a=is_active, j=joined_at
+
+Los envoltorios de cada evento (`messages`, `changes`, `version`, ...)
+conservan sus nombres en ambos formatos.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models import MessageRecord
+
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+# Versiones del formato compacto que entiende el servidor
+MSGPACK_WIRE_VERSIONS = (1,)
+
+
+def negotiate_msgpack_version(auth: Any) -> Optional[int]:
+    """Versión acordada con un cliente msgpack (`auth.wire_version`); None si no hay una común."""
+    if auth is None:
+        return MSGPACK_WIRE_VERSIONS[-1]
+    if not isinstance(auth, dict):
+        # `auth` lo manda el cliente: cualquier otro tipo se rechaza
+        return None
+    requested = auth.get("wire_version", MSGPACK_WIRE_VERSIONS[-1])
+    if isinstance(requested, list):
+        common = [version for version in requested if version in MSGPACK_WIRE_VERSIONS]
+        return max(common) if common else None
+    return requested if requested in MSGPACK_WIRE_VERSIONS else None
+
+
+def epoch_ms(value: Any) -> Optional[int]:
+    """Timestamp en epoch ms a partir de un datetime o un string ISO-8601."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp() * 1000)
+
+
+def compact_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Usuario (entrada del roster o dict público) en forma compacta."""
+    compact = {"i": user["id"], "n": user.get("name")}
+    if "is_active" in user:
+        compact["a"] = user["is_active"]
+    if "joined_at" in user:
+        compact["j"] = epoch_ms(user["joined_at"])
+    return compact
+
+
+def compact_messages(messages: List[MessageRecord]) -> List[Dict[str, Any]]:
+    return [message.payload_compact for message in messages]
+
+
+def compact_roster_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return {**snapshot, "users": [compact_user(user) for user in snapshot["users"]]}
+
+
+def compact_roster_delta(delta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **delta,
+        "changes": [{"op": change["op"], "user": compact_user(change["user"])} for change in delta["changes"]]
+    }
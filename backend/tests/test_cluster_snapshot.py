@@ -0,0 +1,21 @@
+from models import MessageCreateRequest, UserCreateRequest
+from observers import ChatEventSubject
+from services.chat_service import create_chat_service
+
+
+def test_snapshot_restores_roster_and_recent_history():
+    source = create_chat_service(ChatEventSubject())
+    user = source.create_user(UserCreateRequest(name="Ana"), "sid-1")
+    for i in range(5):
+        source.create_message(user.id, MessageCreateRequest(content=f"m{i}", room_id="general"))
+    target = create_chat_service(ChatEventSubject())
+
+    users, rooms = source.get_cluster_snapshot(messages_per_room=3)
+    target.apply_cluster_snapshot(users, rooms)
+
+    assert [u.id for u in target.get_all_users()] == [user.id]
+    history = target.message_repository.get_messages_by_room("general")
+    assert [m.content for m in history] == ["m2", "m3", "m4"]
+    # Lo anterior al snapshot no está en memoria: hay que resincronizar
+    assert target.message_repository.get_missed_messages("general", history[-1].seq, 10) == []
+    assert target.message_repository.get_missed_messages("general", 0, 10) is None
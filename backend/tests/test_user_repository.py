@@ -0,0 +1,24 @@
+from models import UserRecord
+from repositories import InMemoryUserRepository
+
+
+def test_inactive_replica_of_unknown_user_is_reaped():
+    repository = InMemoryUserRepository()
+
+    repository.apply_replica(UserRecord(id="x", name="Ana", is_active=False))
+
+    assert repository.get_inactive_since("x") is not None
+    assert repository.get_all_users() == []
+    assert repository.reap_inactive_users(0) == ["x"]
+    assert repository.get_user_by_id("x") is None
+
+
+def test_inactive_replica_of_known_user_is_reaped():
+    repository = InMemoryUserRepository()
+    repository.apply_replica(UserRecord(id="x", name="Ana", socket_id="sid-1"))
+
+    repository.apply_replica(UserRecord(id="x", name="Ana", is_active=False))
+
+    assert repository.get_all_users() == []
+    assert repository.get_user_by_socket_id("sid-1") is None
+    assert repository.reap_inactive_users(0) == ["x"]
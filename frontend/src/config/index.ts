@@ -13,16 +13,23 @@ export const SOCKET_EVENTS = {
   // Cliente a servidor
   JOIN_CHAT: 'join_chat',
   SEND_MESSAGE: 'send_message',
+  SEND_MESSAGES: 'send_messages',
   GET_USERS: 'get_users',
+  APP_STATE: 'app_state',
+  RESUME: 'resume',
   
   // Servidor a cliente
   CONNECTED: 'connected',
   JOINED_CHAT: 'joined_chat',
   NEW_MESSAGE: 'new_message',
+  NEW_MESSAGES: 'new_messages',
   USER_JOINED: 'user_joined',
   USER_LEFT: 'user_left',
   USERS_UPDATED: 'users_updated',
   USERS_LIST: 'users_list',
+  ROSTER_SNAPSHOT: 'roster_snapshot',
+  ROSTER_DELTA: 'roster_delta',
   RECENT_MESSAGES: 'recent_messages',
+  RESUMED: 'resumed',
   ERROR: 'error',
 } as const;
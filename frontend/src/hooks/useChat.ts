@@ -1,6 +1,6 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { useSocket } from './useSocket';
-import { User, Message, UseChatReturn } from '@/types';
+import { User, Message, UseChatReturn, RosterSnapshot, RosterDelta, LastSeqByRoom, ResumedPayload, NewMessagesPayload, SocketError } from '@/types';
 import { SOCKET_EVENTS } from '@/config';
 import toast from 'react-hot-toast';
 
@@ -11,6 +11,26 @@ export const useChat = (): UseChatReturn => {
   const [users, setUsers] = useState<User[]>([]);
   const [messages, setMessages] = useState<Message[]>([]);
   const [currentRoom] = useState<string>('general');
+  // Versión del roster recibida del servidor (null hasta el primer snapshot)
+  const rosterVersionRef = useRef<number | null>(null);
+  // Última secuencia vista por sala y nombre con el que se unió (para reconectar)
+  const lastSeqRef = useRef<LastSeqByRoom>({});
+  const joinedNameRef = useRef<string | null>(null);
+
+  const trackSeq = useCallback((received: Message[]) => {
+    for (const message of received) {
+      if (message.seq !== undefined && message.seq > (lastSeqRef.current[message.room_id] ?? 0)) {
+        lastSeqRef.current[message.room_id] = message.seq;
+      }
+    }
+  }, []);
+
+  // Al reconectar, volver a unirse pidiendo solo los mensajes perdidos
+  useEffect(() => {
+    if (isConnected && joinedNameRef.current) {
+      socketJoinChat(joinedNameRef.current, { [currentRoom]: 0, ...lastSeqRef.current });
+    }
+  }, [isConnected, socketJoinChat, currentRoom]);
 
   // Configurar listeners de socket
   useEffect(() => {
@@ -26,7 +46,9 @@ export const useChat = (): UseChatReturn => {
     // Evento: Nuevo mensaje recibido
     const handleNewMessage = (message: Message) => {
       console.log('New message:', message);
-      setMessages(prev => [...prev, message]);
+      trackSeq([message]);
+      // Puede llegar también en la respuesta de `resumed` tras reconectar
+      setMessages(prev => prev.some(existing => existing.id === message.id) ? prev : [...prev, message]);
       
       // Mostrar notificación si no es del usuario actual
       if (currentUser && message.user_id !== currentUser.id) {
@@ -36,20 +58,25 @@ export const useChat = (): UseChatReturn => {
       }
     };
 
-    // Evento: Usuario se unió
-    const handleUserJoined = (data: { user: User; users_count: number }) => {
-      console.log('User joined:', data);
-      if (currentUser && data.user.id !== currentUser.id) {
-        toast.success(`${data.user.name} se unió al chat`);
+    // Evento: Lote de mensajes de una sala en una sola emisión
+    const handleNewMessages = (data: NewMessagesPayload) => {
+      trackSeq(data.messages);
+      setMessages(prev => {
+        const known = new Set(prev.map(existing => existing.id));
+        const fresh = data.messages.filter(message => !known.has(message.id));
+        return fresh.length ? [...prev, ...fresh] : prev;
+      });
+
+      const others = data.messages.filter(message => !currentUser || message.user_id !== currentUser.id);
+      if (others.length) {
+        const last = others[others.length - 1];
+        const preview = `${last.content.substring(0, 50)}${last.content.length > 50 ? '...' : ''}`;
+        toast(others.length > 1 ? `${others.length} mensajes nuevos · ${last.user_name}: ${preview}` : `${last.user_name}: ${preview}`, {
+          icon: '💬',
+        });
       }
     };
 
-    // Evento: Usuario salió
-    const handleUserLeft = (data: { user: User; users_count: number }) => {
-      console.log('User left:', data);
-      toast(`${data.user.name} salió del chat`, { icon: '👋' });
-    };
-
     // Evento: Lista de usuarios actualizada
     const handleUsersUpdated = (data: { users: User[]; count: number }) => {
       console.log('Users updated:', data);
@@ -62,40 +89,116 @@ export const useChat = (): UseChatReturn => {
       setUsers(data.users);
     };
 
+    // Evento: Roster completo (al unirse o tras un hueco de versión)
+    const handleRosterSnapshot = (data: RosterSnapshot) => {
+      rosterVersionRef.current = data.version;
+      setUsers(data.users);
+    };
+
+    // Avisos de entradas y salidas; en una ola de reconexiones se resumen
+    const notifyRosterChanges = (data: RosterDelta) => {
+      const joined = data.changes.filter(change => change.op === 'add' && change.user.id !== currentUser?.id);
+      const left = data.changes.filter(change => change.op === 'remove');
+
+      if (joined.length + left.length > 3) {
+        toast(`${joined.length} se unieron, ${left.length} salieron del chat`, { icon: '👥' });
+        return;
+      }
+      joined.forEach(change => toast.success(`${change.user.name} se unió al chat`));
+      left.forEach(change => toast(`${change.user.name} salió del chat`, { icon: '👋' }));
+    };
+
+    // Evento: Cambios incrementales del roster
+    const handleRosterDelta = (data: RosterDelta) => {
+      const version = rosterVersionRef.current;
+      if (version === null || data.version <= version) return;
+      if (data.base_version !== version) {
+        // Se perdió algún delta: pedir el roster completo
+        rosterVersionRef.current = null;
+        getUsers();
+        return;
+      }
+
+      rosterVersionRef.current = data.version;
+      notifyRosterChanges(data);
+      setUsers(prev => {
+        // Aplicación idempotente: agregar un usuario existente lo actualiza
+        const byId = new Map(prev.map(user => [user.id, user]));
+        for (const change of data.changes) {
+          if (change.op === 'remove') {
+            byId.delete(change.user.id);
+          } else {
+            byId.set(change.user.id, { ...byId.get(change.user.id), ...change.user } as User);
+          }
+        }
+        return Array.from(byId.values());
+      });
+    };
+
     // Evento: Mensajes recientes
     const handleRecentMessages = (data: { messages: Message[] }) => {
       console.log('Recent messages:', data);
+      trackSeq(data.messages);
       setMessages(data.messages);
     };
 
+    // Evento: Mensajes perdidos durante la desconexión
+    const handleResumed = (data: ResumedPayload) => {
+      setMessages(prev => {
+        let next = prev;
+        for (const [roomId, room] of Object.entries(data.rooms)) {
+          if (room.status === 'resync') {
+            // El rango ya no está en el servidor: reemplazar el historial de la sala
+            next = next.filter(message => message.room_id !== roomId).concat(room.messages);
+          } else {
+            const known = new Set(next.map(message => message.id));
+            next = next.concat(room.messages.filter(message => !known.has(message.id)));
+          }
+        }
+        return next;
+      });
+      for (const [roomId, room] of Object.entries(data.rooms)) {
+        lastSeqRef.current[roomId] = room.last_seq;
+      }
+    };
+
     // Evento: Error
-    const handleError = (data: { message: string }) => {
+    const handleError = (data: SocketError) => {
       console.error('Socket error:', data);
+      if (data.code === 'overloaded' && data.event === 'get_users') {
+        // El servidor está saturado: pedir el roster de nuevo más tarde, sin avisar
+        setTimeout(getUsers, data.retry_after_ms ?? 1000);
+        return;
+      }
       toast.error(data.message);
     };
 
     // Registrar listeners
     socket.on(SOCKET_EVENTS.JOINED_CHAT, handleJoinedChat);
     socket.on(SOCKET_EVENTS.NEW_MESSAGE, handleNewMessage);
-    socket.on(SOCKET_EVENTS.USER_JOINED, handleUserJoined);
-    socket.on(SOCKET_EVENTS.USER_LEFT, handleUserLeft);
+    socket.on(SOCKET_EVENTS.NEW_MESSAGES, handleNewMessages);
     socket.on(SOCKET_EVENTS.USERS_UPDATED, handleUsersUpdated);
     socket.on(SOCKET_EVENTS.USERS_LIST, handleUsersList);
+    socket.on(SOCKET_EVENTS.ROSTER_SNAPSHOT, handleRosterSnapshot);
+    socket.on(SOCKET_EVENTS.ROSTER_DELTA, handleRosterDelta);
     socket.on(SOCKET_EVENTS.RECENT_MESSAGES, handleRecentMessages);
+    socket.on(SOCKET_EVENTS.RESUMED, handleResumed);
     socket.on(SOCKET_EVENTS.ERROR, handleError);
 
     // Limpiar listeners
     return () => {
       socket.off(SOCKET_EVENTS.JOINED_CHAT, handleJoinedChat);
       socket.off(SOCKET_EVENTS.NEW_MESSAGE, handleNewMessage);
-      socket.off(SOCKET_EVENTS.USER_JOINED, handleUserJoined);
-      socket.off(SOCKET_EVENTS.USER_LEFT, handleUserLeft);
+      socket.off(SOCKET_EVENTS.NEW_MESSAGES, handleNewMessages);
       socket.off(SOCKET_EVENTS.USERS_UPDATED, handleUsersUpdated);
       socket.off(SOCKET_EVENTS.USERS_LIST, handleUsersList);
+      socket.off(SOCKET_EVENTS.ROSTER_SNAPSHOT, handleRosterSnapshot);
+      socket.off(SOCKET_EVENTS.ROSTER_DELTA, handleRosterDelta);
       socket.off(SOCKET_EVENTS.RECENT_MESSAGES, handleRecentMessages);
+      socket.off(SOCKET_EVENTS.RESUMED, handleResumed);
       socket.off(SOCKET_EVENTS.ERROR, handleError);
     };
-  }, [socket, currentUser]);
+  }, [socket, currentUser, getUsers, trackSeq]);
 
   const joinChat = useCallback((name: string) => {
     if (!name.trim()) {
@@ -103,6 +206,7 @@ export const useChat = (): UseChatReturn => {
       return;
     }
     
+    joinedNameRef.current = name.trim();
     socketJoinChat(name.trim());
   }, [socketJoinChat]);
 
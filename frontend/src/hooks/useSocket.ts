@@ -1,7 +1,7 @@
 import { useEffect, useRef, useState, useCallback } from 'react';
 import { io, Socket } from 'socket.io-client';
 import { config, SOCKET_EVENTS } from '@/config';
-import { UseSocketReturn } from '@/types';
+import { LastSeqByRoom, UseSocketReturn } from '@/types';
 import toast from 'react-hot-toast';
 
 export const useSocket = (): UseSocketReturn => {
@@ -35,15 +35,25 @@ export const useSocket = (): UseSocketReturn => {
       toast.error('Error de conexión');
     });
 
+    // Avisar al servidor si la pestaña pasa a segundo plano (recibe push en lugar de sockets)
+    const handleVisibilityChange = () => {
+      socket.emit(SOCKET_EVENTS.APP_STATE, {
+        state: document.visibilityState === 'hidden' ? 'background' : 'foreground',
+      });
+    };
+    document.addEventListener('visibilitychange', handleVisibilityChange);
+
     // Limpiar al desmontar
     return () => {
+      document.removeEventListener('visibilitychange', handleVisibilityChange);
       socket.disconnect();
     };
   }, []);
 
-  const joinChat = useCallback((name: string) => {
+  const joinChat = useCallback((name: string, lastSeq?: LastSeqByRoom) => {
     if (socketRef.current && isConnected) {
-      socketRef.current.emit(SOCKET_EVENTS.JOIN_CHAT, { name });
+      // Con `last_seq` el servidor responde `resumed` con solo los mensajes perdidos
+      socketRef.current.emit(SOCKET_EVENTS.JOIN_CHAT, lastSeq ? { name, last_seq: lastSeq } : { name });
     }
   }, [isConnected]);
 
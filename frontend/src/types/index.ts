@@ -6,6 +6,25 @@ export interface User {
   joined_at: string;
 }
 
+// Roster versionado: snapshot completo y cambios incrementales
+export interface RosterSnapshot {
+  version: number;
+  users: User[];
+  count: number;
+}
+
+export interface RosterChange {
+  op: 'add' | 'remove' | 'update';
+  user: Partial<User> & { id: string };
+}
+
+export interface RosterDelta {
+  base_version: number;
+  version: number;
+  changes: RosterChange[];
+  count: number;
+}
+
 // Tipos para mensajes
 export enum MessageType {
   TEXT = "text",
@@ -21,6 +40,35 @@ export interface Message {
   message_type: MessageType;
   timestamp: string;
   room_id: string;
+  seq?: number;
+}
+
+// Última secuencia vista por sala (para recuperar mensajes al reconectar)
+export type LastSeqByRoom = Record<string, number>;
+
+export interface ResumedRoom {
+  status: 'ok' | 'resync';
+  messages: Message[];
+  last_seq: number;
+}
+
+export interface ResumedPayload {
+  rooms: Record<string, ResumedRoom>;
+}
+
+// Error del servidor; `overloaded` (pedido descartado por carga) y
+// `rate_limited` indican cuándo reintentar
+export interface SocketError {
+  message: string;
+  code?: 'overloaded' | 'rate_limited';
+  event?: string;
+  retry_after_ms?: number;
+}
+
+// Lote de mensajes de una sala (`send_messages` / `new_messages`)
+export interface NewMessagesPayload {
+  room_id: string;
+  messages: Message[];
 }
 
 // Tipos para salas de chat
@@ -36,20 +84,26 @@ export interface ChatRoom {
 // Tipos para eventos de Socket.IO
 export interface SocketEvents {
   // Eventos del cliente al servidor
-  join_chat: (data: { name: string }) => void;
+  join_chat: (data: { name: string; last_seq?: LastSeqByRoom }) => void;
   send_message: (data: { content: string; room_id?: string }) => void;
+  send_messages: (data: { messages: { content: string; room_id?: string }[] }) => void;
   get_users: () => void;
+  resume: (data: { last_seq: LastSeqByRoom }) => void;
   
   // Eventos del servidor al cliente
   connected: (data: { message: string }) => void;
   joined_chat: (data: { user: User; message: string }) => void;
   new_message: (message: Message) => void;
+  new_messages: (data: NewMessagesPayload) => void;
   user_joined: (data: { user: User; users_count: number }) => void;
   user_left: (data: { user: User; users_count: number }) => void;
   users_updated: (data: { users: User[]; count: number }) => void;
   users_list: (data: { users: User[] }) => void;
+  roster_snapshot: (data: RosterSnapshot) => void;
+  roster_delta: (data: RosterDelta) => void;
   recent_messages: (data: { messages: Message[] }) => void;
-  error: (data: { message: string }) => void;
+  resumed: (data: ResumedPayload) => void;
+  error: (data: SocketError) => void;
 }
 
 // Estados de la aplicación
@@ -96,7 +150,7 @@ export interface JoinChatFormProps {
 export interface UseSocketReturn {
   socket: import('socket.io-client').Socket | null;
   isConnected: boolean;
-  joinChat: (name: string) => void;
+  joinChat: (name: string, lastSeq?: LastSeqByRoom) => void;
   sendMessage: (content: string, roomId?: string) => void;
   getUsers: () => void;
 }